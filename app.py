@@ -1,25 +1,169 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, Response, g, render_template, request, jsonify, redirect, url_for, flash
+import cProfile
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
 import os
+import tempfile
+import time
 from database import (
-    init_db, inserir_nota_entrada, listar_notas_entrada, inserir_nota_saida, obter_estatisticas,
-    inserir_container, listar_containers, obter_container, obter_container_por_numero,
-    registrar_desova, registrar_saida, obter_historico_container, obter_estatisticas_containers
+    init_db, buscar, obter_analytics, obter_resumo_produtos, exportar_tabela, EXPORTACOES, inserir_notas_entrada_lote, obter_notas_por_hash, paginar_notas_entrada, registrar_saida_cte, obter_estatisticas,
+    inserir_container, paginar_containers, listar_armadores, obter_container, container_cadastrado, carregar_patio, obter_registro_container,
+    registrar_desova, registrar_saida, obter_historico_container, obter_estatisticas_containers,
+    obter_ultimo_movimento_id, listar_movimentacoes_desde, enfileirar_job, obter_job, contar_jobs_pendentes_antes,
+    obter_versao_schema, fechar_db, MIGRACOES
 )
-from xml_parser import extrair_dados_nfe
+import eventos
+from ingestao import iniciar_workers_thread, workers_thread_ativos
+import metricas
+import patio
+from xml_parser import calcular_hash_xml, extrair_dados_nfe_lote, iniciar_pool, listar_xmls_zip, ZIP_MAX_ARQUIVOS, ZIP_MAX_DESCOMPACTADO
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SESSION_SECRET', 'dev-secret-key-change-in-production')
-app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['UPLOAD_FOLDER'] = os.path.abspath(os.environ.get('UPLOAD_FOLDER', 'uploads'))
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['PARSE_WORKERS'] = int(os.environ.get('PARSE_WORKERS', 0)) or None
+app.config['PARSE_CHUNKSIZE'] = int(os.environ.get('PARSE_CHUNKSIZE', 16))
+app.config['PARSE_LOTE_MINIMO'] = int(os.environ.get('PARSE_LOTE_MINIMO', 32))
+app.config['ZIP_MAX_ARQUIVOS'] = ZIP_MAX_ARQUIVOS
+app.config['ZIP_MAX_DESCOMPACTADO'] = ZIP_MAX_DESCOMPACTADO
+app.config['PAGINA_PADRAO'] = 100
+app.config['PAGINA_MAXIMA'] = 1000
+app.config['INGESTAO_WORKERS'] = int(os.environ.get('INGESTAO_WORKERS', 1))
+app.config['PERFIL_REQUISICOES'] = os.environ.get('PERFIL_REQUISICOES') == '1'
+app.config['PERFIL_HEADER'] = os.environ.get('PERFIL_HEADER') == '1'
+app.config['PERFIL_DIRETORIO'] = os.environ.get('PERFIL_DIRETORIO', 'perfis')
+app.config['EVENTOS_LIMITE_REPLAY'] = int(os.environ.get('EVENTOS_LIMITE_REPLAY', 500))
+app.config['PATIO_RECONCILIACAO'] = float(os.environ.get('PATIO_RECONCILIACAO', 60))
+app.config['INICIAR_SERVICOS'] = os.environ.get('INICIAR_SERVICOS', '1') == '1'
 
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+servidor = {'servicos': False, 'aquecido': False}
 
-init_db()
+def iniciar_banco():
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    init_db()
+    carregar_patio()
+
+def iniciar_servicos():
+    # threads não sobrevivem ao fork: sob gunicorn são iniciadas por worker em post_worker_init
+    if servidor['servicos']:
+        return
+    servidor['servicos'] = True
+    
+    if app.config['INGESTAO_WORKERS']:
+        iniciar_workers_thread(app.config['INGESTAO_WORKERS'])
+    
+    if app.config['PARSE_WORKERS'] != 1:
+        iniciar_pool(app.config['PARSE_WORKERS'])
+    
+    if app.config['PATIO_RECONCILIACAO']:
+        patio.iniciar_reconciliacao(carregar_patio, app.config['PATIO_RECONCILIACAO'])
+
+def aquecer():
+    inicio = time.perf_counter()
+    for nome in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(nome)
+    
+    # Aquece os caches do processo e o cache de páginas do sistema operacional. As conexões
+    # SQLite são por thread: cada thread de requisição abre a sua no primeiro uso, então a
+    # conexão desta thread é fechada em vez de ficar ociosa.
+    obter_estatisticas()
+    obter_estatisticas_containers()
+    obter_resumo_produtos()
+    listar_armadores()
+    obter_ultimo_movimento_id()
+    fechar_db()
+    
+    servidor['aquecido'] = True
+    return time.perf_counter() - inicio
+
+# processos do pool de parsing (forkserver/spawn) reimportam o módulo principal: não iniciam nada
+if multiprocessing.current_process().name == 'MainProcess':
+    iniciar_banco()
+    
+    if app.config['INICIAR_SERVICOS']:
+        iniciar_servicos()
+        aquecer()
+
+@app.before_request
+def iniciar_medicao():
+    metricas.iniciar_requisicao()
+    
+    if app.config['PERFIL_REQUISICOES'] or (app.config['PERFIL_HEADER'] and request.headers.get('X-Perfil') == '1'):
+        g.perfil = cProfile.Profile()
+        try:
+            g.perfil.enable()
+        except ValueError:
+            g.perfil = None
+
+@app.after_request
+def finalizar_medicao(response):
+    perfil = g.pop('perfil', None)
+    if perfil is not None:
+        perfil.disable()
+        os.makedirs(app.config['PERFIL_DIRETORIO'], exist_ok=True)
+        nome = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'desconhecido'}-{os.getpid()}-{time.perf_counter_ns()}.prof"
+        perfil.dump_stats(os.path.join(app.config['PERFIL_DIRETORIO'], nome))
+        response.headers['X-Perfil'] = nome
+    
+    medicao = metricas.finalizar_requisicao(request.endpoint or 'desconhecido', request.method, response.status_code)
+    if medicao:
+        duracao, tempo_sql, consultas = medicao
+        response.headers['Server-Timing'] = f'app;dur={duracao * 1000:.1f}, sql;dur={tempo_sql * 1000:.1f};desc="{consultas} consultas"'
+    return response
+
+def obter_limite_pagina():
+    limite = request.args.get('limite', app.config['PAGINA_PADRAO'], type=int)
+    return max(1, min(limite, app.config['PAGINA_MAXIMA']))
+
+def obter_filtros_notas():
+    cnpj = ''.join(c for c in request.args.get('cnpj', '') if c.isdigit())
+    return {
+        'data_inicio': request.args.get('data_inicio') or None,
+        'data_fim': request.args.get('data_fim') or None,
+        'produto': request.args.get('produto', '').strip() or None,
+        'cnpj': cnpj or None,
+        'com_saldo': request.args.get('com_saldo') in ('1', 'true', 'on'),
+        'incluir_arquivo': request.args.get('arquivo') in ('1', 'true', 'on')
+    }
+
+def obter_filtros_containers():
+    return {
+        'status': request.args.get('status') or None,
+        'armador': request.args.get('armador') or None,
+        'tipo': request.args.get('tipo') or None,
+        'data_inicio': request.args.get('data_inicio') or None,
+        'data_fim': request.args.get('data_fim') or None,
+        'incluir_arquivo': request.args.get('arquivo') in ('1', 'true', 'on')
+    }
+
+@app.template_global()
+def url_pagina(endpoint, cursor=None):
+    argumentos = request.args.to_dict()
+    argumentos.pop('cursor', None)
+    if cursor:
+        argumentos['cursor'] = cursor
+    return url_for(endpoint, **argumentos)
+
+def url_proxima_pagina(endpoint, proximo_cursor):
+    return url_pagina(endpoint, proximo_cursor) if proximo_cursor else None
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def salvar_upload(xml_bytes, hash_conteudo):
+    caminho = os.path.join(app.config['UPLOAD_FOLDER'], f'{hash_conteudo}.xml')
+    if not os.path.exists(caminho):
+        descritor, temporario = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'], suffix='.tmp')
+        with os.fdopen(descritor, 'wb') as arquivo:
+            arquivo.write(xml_bytes)
+        os.replace(temporario, caminho)
+    return caminho
+
 @app.route('/upload', methods=['GET', 'POST'])
 def upload():
     if request.method == 'POST':
@@ -34,41 +178,171 @@ def upload():
         if not file.filename.lower().endswith('.xml'):
             return jsonify({'success': False, 'message': 'Apenas arquivos XML são permitidos'}), 400
         
-        try:
-            xml_bytes = file.read()
-            
-            dados = extrair_dados_nfe(xml_bytes)
-            
-            inserir_nota_entrada(
-                dados['numero_nota'],
-                dados['data_emissao'],
-                dados['produto'],
-                dados['peso'],
-                dados['valor'],
-                dados['cnpj_emitente'],
-                dados['cnpj_destinatario']
-            )
-            
-            return jsonify({
-                'success': True, 
-                'message': f'Nota fiscal {dados["numero_nota"]} carregada com sucesso!',
-                'dados': dados
-            })
+        xml_bytes = file.read()
+        hash_conteudo = calcular_hash_xml(xml_bytes)
         
+        try:
+            caminho = salvar_upload(xml_bytes, hash_conteudo)
+            job_id = enfileirar_job(caminho, file.filename, hash_conteudo)
         except Exception as e:
-            return jsonify({'success': False, 'message': str(e)}), 400
+            return jsonify({'success': False, 'message': f'Erro ao registrar arquivo: {str(e)}'}), 500
+        
+        return jsonify({
+            'success': True,
+            'message': 'Arquivo recebido, processamento em andamento',
+            'job_id': job_id,
+            'status': 'pendente',
+            'status_url': url_for('api_job', job_id=job_id)
+        }), 202
     
     return render_template('upload.html')
 
+@app.route('/api/jobs/<int:job_id>')
+def api_job(job_id):
+    job = obter_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Job não encontrado'}), 404
+    
+    resposta = {
+        'id': job['id'],
+        'arquivo': job['nome_original'],
+        'status': job['status'],
+        'mensagem': job['mensagem'],
+        'numero_nota': job['numero_nota'],
+        'tentativas': job['tentativas'],
+        'criado_em': job['criado_em'],
+        'iniciado_em': job['iniciado_em'],
+        'concluido_em': job['concluido_em'],
+        'dados': json.loads(job['resultado']) if job['resultado'] else None
+    }
+    if job['status'] == 'pendente':
+        resposta['posicao_fila'] = contar_jobs_pendentes_antes(job_id) + 1
+    return jsonify(resposta)
+
+@app.route('/upload/lote', methods=['POST'])
+def upload_lote():
+    arquivos_enviados = [f for f in request.files.getlist('xml_files') if f.filename]
+    
+    if not arquivos_enviados:
+        return jsonify({'success': False, 'message': 'Nenhum arquivo enviado'}), 400
+    
+    inicio = time.perf_counter()
+    
+    arquivos = []
+    # os limites valem para o envio inteiro, não para cada ZIP
+    restante_arquivos = app.config['ZIP_MAX_ARQUIVOS']
+    restante_bytes = app.config['ZIP_MAX_DESCOMPACTADO']
+    for file in arquivos_enviados:
+        nome = file.filename
+        if nome.lower().endswith('.zip'):
+            try:
+                membros = listar_xmls_zip(file.read(), app.config['MAX_CONTENT_LENGTH'], restante_arquivos, restante_bytes)
+            except ValueError as e:
+                arquivos.append((nome, None, str(e)))
+                continue
+            
+            for nome_membro, conteudo, erro in membros:
+                arquivos.append((f'{nome}/{nome_membro}', conteudo, erro))
+                if conteudo is not None:
+                    restante_arquivos -= 1
+                    restante_bytes -= len(conteudo)
+        elif nome.lower().endswith('.xml'):
+            arquivos.append((nome, file.read(), None))
+        else:
+            arquivos.append((nome, None, 'Apenas arquivos XML ou ZIP são permitidos'))
+    
+    hashes = {indice: calcular_hash_xml(xml_bytes) for indice, (_, xml_bytes, erro) in enumerate(arquivos) if not erro}
+    ja_importadas = obter_notas_por_hash(hashes.values())
+    
+    ignorados = {}
+    vistos = {}
+    validos = []
+    for indice, hash_conteudo in hashes.items():
+        if hash_conteudo in ja_importadas:
+            ignorados[indice] = f'Arquivo já importado (nota fiscal {ja_importadas[hash_conteudo]})'
+        elif hash_conteudo in vistos:
+            ignorados[indice] = f'Arquivo repetido no envio ({arquivos[vistos[hash_conteudo]][0]})'
+        else:
+            vistos[hash_conteudo] = indice
+            validos.append(arquivos[indice][1])
+    
+    workers = app.config['PARSE_WORKERS'] if len(validos) >= app.config['PARSE_LOTE_MINIMO'] else 1
+    resultados = iter(extrair_dados_nfe_lote(validos, workers, app.config['PARSE_CHUNKSIZE']))
+    
+    notas = []
+    relatorio = []
+    for indice, (nome, xml_bytes, erro) in enumerate(arquivos):
+        if erro:
+            relatorio.append({'arquivo': nome, 'success': False, 'message': erro})
+            continue
+        
+        if indice in ignorados:
+            relatorio.append({'arquivo': nome, 'success': False, 'ignorado': True, 'message': ignorados[indice]})
+            continue
+        
+        dados, erro = next(resultados)
+        if erro:
+            relatorio.append({'arquivo': nome, 'success': False, 'message': erro})
+        else:
+            dados['hash_conteudo'] = hashes[indice]
+            notas.append(dados)
+            relatorio.append({'arquivo': nome, 'success': True, 'numero_nota': dados['numero_nota']})
+    
+    try:
+        duplicadas = inserir_notas_entrada_lote(notas)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Erro ao gravar lote: {str(e)}', 'arquivos': relatorio}), 400
+    
+    itens_ok = [r for r in relatorio if r['success']]
+    for posicao in duplicadas:
+        item = itens_ok[posicao]
+        item['success'] = False
+        item['ignorado'] = True
+        item['message'] = f'Nota fiscal {item["numero_nota"]} já está cadastrada'
+    importadas = len(notas) - len(duplicadas)
+    
+    duracao = time.perf_counter() - inicio
+    ignoradas = sum(1 for r in relatorio if r.get('ignorado'))
+    erros = len(relatorio) - importadas - ignoradas
+    
+    return jsonify({
+        'success': importadas > 0 or not erros,
+        'message': f'{importadas} nota(s) carregada(s), {ignoradas} já importada(s), {erros} arquivo(s) com erro',
+        'importadas': importadas,
+        'ignoradas': ignoradas,
+        'erros': erros,
+        'duracao_segundos': round(duracao, 3),
+        'notas_por_segundo': round(importadas / duracao, 1) if duracao > 0 else None,
+        'arquivos': relatorio
+    }), 200 if importadas > 0 or not erros else 400
+
 @app.route('/acompanhamento')
 def acompanhamento():
-    notas = listar_notas_entrada()
-    return render_template('acompanhamento.html', notas=notas)
+    filtros = obter_filtros_notas()
+    try:
+        notas, proximo_cursor = paginar_notas_entrada(obter_limite_pagina(), request.args.get('cursor'), **filtros)
+    except ValueError:
+        return redirect(url_for('acompanhamento'))
+    
+    return render_template(
+        'acompanhamento.html',
+        notas=notas,
+        filtros=filtros,
+        proxima_pagina=url_proxima_pagina('acompanhamento', proximo_cursor)
+    )
 
 @app.route('/api/notas')
 def api_notas():
-    notas = listar_notas_entrada()
-    return jsonify([dict(nota) for nota in notas])
+    try:
+        notas, proximo_cursor = paginar_notas_entrada(obter_limite_pagina(), request.args.get('cursor'), **obter_filtros_notas())
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    resposta = jsonify([dict(nota) for nota in notas])
+    if proximo_cursor:
+        resposta.headers['X-Proximo-Cursor'] = proximo_cursor
+        resposta.headers['Link'] = f'<{url_proxima_pagina("api_notas", proximo_cursor)}>; rel="next"'
+    return resposta
 
 @app.route('/saida', methods=['GET', 'POST'])
 def saida():
@@ -83,14 +357,14 @@ def saida():
             if not numero_cte or not notas_selecionadas or not data_saida:
                 return jsonify({'success': False, 'message': 'Dados incompletos'}), 400
             
-            for nota in notas_selecionadas:
-                inserir_nota_saida(
-                    numero_cte,
-                    nota['numero_nota'],
-                    nota['peso_saida'],
-                    nota['valor_frete'],
-                    data_saida
-                )
+            registrar_saida_cte(numero_cte, [
+                {
+                    'numero_nota': str(nota['numero_nota']),
+                    'peso_saida': float(nota['peso_saida']),
+                    'valor_frete': float(nota.get('valor_frete') or 0)
+                }
+                for nota in notas_selecionadas
+            ], data_saida)
             
             return jsonify({
                 'success': True, 
@@ -100,8 +374,20 @@ def saida():
         except Exception as e:
             return jsonify({'success': False, 'message': str(e)}), 400
     
-    notas = listar_notas_entrada()
-    return render_template('saida.html', notas=notas)
+    filtros = obter_filtros_notas()
+    filtros['com_saldo'] = True
+    filtros['incluir_arquivo'] = False
+    try:
+        notas, proximo_cursor = paginar_notas_entrada(obter_limite_pagina(), request.args.get('cursor'), **filtros)
+    except ValueError:
+        return redirect(url_for('saida'))
+    
+    return render_template(
+        'saida.html',
+        notas=notas,
+        filtros=filtros,
+        proxima_pagina=url_proxima_pagina('saida', proximo_cursor)
+    )
 
 @app.route('/dashboard')
 def dashboard():
@@ -109,15 +395,230 @@ def dashboard():
     stats_containers = obter_estatisticas_containers()
     return render_template('dashboard.html', stats_notas=stats_notas, stats_containers=stats_containers)
 
+@app.route('/api/eventos')
+def api_eventos():
+    tipos = [tipo for tipo in request.args.get('tipos', '').split(',') if tipo] or list(eventos.TIPOS)
+    if any(tipo not in eventos.TIPOS for tipo in tipos):
+        return jsonify({'success': False, 'message': f'Tipos de evento válidos: {", ".join(eventos.TIPOS)}'}), 400
+    
+    ultimo_id = request.headers.get('Last-Event-ID', type=int)
+    if ultimo_id is None:
+        ultimo_id = request.args.get('ultimo_id', type=int)
+    
+    # assina antes de ler o histórico para não perder movimentações gravadas no intervalo
+    fila = eventos.assinar(tipos)
+    if fila is None:
+        resposta = jsonify({'success': False, 'message': 'Limite de conexões de eventos atingido'})
+        resposta.status_code = 503
+        resposta.headers['Retry-After'] = '30'
+        return resposta
+    
+    iniciais = []
+    try:
+        if ultimo_id is not None and 'container' in tipos:
+            limite = app.config['EVENTOS_LIMITE_REPLAY']
+            movimentacoes = listar_movimentacoes_desde(ultimo_id, limite + 1)
+            if len(movimentacoes) > limite:
+                iniciais.append(eventos.formatar_evento('recarregar', {'pendentes': len(movimentacoes)}))
+            for movimento_id, dados in movimentacoes[:limite]:
+                iniciais.append(eventos.formatar_evento('container', dados, movimento_id))
+                ultimo_id = movimento_id
+        if 'estatisticas' in tipos:
+            iniciais.append(eventos.formatar_evento('estatisticas', {
+                'notas': obter_estatisticas(),
+                'containers': obter_estatisticas_containers()
+            }))
+    except Exception:
+        eventos.cancelar(fila)
+        raise
+    
+    resposta = Response(eventos.transmitir(fila, iniciais, ultimo_id), mimetype='text/event-stream')
+    resposta.headers['Cache-Control'] = 'no-cache'
+    resposta.headers['X-Accel-Buffering'] = 'no'
+    resposta.call_on_close(lambda: eventos.cancelar(fila))
+    return resposta
+
 @app.route('/api/estatisticas')
 def api_estatisticas():
     stats = obter_estatisticas()
-    return jsonify(stats)
+    
+    resposta = jsonify(stats)
+    resposta.set_etag(hashlib.sha1(json.dumps(stats, sort_keys=True).encode()).hexdigest())
+    resposta.cache_control.no_cache = True
+    return resposta.make_conditional(request)
+
+@app.route('/api/analytics')
+def api_analytics():
+    periodo = request.args.get('periodo', 'mes')
+    agrupar = request.args.get('agrupar', 'produto')
+    data_inicio = request.args.get('data_inicio') or None
+    data_fim = request.args.get('data_fim') or None
+    
+    try:
+        entrada = obter_analytics('entrada', periodo, agrupar, data_inicio, data_fim)
+        saida = obter_analytics('saida', periodo, agrupar, data_inicio, data_fim)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({
+        'periodo': periodo,
+        'agrupar': agrupar,
+        'entrada': [
+            {'periodo': r['periodo'], agrupar: r['chave'], 'peso': r['peso'], 'valor': r['valor'], 'notas': r['quantidade']}
+            for r in entrada
+        ],
+        'saida': [
+            {'periodo': r['periodo'], agrupar: r['chave'], 'peso': r['peso'], 'frete': r['valor'], 'notas': r['quantidade']}
+            for r in saida
+        ]
+    })
+
+@app.route('/api/search')
+def api_search():
+    q = request.args.get('q', '').strip()
+    limite = max(1, min(request.args.get('limite', 20, type=int) or 20, 100))
+    tipos = [t for t in request.args.get('tipo', '').split(',') if t] or None
+    
+    if len(q) < 2:
+        return jsonify({'success': False, 'message': 'Informe ao menos 2 caracteres para a busca'}), 400
+    
+    if request.args.get('arquivo') in ('1', 'true', 'on'):
+        return jsonify({'success': False, 'message': 'A busca não cobre registros arquivados; use as listagens com arquivo=1'}), 400
+    
+    try:
+        resultados = buscar(q, limite, tipos)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    for resultado in resultados:
+        resultado['url'] = url_for('container_detalhe', container_id=resultado['id']) if resultado['tipo'] in ('container', 'movimentacao') else None
+    
+    return jsonify({'q': q, 'inclui_arquivo': False, 'resultados': resultados})
+
+@app.route('/metrics')
+def metrics():
+    return Response(metricas.exportar_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz')
+def healthz():
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+@app.route('/readyz')
+def readyz():
+    verificacoes = {'patio': patio.carregado(), 'aquecido': servidor['aquecido'], 'servicos': servidor['servicos']}
+    if app.config['INGESTAO_WORKERS']:
+        verificacoes['ingestao'] = servidor['servicos'] and workers_thread_ativos()
+    try:
+        verificacoes['banco'] = obter_versao_schema() >= MIGRACOES[-1][0]
+    except Exception as e:
+        verificacoes['banco'] = False
+        verificacoes['erro'] = str(e)
+    
+    pronto = all(valor is True for chave, valor in verificacoes.items() if chave != 'erro')
+    return jsonify({'pronto': pronto, 'verificacoes': verificacoes}), 200 if pronto else 503
+
+@app.route('/api/produtos')
+def api_produtos():
+    try:
+        resumo = obter_resumo_produtos(
+            request.args.get('produto') or None,
+            request.args.get('data_inicio') or None,
+            request.args.get('data_fim') or None,
+            request.args.get('periodo') or None,
+            request.args.get('arquivo') in ('1', 'true', 'on')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify([dict(linha) for linha in resumo])
+
+def gerar_csv(linhas):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    yield '\ufeff'
+    for quantidade, linha in enumerate(linhas, 1):
+        writer.writerow(linha)
+        if quantidade % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def gerar_ndjson(linhas):
+    colunas = next(linhas)
+    for linha in linhas:
+        yield json.dumps(dict(zip(colunas, linha)), ensure_ascii=False) + '\n'
+
+def gerar_xlsx(linhas, nome):
+    from openpyxl import Workbook
+    
+    workbook = Workbook(write_only=True)
+    planilha = workbook.create_sheet(nome)
+    for linha in linhas:
+        planilha.append(linha)
+    
+    arquivo = tempfile.TemporaryFile()
+    workbook.save(arquivo)
+    arquivo.seek(0)
+    
+    def ler():
+        with arquivo:
+            while True:
+                bloco = arquivo.read(64 * 1024)
+                if not bloco:
+                    break
+                yield bloco
+    return ler()
+
+@app.route('/exportar/<tabela>.<formato>')
+def exportar(tabela, formato):
+    if tabela not in EXPORTACOES:
+        return jsonify({'success': False, 'message': f'Exportação desconhecida: {tabela}'}), 404
+    
+    linhas = exportar_tabela(
+        tabela, request.args.get('data_inicio') or None, request.args.get('data_fim') or None,
+        incluir_arquivo=request.args.get('arquivo') in ('1', 'true', 'on')
+    )
+    nome_arquivo = f'{tabela}.{formato}'
+    
+    if formato == 'csv':
+        corpo, mimetype = gerar_csv(linhas), 'text/csv; charset=utf-8'
+    elif formato == 'ndjson':
+        corpo, mimetype = gerar_ndjson(linhas), 'application/x-ndjson'
+    elif formato == 'xlsx':
+        try:
+            corpo = gerar_xlsx(linhas, tabela)
+        except ImportError:
+            linhas.close()
+            return jsonify({'success': False, 'message': 'Exportação XLSX requer o pacote openpyxl'}), 501
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        linhas.close()
+        return jsonify({'success': False, 'message': 'Formato inválido, use csv, ndjson ou xlsx'}), 400
+    
+    return Response(corpo, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={nome_arquivo}'
+    })
 
 @app.route('/containers')
 def containers():
-    containers_list = listar_containers()
-    return render_template('containers.html', containers=containers_list)
+    filtros = obter_filtros_containers()
+    ultimo_evento = obter_ultimo_movimento_id()
+    try:
+        containers_list, proximo_cursor = paginar_containers(obter_limite_pagina(), request.args.get('cursor'), **filtros)
+    except ValueError:
+        return redirect(url_for('containers'))
+    
+    return render_template(
+        'containers.html',
+        containers=containers_list,
+        filtros=filtros,
+        armadores=listar_armadores(),
+        proxima_pagina=url_proxima_pagina('containers', proximo_cursor),
+        primeira_pagina=not request.args.get('cursor'),
+        ultimo_evento=ultimo_evento
+    )
 
 @app.route('/containers/novo', methods=['GET', 'POST'])
 def container_novo():
@@ -132,8 +633,7 @@ def container_novo():
             if not numero_container or not tipo or not armador:
                 return jsonify({'success': False, 'message': 'Dados incompletos'}), 400
             
-            container_existente = obter_container_por_numero(numero_container)
-            if container_existente:
+            if container_cadastrado(numero_container):
                 return jsonify({'success': False, 'message': f'Container {numero_container} já está cadastrado'}), 400
             
             container_id = inserir_container(numero_container, tipo, armador, observacao)
@@ -155,33 +655,35 @@ def container_novo():
 
 @app.route('/containers/<int:container_id>')
 def container_detalhe(container_id):
+    ultimo_evento = obter_ultimo_movimento_id()
     container = obter_container(container_id)
+    arquivado = container is None
+    if arquivado:
+        container = obter_container(container_id, incluir_arquivo=True)
     if not container:
         return redirect(url_for('containers'))
     
-    historico = obter_historico_container(container_id)
-    return render_template('container_detalhe.html', container=container, historico=historico)
+    historico = obter_historico_container(container_id, incluir_arquivo=arquivado)
+    return render_template('container_detalhe.html', container=container, historico=historico, ultimo_evento=ultimo_evento)
 
 @app.route('/containers/<int:container_id>/desova', methods=['POST'])
 def container_desova(container_id):
     try:
         observacao = request.form.get('observacao', '')
         
-        container = obter_container(container_id)
+        container = obter_registro_container(container_id)
         if not container:
             return jsonify({'success': False, 'message': 'Container não encontrado'}), 404
         
-        if container['status'] == 'patio_vazio':
-            return jsonify({'success': False, 'message': 'Container já foi desovado'}), 400
-        
-        if container['status'] == 'liberado_saida':
-            return jsonify({'success': False, 'message': 'Container já saiu'}), 400
+        erro = patio.validar_transicao(container.status, 'desova')
+        if erro:
+            return jsonify({'success': False, 'message': erro}), 400
         
         registrar_desova(container_id, observacao)
         
         return jsonify({
             'success': True,
-            'message': f'Desova do container {container["numero_container"]} registrada com sucesso!'
+            'message': f'Desova do container {container.numero_container} registrada com sucesso!'
         })
     
     except Exception as e:
@@ -192,18 +694,19 @@ def container_saida(container_id):
     try:
         observacao = request.form.get('observacao', '')
         
-        container = obter_container(container_id)
+        container = obter_registro_container(container_id)
         if not container:
             return jsonify({'success': False, 'message': 'Container não encontrado'}), 404
         
-        if container['status'] == 'liberado_saida':
-            return jsonify({'success': False, 'message': 'Container já foi liberado para saída'}), 400
+        erro = patio.validar_transicao(container.status, 'saida')
+        if erro:
+            return jsonify({'success': False, 'message': erro}), 400
         
         registrar_saida(container_id, observacao)
         
         return jsonify({
             'success': True,
-            'message': f'Saída do container {container["numero_container"]} registrada com sucesso!'
+            'message': f'Saída do container {container.numero_container} registrada com sucesso!'
         })
     
     except Exception as e:
@@ -211,8 +714,16 @@ def container_saida(container_id):
 
 @app.route('/api/containers')
 def api_containers():
-    containers_list = listar_containers()
-    return jsonify([dict(c) for c in containers_list])
+    try:
+        containers_list, proximo_cursor = paginar_containers(obter_limite_pagina(), request.args.get('cursor'), **obter_filtros_containers())
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    resposta = jsonify([dict(c) for c in containers_list])
+    if proximo_cursor:
+        resposta.headers['X-Proximo-Cursor'] = proximo_cursor
+        resposta.headers['Link'] = f'<{url_proxima_pagina("api_containers", proximo_cursor)}>; rel="next"'
+    return resposta
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,64 @@
+import argparse
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from database import (
+    init_db, listar_notas_arquivaveis, listar_containers_arquivaveis, arquivar_notas, arquivar_containers, compactar_banco
+)
+
+HORIZONTE_DIAS = int(os.environ.get('ARQUIVO_HORIZONTE_DIAS', 365))
+
+def arquivar(listar, mover, corte, lote, simular):
+    total = 0
+    por_periodo = defaultdict(int)
+    ultimo_id = 0
+    while True:
+        registros = listar(corte, ultimo_id, lote)
+        if not registros:
+            break
+        ultimo_id = registros[-1]['id']
+        
+        grupos = defaultdict(list)
+        for registro in registros:
+            grupos[registro['periodo']].append(registro)
+        for periodo, grupo in sorted(grupos.items()):
+            quantidade = len(grupo) if simular else mover(periodo, grupo)
+            por_periodo[periodo] += quantidade
+            total += quantidade
+    return total, dict(por_periodo)
+
+def main():
+    parser = argparse.ArgumentParser(description='Move notas encerradas e containers liberados para arquivos por ano')
+    parser.add_argument('--horizonte-dias', type=int, default=HORIZONTE_DIAS, help='Arquiva somente registros sem movimento há mais de N dias')
+    parser.add_argument('--lote', type=int, default=500, help='Registros por transação')
+    parser.add_argument('--somente', choices=['notas', 'containers'], help='Arquiva apenas um tipo de registro')
+    parser.add_argument('--simular', action='store_true', help='Apenas conta o que seria arquivado')
+    parser.add_argument('--compactar', action='store_true', help='Executa VACUUM no banco principal ao final')
+    args = parser.parse_args()
+    
+    init_db()
+    corte = (datetime.now() - timedelta(days=args.horizonte_dias)).strftime('%Y-%m-%d')
+    inicio = time.perf_counter()
+    
+    tipos = [
+        ('notas', listar_notas_arquivaveis, arquivar_notas),
+        ('containers', listar_containers_arquivaveis, arquivar_containers),
+    ]
+    for nome, listar, mover in tipos:
+        if args.somente and args.somente != nome:
+            continue
+        total, por_periodo = arquivar(listar, mover, corte, args.lote, args.simular)
+        detalhes = ', '.join(f'{periodo}: {quantidade}' for periodo, quantidade in sorted(por_periodo.items()))
+        acao = 'a arquivar' if args.simular else 'arquivado(s)'
+        print(f"{nome.capitalize()} anteriores a {corte}: {total} {acao}{f' ({detalhes})' if detalhes else ''}")
+    
+    if args.compactar and not args.simular:
+        compactar_banco()
+        print('Banco principal compactado')
+    
+    print(f'Concluído em {time.perf_counter() - inicio:.2f}s')
+
+if __name__ == '__main__':
+    main()
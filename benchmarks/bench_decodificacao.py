@@ -0,0 +1,56 @@
+import argparse
+import time
+
+import chardet
+
+from benchmarks.gerador_nfe import gerar_nfe
+from xml_parser import decodificar_xml, obter_estatisticas_decodificacao
+
+def decodificar_legado(xml_bytes):
+    detected = chardet.detect(xml_bytes)
+    encoding = detected['encoding'] or 'utf-8'
+    
+    try:
+        return xml_bytes.decode(encoding)
+    except (UnicodeDecodeError, AttributeError):
+        for enc in ['utf-8', 'iso-8859-1', 'latin-1', 'cp1252']:
+            try:
+                return xml_bytes.decode(enc)
+            except UnicodeDecodeError:
+                continue
+        raise ValueError("Não foi possível decodificar o arquivo XML")
+
+def medir(funcao, xml_bytes, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao(xml_bytes)
+    return (time.perf_counter() - inicio) / repeticoes
+
+def main():
+    parser = argparse.ArgumentParser(description='Detecção de encoding: chardet completo x caminho rápido')
+    parser.add_argument('--repeticoes', type=int, default=20)
+    args = parser.parse_args()
+    
+    casos = []
+    for itens in (1, 100, 2000):
+        utf8 = gerar_nfe(1, itens=itens)
+        casos.append((f'utf-8 itens={itens}', utf8))
+        casos.append((f'utf-8 BOM itens={itens}', b'\xef\xbb\xbf' + utf8))
+        casos.append((f'iso-8859-1 itens={itens}', gerar_nfe(1, itens=itens, encoding='iso-8859-1')))
+        sem_prologo = utf8.split(b'?>', 1)[1].replace('ã'.encode(), 'ã'.encode('cp1252'))
+        casos.append((f'cp1252 sem prólogo itens={itens}', sem_prologo))
+    
+    for nome, xml_bytes in casos:
+        if decodificar_legado(xml_bytes).lstrip('\ufeff') != decodificar_xml(xml_bytes).lstrip('\ufeff'):
+            print(f'{nome}: conteúdo decodificado diverge do legado')
+        t_legado = medir(decodificar_legado, xml_bytes, args.repeticoes)
+        t_rapido = medir(decodificar_xml, xml_bytes, args.repeticoes)
+        print(
+            f'{nome:<32} {len(xml_bytes) / 1024:7.0f} KB  '
+            f'chardet={t_legado * 1000:8.2f}ms  rápido={t_rapido * 1000:7.3f}ms  {t_legado / t_rapido:7.0f}x'
+        )
+    
+    print('caminhos:', obter_estatisticas_decodificacao())
+
+if __name__ == '__main__':
+    main()
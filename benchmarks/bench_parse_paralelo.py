@@ -0,0 +1,38 @@
+import argparse
+import os
+import time
+
+from benchmarks.gerador_nfe import gerar_corpus
+from xml_parser import encerrar_pool, extrair_dados_nfe_lote
+
+def main():
+    parser = argparse.ArgumentParser(description='Escalabilidade do parse paralelo de NF-e')
+    parser.add_argument('--arquivos', type=int, default=3000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunksize', type=int, default=16)
+    args = parser.parse_args()
+    
+    corpus = gerar_corpus(args.arquivos)
+    print(f'{len(corpus)} arquivos, {sum(map(len, corpus)) / 1024 / 1024:.1f} MB')
+    
+    base = None
+    workers = 1
+    while True:
+        # o pool é de longa duração no servidor: a criação dos processos fica fora da medição
+        extrair_dados_nfe_lote(corpus[:workers * 4], workers, 1)
+        inicio = time.perf_counter()
+        resultados = extrair_dados_nfe_lote(corpus, workers, args.chunksize)
+        duracao = time.perf_counter() - inicio
+        
+        erros = sum(1 for _, erro in resultados if erro)
+        base = base or duracao
+        print(f'workers={workers:<3} {duracao:7.2f}s  {len(corpus) / duracao:8.0f} notas/s  speedup={base / duracao:4.2f}x  erros={erros}')
+        
+        if workers >= args.workers:
+            break
+        workers = min(workers * 2, args.workers)
+    
+    encerrar_pool()
+
+if __name__ == '__main__':
+    main()
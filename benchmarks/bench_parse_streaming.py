@@ -0,0 +1,37 @@
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.gerador_nfe import gerar_nfe
+from xml_parser import extrair_dados_nfe, extrair_dados_nfe_dict
+
+def medir(funcao, xml_bytes, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao(xml_bytes)
+    duracao = (time.perf_counter() - inicio) / repeticoes
+    
+    tracemalloc.start()
+    funcao(xml_bytes)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duracao, pico
+
+def main():
+    parser = argparse.ArgumentParser(description='Parser streaming x xmltodict para NF-e')
+    parser.add_argument('--repeticoes', type=int, default=20)
+    args = parser.parse_args()
+    
+    for itens in (1, 50, 200, 1000):
+        xml_bytes = gerar_nfe(1, itens=itens)
+        t_dict, m_dict = medir(extrair_dados_nfe_dict, xml_bytes, args.repeticoes)
+        t_stream, m_stream = medir(extrair_dados_nfe, xml_bytes, args.repeticoes)
+        print(
+            f'itens={itens:<5} {len(xml_bytes) / 1024:7.0f} KB  '
+            f'xmltodict={t_dict * 1000:7.2f}ms/{m_dict / 1024:6.0f}KB  '
+            f'streaming={t_stream * 1000:7.2f}ms/{m_stream / 1024:6.0f}KB  '
+            f'{t_dict / t_stream:4.1f}x'
+        )
+
+if __name__ == '__main__':
+    main()
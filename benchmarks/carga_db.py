@@ -0,0 +1,126 @@
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+import database
+
+legado = threading.local()
+
+def conectar_legado():
+    # como o get_db original: conexão nova a cada chamada, fechada ao fim da operação
+    conn = sqlite3.connect(database.DATABASE, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA foreign_keys = ON')
+    legado.__dict__.setdefault('abertas', []).append(conn)
+    return conn
+
+def fechar_legado():
+    for conn in legado.__dict__.pop('abertas', []):
+        conn.close()
+
+def modo_journal():
+    conn = sqlite3.connect(database.DATABASE)
+    try:
+        return conn.execute('PRAGMA journal_mode').fetchone()[0]
+    finally:
+        conn.close()
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+def executar(modo, threads, operacoes, diretorio):
+    database.DATABASE = os.path.join(diretorio, f'carga_{modo}.db')
+    get_db_original = database.get_db
+    if modo == 'legado':
+        database.get_db = conectar_legado
+    
+    try:
+        database.init_db()
+        if modo == 'legado':
+            # init_db coloca o arquivo em WAL; o baseline usava o journal padrão (DELETE)
+            fechar_legado()
+            conn = sqlite3.connect(database.DATABASE)
+            conn.execute('PRAGMA journal_mode = DELETE')
+            conn.close()
+        
+        for numero in range(200):
+            database.inserir_nota_entrada(str(numero), '2025-03-01', 'Soja', 100000.0, 1.0, '1', '2')
+            fechar_legado()
+        
+        latencias = {}
+        erros = []
+        lock = threading.Lock()
+        
+        def trabalhador(indice):
+            rnd = random.Random(indice)
+            locais = {}
+            for i in range(operacoes):
+                escolha = rnd.random()
+                inicio = time.perf_counter()
+                try:
+                    if escolha < 0.4:
+                        nome = 'listar_notas_entrada'
+                        database.listar_notas_entrada()
+                    elif escolha < 0.6:
+                        nome = 'obter_estatisticas'
+                        database.obter_estatisticas()
+                    elif escolha < 0.8:
+                        nome = 'inserir_nota_saida'
+                        database.inserir_nota_saida(f'CTE{indice}-{i}', str(rnd.randrange(200)), 1.0, 1.0, '2025-03-02')
+                    else:
+                        nome = 'inserir_nota_entrada'
+                        database.inserir_nota_entrada(f'{indice}-{i}', '2025-03-01', 'Milho', 1000.0, 1.0, '1', '2')
+                except sqlite3.OperationalError as e:
+                    with lock:
+                        erros.append(str(e))
+                    continue
+                finally:
+                    fechar_legado()
+                locais.setdefault(nome, []).append(time.perf_counter() - inicio)
+            
+            with lock:
+                for nome, valores in locais.items():
+                    latencias.setdefault(nome, []).extend(valores)
+        
+        inicio = time.perf_counter()
+        workers = [threading.Thread(target=trabalhador, args=(i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        duracao = time.perf_counter() - inicio
+        journal = modo_journal()
+    finally:
+        fechar_legado()
+        database.get_db = get_db_original
+        database.fechar_db()
+    
+    total = sum(len(v) for v in latencias.values())
+    print(f'\n[{modo}] journal_mode={journal}, {total} operações em {duracao:.2f}s ({total / duracao:.0f} ops/s), {len(erros)} erros')
+    for nome, valores in sorted(latencias.items()):
+        print(
+            f'  {nome:<22} n={len(valores):<6} '
+            f'p50={percentil(valores, 50) * 1000:7.2f}ms  p99={percentil(valores, 99) * 1000:8.2f}ms'
+        )
+    if erros:
+        print(f'  exemplo de erro: {erros[0]}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga da camada de acesso ao SQLite')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--operacoes', type=int, default=300)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as diretorio:
+        for modo in ('legado', 'pool'):
+            executar(modo, args.threads, args.operacoes, diretorio)
+
+if __name__ == '__main__':
+    main()
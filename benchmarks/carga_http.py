@@ -0,0 +1,220 @@
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import database
+from benchmarks.gerador_nfe import gerar_nfe
+from benchmarks.suite import copiar_base, metadados, preparar_base
+
+NOTAS_SAIDA = 200
+SERVIDORES = {
+    'dev': lambda porta: [
+        sys.executable, '-c',
+        f"from app import app; app.run(host='127.0.0.1', port={porta}, debug=True, use_reloader=False)"
+    ],
+    'gunicorn': lambda porta: [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'main:app'],
+}
+
+def corpo_upload(numero):
+    fronteira = uuid.uuid4().hex
+    corpo = (
+        f'--{fronteira}\r\nContent-Disposition: form-data; name="xml_file"; filename="nfe_{numero}.xml"\r\n'
+        'Content-Type: text/xml\r\n\r\n'
+    ).encode() + gerar_nfe(numero, 3) + f'\r\n--{fronteira}--\r\n'.encode()
+    return corpo, f'multipart/form-data; boundary={fronteira}'
+
+def cenarios(base_numero):
+    numeros = itertools.count(base_numero)
+    
+    def upload():
+        corpo, tipo = corpo_upload(next(numeros))
+        return 'POST', '/upload', corpo, {'Content-Type': tipo}, 202
+    
+    def saida():
+        numero = next(numeros)
+        corpo = json.dumps({
+            'numero_cte': f'CARGA{numero}', 'data_saida': '2025-06-02',
+            'notas': [{'numero_nota': f'CARGA{random.randrange(NOTAS_SAIDA)}', 'peso_saida': 10.0, 'valor_frete': 1.0}]
+        }).encode()
+        return 'POST', '/saida', corpo, {'Content-Type': 'application/json'}, 200
+    
+    def containers():
+        return 'GET', '/containers', None, {}, 200
+    
+    return {'upload': upload, 'saida': saida, 'containers': containers}
+
+def executar_cenario(host, porta, gerar, concorrencia, duracao):
+    tempos = []
+    erros = []
+    lock = threading.Lock()
+    limite = time.perf_counter() + duracao
+    
+    def cliente():
+        conn = http.client.HTTPConnection(host, porta, timeout=30)
+        locais = []
+        falhas = []
+        while time.perf_counter() < limite:
+            metodo, caminho, corpo, cabecalhos, esperado = gerar()
+            inicio = time.perf_counter()
+            try:
+                conn.request(metodo, caminho, body=corpo, headers=cabecalhos)
+                resposta = conn.getresponse()
+                resposta.read()
+                if resposta.status != esperado:
+                    falhas.append(f'{caminho}: HTTP {resposta.status}')
+                if resposta.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+            except (OSError, http.client.HTTPException) as e:
+                falhas.append(f'{caminho}: {e}')
+                conn.close()
+                conn = http.client.HTTPConnection(host, porta, timeout=30)
+                continue
+            locais.append(time.perf_counter() - inicio)
+        conn.close()
+        with lock:
+            tempos.extend(locais)
+            erros.extend(falhas)
+    
+    inicio = time.perf_counter()
+    clientes = [threading.Thread(target=cliente) for _ in range(concorrencia)]
+    for thread in clientes:
+        thread.start()
+    for thread in clientes:
+        thread.join()
+    decorrido = time.perf_counter() - inicio
+    
+    tempos.sort()
+    
+    def percentil(p):
+        return tempos[min(len(tempos) - 1, int(len(tempos) * p))] if tempos else None
+    return {
+        'requisicoes': len(tempos),
+        'erros': len(erros),
+        'exemplo_erro': erros[0] if erros else None,
+        'req_por_segundo': len(tempos) / decorrido,
+        'p50': percentil(0.50),
+        'p95': percentil(0.95),
+        'p99': percentil(0.99),
+        'max': tempos[-1] if tempos else None,
+    }
+
+def aguardar_pronto(host, porta, processo, limite=60):
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if processo is not None and processo.poll() is not None:
+            raise RuntimeError(f'Servidor encerrou com código {processo.returncode}')
+        try:
+            conn = http.client.HTTPConnection(host, porta, timeout=2)
+            conn.request('GET', '/readyz')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('Servidor não ficou pronto a tempo')
+
+def preparar_banco(base, destino):
+    copiar_base(base, destino)
+    database.DATABASE = destino
+    database.init_db()
+    for indice in range(NOTAS_SAIDA):
+        database.inserir_nota_entrada(f'CARGA{indice}', '2025-06-01', 'Soja em grão', 1e9, 1.0, '1', '2')
+    database.get_db().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    database.fechar_db()
+
+def iniciar_servidor(nome, porta, diretorio, base):
+    caminho = os.path.join(diretorio, f'carga_{nome}.db')
+    preparar_banco(base, caminho)
+    ambiente = dict(
+        os.environ, PORT=str(porta), DATABASE_PATH=caminho,
+        UPLOAD_FOLDER=os.path.join(diretorio, f'uploads_{nome}'),
+        ARQUIVO_DIRETORIO=os.path.join(diretorio, f'arquivo_{nome}'),
+    )
+    log = open(os.path.join(diretorio, f'{nome}.log'), 'wb')
+    processo = subprocess.Popen(
+        SERVIDORES[nome](porta), env=ambiente, stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+    )
+    return processo, log
+
+def parar_servidor(processo, log):
+    os.killpg(processo.pid, signal.SIGTERM)
+    try:
+        processo.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(processo.pid, signal.SIGKILL)
+        processo.wait()
+    log.close()
+
+def imprimir(servidor, cenario, r):
+    if not r['requisicoes']:
+        print(f"  {servidor:9} {cenario:11} sem respostas, {r['erros']} erros ({r['exemplo_erro']})", flush=True)
+        return
+    print(
+        f"  {servidor:9} {cenario:11} {r['req_por_segundo']:8.1f} req/s  p50={r['p50'] * 1000:8.1f}ms  "
+        f"p95={r['p95'] * 1000:8.1f}ms  p99={r['p99'] * 1000:8.1f}ms  erros={r['erros']}",
+        flush=True
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga HTTP: servidor de desenvolvimento x gunicorn')
+    parser.add_argument('--url', help='Servidor já em execução; sem esta opção os servidores são iniciados com uma base gerada')
+    parser.add_argument('--servidores', default='dev,gunicorn', help=f"Servidores a comparar ({', '.join(SERVIDORES)})")
+    parser.add_argument('--cenarios', default='containers,saida,upload')
+    parser.add_argument('--concorrencia', type=int, default=16, help='Clientes simultâneos')
+    parser.add_argument('--duracao', type=float, default=15.0, help='Segundos por cenário')
+    parser.add_argument('--notas', type=int, default=10000, help='Tamanho da base gerada')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--porta', type=int, default=5077)
+    parser.add_argument('--cache', default=os.path.join(tempfile.gettempdir(), 'controle_notas_bench'), help='Diretório das bases geradas')
+    parser.add_argument('--saida', default=f"benchmark_carga_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    parser.set_defaults(repeticoes=None)
+    args = parser.parse_args()
+    
+    nomes_cenarios = [c for c in args.cenarios.split(',') if c]
+    resultados = []
+    base_numero = 2 * 10 ** 9
+    
+    def rodar(servidor, host, porta):
+        nonlocal base_numero
+        geradores = cenarios(base_numero)
+        base_numero += 10 ** 7
+        for cenario in nomes_cenarios:
+            resultado = executar_cenario(host, porta, geradores[cenario], args.concorrencia, args.duracao)
+            resultados.append({'servidor': servidor, 'cenario': cenario, 'concorrencia': args.concorrencia, **resultado})
+            imprimir(servidor, cenario, resultado)
+    
+    if args.url:
+        partes = urlsplit(args.url)
+        aguardar_pronto(partes.hostname, partes.port or 80, None)
+        print(f'Carga contra {args.url} ({args.concorrencia} clientes, {args.duracao:.0f}s por cenário)')
+        rodar(args.url, partes.hostname, partes.port or 80)
+    else:
+        base = preparar_base(args.notas, args.cache, args.seed)
+        print(f'Carga com {args.notas} notas ({args.concorrencia} clientes, {args.duracao:.0f}s por cenário)')
+        with tempfile.TemporaryDirectory() as diretorio:
+            for servidor in args.servidores.split(','):
+                processo, log = iniciar_servidor(servidor, args.porta, diretorio, base)
+                try:
+                    aguardar_pronto('127.0.0.1', args.porta, processo)
+                    rodar(servidor, '127.0.0.1', args.porta)
+                finally:
+                    parar_servidor(processo, log)
+    
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump({'metadados': metadados(args), 'resultados': resultados}, arquivo, indent=2, ensure_ascii=False)
+    print(f'\nResultados salvos em {args.saida}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import hashlib
+import random
+from datetime import datetime, timedelta
+
+PRODUTOS = ['Soja em grão', 'Milho em grão', 'Trigo', 'Sorgo', 'Farelo de soja', 'Café cru em grão']
+UNIDADES = ['KG', 'KG', 'KG', 'TON', 'T']
+
+def gerar_nfe(numero, itens=1, envelope=True, encoding='utf-8', seed=None):
+    rnd = random.Random(numero if seed is None else seed)
+    
+    dets = []
+    for i in range(itens):
+        unidade = rnd.choice(UNIDADES)
+        quantidade = rnd.uniform(20, 60) if unidade in ('TON', 'T') else rnd.uniform(20000, 60000)
+        dets.append(
+            f'<det nItem="{i + 1}"><prod><cProd>{i + 1:04d}</cProd><cEAN>SEM GTIN</cEAN>'
+            f'<xProd>{rnd.choice(PRODUTOS)}</xProd><NCM>12019000</NCM><CFOP>5101</CFOP>'
+            f'<uCom>{unidade}</uCom><qCom>{quantidade:.4f}</qCom><vUnCom>1.2500</vUnCom>'
+            f'<vProd>{quantidade * 1.25:.2f}</vProd></prod>'
+            f'<imposto><ICMS><ICMS00><orig>0</orig><CST>00</CST><vBC>0.00</vBC><pICMS>0.00</pICMS>'
+            f'<vICMS>0.00</vICMS></ICMS00></ICMS><PIS><PISNT><CST>07</CST></PISNT></PIS></imposto></det>'
+        )
+    
+    chave = f'35{rnd.randint(10**11, 10**12 - 1)}55001{numero:09d}1{rnd.randint(10**8, 10**9 - 1)}'[:44].ljust(44, '0')
+    dia = (numero % 28) + 1
+    nfe = (
+        f'<NFe xmlns="http://www.portalfiscal.inf.br/nfe"><infNFe Id="NFe{chave}" versao="4.00">'
+        f'<ide><cUF>35</cUF><natOp>Venda de produção do estabelecimento</natOp><mod>55</mod><serie>1</serie>'
+        f'<nNF>{numero}</nNF><dhEmi>2025-03-{dia:02d}T08:30:00-03:00</dhEmi></ide>'
+        f'<emit><CNPJ>{rnd.randint(10**13, 10**14 - 1)}</CNPJ><xNome>Fazenda Santa Luzia</xNome></emit>'
+        f'<dest><CNPJ>{rnd.randint(10**13, 10**14 - 1)}</CNPJ><xNome>Armazém Geral São José</xNome></dest>'
+        f'{"".join(dets)}'
+        f'<total><ICMSTot><vNF>{rnd.uniform(10000, 500000):.2f}</vNF></ICMSTot></total></infNFe>'
+        f'<Signature xmlns="http://www.w3.org/2000/09/xmldsig#"><SignedInfo><Reference URI="#NFe{chave}">'
+        f'<DigestValue>{"A" * 28}</DigestValue></Reference></SignedInfo>'
+        f'<SignatureValue>{"B" * 344}</SignatureValue></Signature></NFe>'
+    )
+    if envelope:
+        nfe = (
+            f'<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">{nfe}'
+            f'<protNFe versao="4.00"><infProt><chNFe>{chave}</chNFe><cStat>100</cStat></infProt></protNFe></nfeProc>'
+        )
+    
+    return (f'<?xml version="1.0" encoding="{encoding}"?>' + nfe).encode(encoding)
+
+def gerar_corpus(quantidade, itens_max=3, seed=42):
+    rnd = random.Random(seed)
+    return [
+        gerar_nfe(
+            numero,
+            itens=rnd.randint(1, itens_max),
+            envelope=rnd.random() < 0.8,
+            encoding='utf-8' if rnd.random() < 0.7 else 'iso-8859-1'
+        )
+        for numero in range(1, quantidade + 1)
+    ]
+
+ARMADORES = ['MSC', 'Maersk', 'CMA CGM', 'Hapag-Lloyd', 'COSCO', 'Evergreen']
+TIPOS_CONTAINER = ['20DC', '40DC', '40HC', '40RF']
+
+def gerar_notas(quantidade, seed=42, inicio=1):
+    rnd = random.Random(seed)
+    data_base = datetime(2024, 1, 1)
+    for numero in range(inicio, inicio + quantidade):
+        produtos = []
+        for _ in range(rnd.choice((1, 1, 1, 2, 3, 4))):
+            peso_kg = round(rnd.uniform(5000, 40000), 2)
+            produtos.append({'nome': rnd.choice(PRODUTOS), 'quantidade': peso_kg, 'unidade': 'KG', 'peso_kg': peso_kg})
+        
+        resumo = produtos[0]['nome'] + (f' (+{len(produtos) - 1} itens)' if len(produtos) > 1 else '')
+        yield {
+            'numero_nota': str(numero),
+            'chave_acesso': f'35{numero:042d}',
+            'hash_conteudo': hashlib.sha256(f'{seed}-{numero}'.encode()).hexdigest(),
+            'data_emissao': (data_base + timedelta(days=rnd.randrange(730))).strftime('%Y-%m-%d'),
+            'produto': resumo,
+            'peso': sum(p['peso_kg'] for p in produtos),
+            'valor': round(rnd.uniform(10000, 500000), 2),
+            'cnpj_emitente': f'{rnd.randrange(500):014d}',
+            'cnpj_destinatario': f'{rnd.randrange(50) + 90000:014d}',
+            'produtos': produtos,
+        }
+
+def popular_banco(notas, containers=None, seed=42, lote=10000):
+    import database
+    
+    rnd = random.Random(seed)
+    containers = notas // 10 if containers is None else containers
+    
+    gerador = gerar_notas(notas, seed)
+    numero_cte = 0
+    for inicio in range(0, notas, lote):
+        bloco = [next(gerador) for _ in range(min(lote, notas - inicio))]
+        database.inserir_notas_entrada_lote(bloco)
+        
+        saidas = []
+        pendentes = [n for n in bloco if rnd.random() < 0.6]
+        while pendentes:
+            numero_cte += 1
+            tamanho = rnd.randint(1, 5)
+            grupo, pendentes = pendentes[:tamanho], pendentes[tamanho:]
+            for nota in grupo:
+                peso_saida = nota['peso'] if rnd.random() < 0.5 else round(nota['peso'] * rnd.uniform(0.1, 0.9), 2)
+                saidas.append((
+                    f'CTE{numero_cte:08d}', nota['numero_nota'], peso_saida,
+                    round(rnd.uniform(500, 5000), 2), nota['data_emissao']
+                ))
+        with database.transacao() as cursor:
+            cursor.executemany('''
+                INSERT INTO notas_saida (numero_cte, numero_nota, peso_saida, valor_frete, data_saida)
+                VALUES (?, ?, ?, ?, ?)
+            ''', saidas)
+    
+    data_base = datetime(2024, 1, 1)
+    for inicio in range(0, containers, lote):
+        with database.transacao() as cursor:
+            for numero in range(inicio, min(containers, inicio + lote)):
+                entrada = data_base + timedelta(minutes=rnd.randrange(730 * 24 * 60))
+                movimentos = [('entrada_portaria', entrada)]
+                status = 'portaria'
+                if rnd.random() < 0.7:
+                    movimentos.append(('desova', entrada + timedelta(hours=rnd.uniform(2, 72))))
+                    status = 'patio_vazio'
+                    if rnd.random() < 0.6:
+                        movimentos.append(('saida', movimentos[-1][1] + timedelta(hours=rnd.uniform(2, 96))))
+                        status = 'liberado_saida'
+                
+                registro = entrada.strftime('%Y-%m-%d %H:%M:%S')
+                atualizacao = movimentos[-1][1].strftime('%Y-%m-%d %H:%M:%S')
+                cursor.execute('''
+                    INSERT INTO containers (numero_container, tipo, armador, status, local_atual, data_registro, data_atualizacao)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    f'BNCH{numero:07d}', rnd.choice(TIPOS_CONTAINER), rnd.choice(ARMADORES),
+                    status, 'portaria' if status == 'portaria' else 'patio_vazio', registro, atualizacao
+                ))
+                container_id = cursor.lastrowid
+                cursor.executemany('''
+                    INSERT INTO registro_movimentacao (container_id, tipo_movimento, data_movimento, observacao)
+                    VALUES (?, ?, ?, ?)
+                ''', [
+                    (container_id, tipo, data.strftime('%Y-%m-%d %H:%M:%S'), None)
+                    for tipo, data in movimentos
+                ])
+    
+    database.get_db().execute('ANALYZE')
+    database.invalidar_cache_estatisticas()
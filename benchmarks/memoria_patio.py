@@ -0,0 +1,86 @@
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+import database
+import patio
+from benchmarks.gerador_nfe import popular_banco
+
+def medir_memoria(construir):
+    gc.collect()
+    inicio = time.perf_counter()
+    resultado = construir()
+    duracao = time.perf_counter() - inicio
+    del resultado
+    
+    # segunda carga sob tracemalloc: mede só o que fica retido depois da coleta
+    gc.collect()
+    tracemalloc.start()
+    resultado = construir()
+    gc.collect()
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, memoria, duracao
+
+def linhas_containers():
+    cursor = database.get_db().cursor()
+    cursor.execute('SELECT id, numero_container, status FROM containers')
+    return cursor
+
+def indice_dicts():
+    por_id = {}
+    por_numero = {}
+    for container_id, numero_container, status in linhas_containers():
+        registro = por_id[container_id] = {'id': container_id, 'numero_container': numero_container, 'status': status}
+        por_numero[numero_container] = registro
+    return por_id, por_numero
+
+def main():
+    parser = argparse.ArgumentParser(description='Memória e tempo de carga do índice do pátio')
+    parser.add_argument('--containers', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as diretorio:
+        database.DATABASE = os.path.join(diretorio, 'patio.db')
+        database.init_db()
+        inicio = time.perf_counter()
+        popular_banco(0, containers=args.containers, seed=args.seed)
+        print(f'Banco com {args.containers} containers gerado em {time.perf_counter() - inicio:.1f}s')
+        
+        casos = [
+            ('sqlite3.Row (fetchall)', lambda: linhas_containers().fetchall()),
+            ('dict por container', indice_dicts),
+            ('RegistroContainer (__slots__)', database.carregar_patio),
+        ]
+        print(f"{'estrutura':<32} {'memória':>10} {'bytes/container':>16} {'carga':>9}")
+        for nome, construir in casos:
+            resultado, memoria, duracao = medir_memoria(construir)
+            print(f'{nome:<32} {memoria / 1024 / 1024:>8.1f}MB {memoria / args.containers:>16.0f} {duracao * 1000:>7.0f}ms')
+            del resultado
+        
+        container_id = args.containers // 2
+        numero = f'BNCH{container_id:07d}'
+        repeticoes = 100000
+        consultas = [
+            ('patio.obter', lambda: patio.obter(container_id)),
+            ('patio.obter_por_numero', lambda: patio.obter_por_numero(numero)),
+            ('patio.contar', patio.contar),
+            ('obter_container (SQLite)', lambda: database.obter_container(container_id)),
+            ('calcular_estatisticas_containers (SQLite)', database.calcular_estatisticas_containers),
+        ]
+        print()
+        for nome, funcao in consultas:
+            quantidade = repeticoes if nome.startswith('patio') else 200
+            inicio = time.perf_counter()
+            for _ in range(quantidade):
+                funcao()
+            print(f'{nome:<42} {(time.perf_counter() - inicio) / quantidade * 1e6:>10.2f}us')
+        
+        database.fechar_db()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import database
+from benchmarks.gerador_nfe import gerar_nfe, popular_banco
+from xml_parser import extrair_dados_nfe
+
+TAMANHOS_PADRAO = '10000,100000,1000000'
+
+CASOS_PARSE = [
+    ('1 item utf-8 nfeProc', dict(itens=1, envelope=True, encoding='utf-8')),
+    ('1 item iso-8859-1 NFe', dict(itens=1, envelope=False, encoding='iso-8859-1')),
+    ('50 itens utf-8 nfeProc', dict(itens=50, envelope=True, encoding='utf-8')),
+    ('50 itens iso-8859-1 NFe', dict(itens=50, envelope=False, encoding='iso-8859-1')),
+    ('500 itens utf-8 nfeProc', dict(itens=500, envelope=True, encoding='utf-8')),
+]
+
+def medir(funcao, repeticoes, aquecimento=2):
+    for _ in range(aquecimento):
+        funcao()
+    
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    
+    tempos.sort()
+    media = statistics.fmean(tempos)
+    return {
+        'rodadas': repeticoes,
+        'min': tempos[0],
+        'max': tempos[-1],
+        'media': media,
+        'mediana': statistics.median(tempos),
+        'p95': tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))],
+        'desvio': statistics.stdev(tempos) if len(tempos) > 1 else 0.0,
+        'ops_por_segundo': 1 / media if media else None,
+    }
+
+def casos_database(tamanho):
+    meio = str(tamanho // 2)
+    container_id = max(1, tamanho // 20)
+    numeros = itertools.count(tamanho + 1)
+    containers = itertools.count(1)
+    
+    def inserir_nota():
+        database.inserir_nota_entrada(str(next(numeros)), '2025-06-01', 'Soja em grão', 30000.0, 1.0, '1', '2')
+    
+    def registrar_saida():
+        numero = str(next(numeros))
+        database.inserir_nota_entrada(numero, '2025-06-01', 'Soja em grão', 30000.0, 1.0, '1', '2')
+        database.registrar_saida_cte(f'B{numero}', [{'numero_nota': numero, 'peso_saida': 1000.0, 'valor_frete': 1.0}], '2025-06-02')
+    
+    def ciclo_container():
+        novo_id = database.inserir_container(f'BNXT{next(containers):07d}', '40HC', 'MSC')
+        database.registrar_desova(novo_id)
+    
+    return [
+        ('listar_notas_entrada', lambda: database.listar_notas_entrada(limite=100)),
+        ('listar_notas_entrada periodo', lambda: database.listar_notas_entrada('2024-06-01', '2024-06-30', limite=100)),
+        ('listar_notas_entrada produto', lambda: database.listar_notas_entrada(produto='Trigo', limite=100)),
+        ('listar_notas_entrada cnpj', lambda: database.listar_notas_entrada(cnpj='00000000000007', limite=100)),
+        ('listar_notas_entrada com_saldo', lambda: database.listar_notas_entrada(com_saldo=True, limite=100)),
+        ('paginar_notas_entrada', lambda: database.paginar_notas_entrada(100)),
+        ('obter_saldo_nota', lambda: database.obter_saldo_nota(meio)),
+        ('obter_notas_por_hash', lambda: database.obter_notas_por_hash(['0' * 64, '1' * 64])),
+        ('calcular_estatisticas', database.calcular_estatisticas),
+        ('obter_estatisticas (cache)', database.obter_estatisticas),
+        ('obter_analytics mes/produto', lambda: database.obter_analytics('entrada', 'mes', 'produto')),
+        ('obter_analytics semana/cnpj', lambda: database.obter_analytics('saida', 'semana', 'cnpj', '2024-01-01', '2024-12-31')),
+        ('obter_resumo_produtos', database.obter_resumo_produtos),
+        ('obter_resumo_produtos mes', lambda: database.obter_resumo_produtos('Trigo', periodo='mes')),
+        ('verificar_saldos', database.verificar_saldos),
+        ('buscar numero', lambda: database.buscar(meio)),
+        ('buscar termo frequente', lambda: database.buscar('soja')),
+        ('exportar_tabela notas_entrada 1 mes', lambda: sum(1 for _ in database.exportar_tabela('notas_entrada', '2024-03-01', '2024-03-31'))),
+        ('listar_containers', lambda: database.listar_containers(limite=100)),
+        ('listar_containers status', lambda: database.listar_containers('patio_vazio', limite=100)),
+        ('paginar_containers', lambda: database.paginar_containers(100)),
+        ('listar_armadores', database.listar_armadores),
+        ('obter_container', lambda: database.obter_container(container_id)),
+        ('obter_container_por_numero', lambda: database.obter_container_por_numero(f'BNCH{container_id:07d}')),
+        ('obter_historico_container', lambda: database.obter_historico_container(container_id)),
+        ('calcular_estatisticas_containers', database.calcular_estatisticas_containers),
+        ('carregar_patio', database.carregar_patio),
+        ('obter_estatisticas_containers (índice)', database.obter_estatisticas_containers),
+        ('obter_registro_container (índice)', lambda: database.obter_registro_container(container_id)),
+        ('inserir_nota_entrada', inserir_nota),
+        ('registrar_saida_cte', registrar_saida),
+        ('inserir_container + registrar_desova', ciclo_container),
+    ]
+
+def casos_http(cliente, tamanho):
+    container_id = max(1, tamanho // 20)
+    numeros = itertools.count(10 ** 9 + tamanho)
+    
+    def upload():
+        resposta = cliente.post('/upload', data={'xml_file': (io.BytesIO(gerar_nfe(next(numeros), 3)), 'nfe.xml')})
+        assert resposta.status_code == 202, resposta.status_code
+    
+    def saida():
+        numero = str(next(numeros))
+        database.inserir_nota_entrada(numero, '2025-06-01', 'Soja em grão', 30000.0, 1.0, '1', '2')
+        resposta = cliente.post('/saida', json={
+            'numero_cte': f'H{numero}', 'data_saida': '2025-06-02',
+            'notas': [{'numero_nota': numero, 'peso_saida': 1000.0, 'valor_frete': 1.0}]
+        })
+        assert resposta.status_code == 200, resposta.status_code
+    
+    def get(url):
+        def requisitar():
+            resposta = cliente.get(url)
+            assert resposta.status_code == 200, (url, resposta.status_code)
+        return requisitar
+    
+    return [
+        ('GET /acompanhamento', get('/acompanhamento')),
+        ('GET /acompanhamento filtrado', get('/acompanhamento?data_inicio=2024-06-01&data_fim=2024-06-30&com_saldo=1')),
+        ('GET /api/notas', get('/api/notas')),
+        ('GET /saida', get('/saida')),
+        ('GET /dashboard', get('/dashboard')),
+        ('GET /api/estatisticas', get('/api/estatisticas')),
+        ('GET /api/analytics', get('/api/analytics')),
+        ('GET /api/produtos', get('/api/produtos')),
+        ('GET /api/search', get(f'/api/search?q=BNCH{container_id:07d}')),
+        ('GET /containers', get('/containers')),
+        ('GET /api/containers', get('/api/containers')),
+        (f'GET /containers/{container_id}', get(f'/containers/{container_id}')),
+        ('POST /upload', upload),
+        ('POST /saida', saida),
+    ]
+
+def preparar_base(tamanho, diretorio_cache, seed):
+    os.makedirs(diretorio_cache, exist_ok=True)
+    caminho = os.path.join(diretorio_cache, f'base_{tamanho}_{seed}_v{len(database.MIGRACOES)}.db')
+    if not os.path.exists(caminho):
+        print(f'Gerando base com {tamanho} notas em {caminho}...', flush=True)
+        inicio = time.perf_counter()
+        database.DATABASE = caminho + '.tmp'
+        database.init_db()
+        popular_banco(tamanho, seed=seed)
+        database.get_db().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        database.fechar_db()
+        os.replace(caminho + '.tmp', caminho)
+        print(f'Base gerada em {time.perf_counter() - inicio:.1f}s', flush=True)
+    return caminho
+
+def copiar_base(origem, destino):
+    conn_origem = sqlite3.connect(origem)
+    conn_destino = sqlite3.connect(destino)
+    try:
+        conn_origem.backup(conn_destino)
+    finally:
+        conn_destino.close()
+        conn_origem.close()
+
+def registrar(resultados, grupo, nome, tamanho, estatisticas):
+    resultados.append({'grupo': grupo, 'nome': nome, 'tamanho': tamanho, 'estatisticas': estatisticas})
+    print(f"  {grupo:9} {nome:42} mediana={estatisticas['mediana'] * 1000:9.3f}ms  p95={estatisticas['p95'] * 1000:9.3f}ms", flush=True)
+
+def metadados(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'seed': args.seed,
+        'repeticoes': args.repeticoes,
+    }
+
+def comparar(resultados, arquivo_anterior):
+    with open(arquivo_anterior, encoding='utf-8') as arquivo:
+        anteriores = {(r['grupo'], r['nome'], r['tamanho']): r['estatisticas'] for r in json.load(arquivo)['resultados']}
+    
+    print(f'\nComparação com {arquivo_anterior} (mediana):')
+    for r in resultados:
+        anterior = anteriores.get((r['grupo'], r['nome'], r['tamanho']))
+        if not anterior:
+            continue
+        razao = r['estatisticas']['mediana'] / anterior['mediana'] if anterior['mediana'] else float('inf')
+        marcador = 'mais lento' if razao > 1.1 else 'mais rápido' if razao < 0.9 else ''
+        print(f"  {r['grupo']:9} {r['nome']:42} n={r['tamanho']:<8} {razao:6.2f}x {marcador}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks de parsing, consultas e rotas')
+    parser.add_argument('--tamanhos', default=TAMANHOS_PADRAO, help='Quantidades de notas separadas por vírgula')
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--grupos', default='parse,database,http', help='Grupos a executar')
+    parser.add_argument('--cache', default=os.path.join(tempfile.gettempdir(), 'controle_notas_bench'), help='Diretório das bases geradas')
+    parser.add_argument('--saida', default=f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    parser.add_argument('--comparar', help='Resultado JSON anterior para comparação')
+    args = parser.parse_args()
+    
+    grupos = set(args.grupos.split(','))
+    tamanhos = [int(t) for t in args.tamanhos.split(',') if t]
+    resultados = []
+    
+    if 'parse' in grupos:
+        print('Parsing de NF-e')
+        for nome, opcoes in CASOS_PARSE:
+            xml_bytes = gerar_nfe(1, seed=args.seed, **opcoes)
+            registrar(resultados, 'parse', nome, None, medir(lambda: extrair_dados_nfe(xml_bytes), args.repeticoes * 5))
+    
+    with tempfile.TemporaryDirectory() as diretorio:
+        os.environ['INGESTAO_WORKERS'] = '0'
+        os.environ['PATIO_RECONCILIACAO'] = '0'
+        os.environ['UPLOAD_FOLDER'] = os.path.join(diretorio, 'uploads')
+        
+        for tamanho in tamanhos if grupos & {'database', 'http'} else []:
+            base = preparar_base(tamanho, args.cache, args.seed)
+            database.DATABASE = os.path.join(diretorio, f'bench_{tamanho}.db')
+            copiar_base(base, database.DATABASE)
+            database.invalidar_cache_estatisticas()
+            database.carregar_patio()
+            
+            if 'database' in grupos:
+                print(f'Consultas ({tamanho} notas)')
+                for nome, funcao in casos_database(tamanho):
+                    registrar(resultados, 'database', nome, tamanho, medir(funcao, args.repeticoes))
+            
+            if 'http' in grupos:
+                from app import app
+                cliente = app.test_client()
+                print(f'Rotas ({tamanho} notas)')
+                for nome, funcao in casos_http(cliente, tamanho):
+                    registrar(resultados, 'http', nome, tamanho, medir(funcao, args.repeticoes))
+            
+            database.fechar_db()
+            os.remove(database.DATABASE)
+    
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump({'metadados': metadados(args), 'resultados': resultados}, arquivo, indent=2, ensure_ascii=False)
+    print(f'\nResultados salvos em {args.saida}')
+    
+    if args.comparar:
+        comparar(resultados, args.comparar)
+
+if __name__ == '__main__':
+    sys.exit(main())
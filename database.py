@@ -1,145 +1,1387 @@
+import base64
+import json
+import os
+import re
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
-DATABASE = 'controle_notas.db'
+import eventos
+import patio
+from metricas import ConexaoInstrumentada, registrar_conexao
+from patio import STATUS_CONTAINERS
 
-def get_db():
-    conn = sqlite3.connect(DATABASE)
+DATABASE = os.environ.get('DATABASE_PATH', 'controle_notas.db')
+BUSY_TIMEOUT_MS = int(os.environ.get('DATABASE_BUSY_TIMEOUT_MS', 5000))
+CACHE_ESTATISTICAS_TTL = float(os.environ.get('CACHE_ESTATISTICAS_TTL', 30))
+ARQUIVO_DIRETORIO = os.environ.get('ARQUIVO_DIRETORIO', 'arquivo')
+METRICAS_SQL = os.environ.get('METRICAS_SQL', '1') == '1'
+LIMITE_NOTAS_EVENTO = 50
+
+PRAGMAS = (
+    'PRAGMA foreign_keys = ON',
+    f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 134217728',
+    'PRAGMA temp_store = MEMORY',
+)
+
+pool = threading.local()
+cache_estatisticas = {}
+lock_cache = threading.Lock()
+geracao_cache = [0]
+
+def conectar():
+    conn = sqlite3.connect(
+        DATABASE, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False,
+        factory=ConexaoInstrumentada if METRICAS_SQL else sqlite3.Connection
+    )
+    registrar_conexao()
     conn.row_factory = sqlite3.Row
-    conn.execute('PRAGMA foreign_keys = ON')
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+def get_db():
+    conn = getattr(pool, 'conn', None)
+    if conn is None or pool.pid != os.getpid() or pool.database != DATABASE:
+        conn = conectar()
+        pool.conn = conn
+        pool.pid = os.getpid()
+        pool.database = DATABASE
+    return conn
+
+def fechar_db():
+    conn = getattr(pool, 'conn', None)
+    if conn is not None and pool.pid == os.getpid():
+        conn.close()
+    pool.conn = None
+
+def codificar_cursor(*valores):
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip('=')
+
+# cursores das listagens: (data de ordenação, id); bool é subclasse de int e não é aceito como id
+TIPOS_CURSOR_DATA_ID = ((str, type(None)), int)
+
+def decodificar_cursor(token, tipos):
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        raise ValueError("Cursor de paginação inválido")
+    
+    if not isinstance(valores, list) or len(valores) != len(tipos):
+        raise ValueError("Cursor de paginação inválido")
+    if any(isinstance(valor, bool) or not isinstance(valor, tipo) for valor, tipo in zip(valores, tipos)):
+        raise ValueError("Cursor de paginação inválido")
+    return valores
+
+def obter_em_cache(chave, calcular):
+    agora = time.monotonic()
+    with lock_cache:
+        item = cache_estatisticas.get(chave)
+        geracao = geracao_cache[0]
+    if item and item[0] > agora:
+        return dict(item[1])
+    
+    valor = calcular()
+    with lock_cache:
+        if geracao == geracao_cache[0]:
+            cache_estatisticas[chave] = (agora + CACHE_ESTATISTICAS_TTL, valor)
+    return dict(valor)
+
+def invalidar_cache_estatisticas():
+    with lock_cache:
+        geracao_cache[0] += 1
+        cache_estatisticas.clear()
+
+@contextmanager
+def transacao(imediata=True):
+    conn = get_db()
+    if conn.in_transaction:
+        yield conn.cursor()
+        return
+    
+    conn.execute('BEGIN IMMEDIATE' if imediata else 'BEGIN')
+    try:
+        yield conn.cursor()
+        conn.execute('COMMIT')
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+
 def init_db():
     conn = get_db()
-    cursor = conn.cursor()
+    conn.execute('PRAGMA journal_mode = WAL')
     
+    with transacao() as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS notas_entrada (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                numero_nota TEXT NOT NULL,
+                data_emissao TEXT NOT NULL,
+                produto TEXT NOT NULL,
+                peso REAL NOT NULL,
+                valor REAL NOT NULL,
+                cnpj_emitente TEXT NOT NULL,
+                cnpj_destinatario TEXT NOT NULL,
+                data_carregamento TEXT NOT NULL
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS notas_saida (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                numero_cte TEXT NOT NULL,
+                numero_nota TEXT NOT NULL,
+                peso_saida REAL NOT NULL,
+                valor_frete REAL NOT NULL,
+                data_saida TEXT NOT NULL,
+                FOREIGN KEY (numero_nota) REFERENCES notas_entrada (numero_nota)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS containers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                numero_container TEXT NOT NULL UNIQUE,
+                tipo TEXT NOT NULL,
+                armador TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'portaria',
+                local_atual TEXT NOT NULL DEFAULT 'portaria',
+                data_registro TEXT NOT NULL,
+                data_atualizacao TEXT NOT NULL
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS registro_movimentacao (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                container_id INTEGER NOT NULL,
+                tipo_movimento TEXT NOT NULL,
+                data_movimento TEXT NOT NULL,
+                observacao TEXT,
+                FOREIGN KEY (container_id) REFERENCES containers (id)
+            )
+        ''')
+    
+    migrar_db()
+
+def migracao_indices(cursor):
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS notas_entrada (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            numero_nota TEXT NOT NULL,
-            data_emissao TEXT NOT NULL,
-            produto TEXT NOT NULL,
-            peso REAL NOT NULL,
-            valor REAL NOT NULL,
-            cnpj_emitente TEXT NOT NULL,
-            cnpj_destinatario TEXT NOT NULL,
-            data_carregamento TEXT NOT NULL
+        SELECT numero_nota FROM notas_entrada
+        GROUP BY numero_nota
+        HAVING COUNT(*) > 1
+        LIMIT 10
+    ''')
+    duplicadas = [row['numero_nota'] for row in cursor.fetchall()]
+    if duplicadas:
+        raise RuntimeError(
+            f"Não foi possível criar o índice único de notas_entrada.numero_nota: "
+            f"notas duplicadas ({', '.join(duplicadas)}). Use 'python database.py notas-duplicadas' para listá-las "
+            f"e '--mesclar' ou '--renomear' para resolvê-las antes de reiniciar a aplicação."
         )
+    
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_notas_entrada_numero_nota ON notas_entrada (numero_nota)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_entrada_data_emissao ON notas_entrada (data_emissao)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_saida_numero_nota ON notas_saida (numero_nota)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_saida_numero_cte ON notas_saida (numero_cte)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_containers_status ON containers (status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_containers_data_registro ON containers (data_registro)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_movimentacao_container_data ON registro_movimentacao (container_id, data_movimento)')
+
+def listar_notas_duplicadas():
+    cursor = get_db().cursor()
+    cursor.execute('''
+        SELECT id, numero_nota, data_emissao, produto, peso, valor, cnpj_emitente
+        FROM notas_entrada
+        WHERE numero_nota IN (SELECT numero_nota FROM notas_entrada GROUP BY numero_nota HAVING COUNT(*) > 1)
+        ORDER BY numero_nota, id
     ''')
+    return cursor.fetchall()
+
+def resolver_notas_duplicadas(renomear=False):
+    # A primeira importação de cada número é mantida. Mesclar descarta as cópias posteriores; renomear as
+    # preserva como "numero-id". No esquema anterior ao índice único a FK de notas_saida aponta para uma
+    # coluna sem unicidade, então qualquer alteração em notas_entrada falharia com "foreign key mismatch"
+    conn = get_db()
+    conn.execute('PRAGMA foreign_keys = OFF')
+    try:
+        with transacao() as cursor:
+            cursor.execute('''
+                SELECT id FROM notas_entrada ne
+                WHERE EXISTS (SELECT 1 FROM notas_entrada o WHERE o.numero_nota = ne.numero_nota AND o.id < ne.id)
+            ''')
+            copias = [(row['id'],) for row in cursor.fetchall()]
+            if renomear:
+                cursor.executemany("UPDATE notas_entrada SET numero_nota = numero_nota || '-' || id WHERE id = ?", copias)
+            else:
+                cursor.executemany('DELETE FROM notas_entrada WHERE id = ?', copias)
+    finally:
+        conn.execute('PRAGMA foreign_keys = ON')
+    return len(copias)
+
+SQL_RECONSTRUIR_SALDOS = '''
+    UPDATE notas_entrada
+    SET peso_carregado = COALESCE((SELECT SUM(ns.peso_saida) FROM notas_saida ns WHERE ns.numero_nota = notas_entrada.numero_nota), 0),
+        saldo = peso - COALESCE((SELECT SUM(ns.peso_saida) FROM notas_saida ns WHERE ns.numero_nota = notas_entrada.numero_nota), 0),
+        ctes = (SELECT GROUP_CONCAT(DISTINCT ns.numero_cte) FROM notas_saida ns WHERE ns.numero_nota = notas_entrada.numero_nota)
+'''
+
+def sql_recalcular_saldo(ref):
+    return f'''
+            UPDATE notas_entrada
+            SET peso_carregado = COALESCE((SELECT SUM(peso_saida) FROM notas_saida WHERE numero_nota = {ref}.numero_nota), 0),
+                saldo = peso - COALESCE((SELECT SUM(peso_saida) FROM notas_saida WHERE numero_nota = {ref}.numero_nota), 0),
+                ctes = (SELECT GROUP_CONCAT(DISTINCT numero_cte) FROM notas_saida WHERE numero_nota = {ref}.numero_nota)
+            WHERE numero_nota = {ref}.numero_nota;'''
+
+def migracao_saldos(cursor):
+    cursor.execute('ALTER TABLE notas_entrada ADD COLUMN peso_carregado REAL NOT NULL DEFAULT 0')
+    cursor.execute('ALTER TABLE notas_entrada ADD COLUMN saldo REAL NOT NULL DEFAULT 0')
+    cursor.execute('ALTER TABLE notas_entrada ADD COLUMN ctes TEXT')
     
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS notas_saida (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            numero_cte TEXT NOT NULL,
-            numero_nota TEXT NOT NULL,
-            peso_saida REAL NOT NULL,
-            valor_frete REAL NOT NULL,
-            data_saida TEXT NOT NULL,
-            FOREIGN KEY (numero_nota) REFERENCES notas_entrada (numero_nota)
+        CREATE TRIGGER IF NOT EXISTS trg_notas_saida_insert AFTER INSERT ON notas_saida
+        BEGIN
+            UPDATE notas_entrada
+            SET peso_carregado = peso_carregado + NEW.peso_saida,
+                saldo = peso - (peso_carregado + NEW.peso_saida),
+                ctes = CASE
+                    WHEN ctes IS NULL THEN NEW.numero_cte
+                    WHEN instr(',' || ctes || ',', ',' || NEW.numero_cte || ',') > 0 THEN ctes
+                    ELSE ctes || ',' || NEW.numero_cte
+                END
+            WHERE numero_nota = NEW.numero_nota;
+        END
+    ''')
+    
+    for evento, notas in (('DELETE', ('OLD',)), ('UPDATE', ('OLD', 'NEW'))):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_notas_saida_{evento.lower()} AFTER {evento} ON notas_saida
+            BEGIN{''.join(sql_recalcular_saldo(ref) for ref in notas)}
+            END
+        ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_notas_entrada_peso AFTER UPDATE OF peso ON notas_entrada
+        BEGIN
+            UPDATE notas_entrada SET saldo = NEW.peso - NEW.peso_carregado WHERE id = NEW.id;
+        END
+    ''')
+    
+    cursor.execute(SQL_RECONSTRUIR_SALDOS)
+
+def migracao_filtros_notas(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_entrada_cnpj_emitente ON notas_entrada (cnpj_emitente)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_entrada_cnpj_destinatario ON notas_entrada (cnpj_destinatario)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_entrada_abertas ON notas_entrada (data_emissao) WHERE saldo > 0')
+
+def migracao_ultima_movimentacao(cursor):
+    cursor.execute('ALTER TABLE containers ADD COLUMN ultima_movimentacao TEXT')
+    cursor.execute('''
+        UPDATE containers
+        SET ultima_movimentacao = (
+            SELECT MAX(rm.data_movimento) FROM registro_movimentacao rm WHERE rm.container_id = containers.id
         )
     ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_movimentacao_insert AFTER INSERT ON registro_movimentacao
+        BEGIN
+            UPDATE containers
+            SET ultima_movimentacao = NEW.data_movimento
+            WHERE id = NEW.container_id
+              AND (ultima_movimentacao IS NULL OR ultima_movimentacao < NEW.data_movimento);
+        END
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_containers_status_data ON containers (status, data_registro)')
+    cursor.execute('DROP INDEX IF EXISTS idx_containers_status')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_containers_armador_data ON containers (armador, data_registro)')
+
+# A dimensão produto é rateada pelos itens da nota (notas_itens), a mesma base de obter_resumo_produtos;
+# notas antigas sem itens entram apenas na dimensão cnpj
+DIMENSOES_ROLLUP = {
+    'entrada': {
+        'tabela': 'notas_entrada',
+        'dia': 'data_emissao',
+        'peso': 'peso',
+        'valor': 'valor',
+        'nota': 'ne.id = {ref}.id',
+        'peso_item': 'ni.peso_kg',
+        'valor_item': '{ref}.valor * ni.peso_kg / {ref}.peso',
+        'cnpj': '{ref}.cnpj_emitente',
+        'colunas': 'data_emissao, peso, valor, cnpj_emitente',
+    },
+    'saida': {
+        'tabela': 'notas_saida',
+        'dia': 'data_saida',
+        'peso': 'peso_saida',
+        'valor': 'valor_frete',
+        'nota': 'ne.numero_nota = {ref}.numero_nota',
+        'peso_item': '{ref}.peso_saida * ni.peso_kg / ne.peso',
+        'valor_item': '{ref}.valor_frete * ni.peso_kg / ne.peso',
+        'cnpj': '(SELECT ne.cnpj_emitente FROM notas_entrada ne WHERE ne.numero_nota = {ref}.numero_nota)',
+        'colunas': 'numero_nota, data_saida, peso_saida, valor_frete',
+    },
+}
+
+SQL_ACUMULAR_ROLLUP = '''
+            ON CONFLICT (tipo, dimensao, dia, chave) DO UPDATE SET
+                peso = peso + excluded.peso,
+                valor = valor + excluded.valor,
+                quantidade = quantidade + excluded.quantidade;'''
+
+def sql_dia_rollup(tipo, ref):
+    coluna = f"{ref}.{DIMENSOES_ROLLUP[tipo]['dia']}"
+    return f'COALESCE(date({coluna}), substr({coluna}, 1, 10))'
+
+def sql_rollup_itens(tipo, ref, sinal, filtro='', quantidade='1'):
+    config = DIMENSOES_ROLLUP[tipo]
+    return f'''
+            INSERT INTO rollup_diario (tipo, dimensao, dia, chave, peso, valor, quantidade)
+            SELECT '{tipo}', 'produto', {sql_dia_rollup(tipo, ref)}, ni.produto,
+                   {sinal}SUM({config['peso_item'].format(ref=ref)}), {sinal}SUM({config['valor_item'].format(ref=ref)}), {sinal}{quantidade}
+            FROM notas_entrada ne
+            JOIN notas_itens ni ON ni.nota_id = ne.id
+            WHERE {config['nota'].format(ref=ref)} AND ne.peso > 0{filtro}
+            GROUP BY ni.produto{SQL_ACUMULAR_ROLLUP}'''
+
+def sql_rollup_trigger(tipo, ref, sinal, itens=True):
+    config = DIMENSOES_ROLLUP[tipo]
+    dia = sql_dia_rollup(tipo, ref)
+    comandos = [f'''
+            INSERT INTO rollup_diario (tipo, dimensao, dia, chave, peso, valor, quantidade)
+            VALUES ('{tipo}', 'cnpj', {dia}, COALESCE({config['cnpj'].format(ref=ref)}, ''),
+                    {sinal}{ref}.{config['peso']}, {sinal}{ref}.{config['valor']}, {sinal}1){SQL_ACUMULAR_ROLLUP}''']
+    if itens:
+        comandos.append(sql_rollup_itens(tipo, ref, sinal))
+    if sinal == '-':
+        comandos.append(f"\n            DELETE FROM rollup_diario WHERE tipo = '{tipo}' AND dia = {dia} AND quantidade <= 0;")
+    return ''.join(comandos)
+
+def sql_reconstruir_rollups(sufixo=''):
+    comandos = ['DELETE FROM rollup_diario']
+    for tipo, config in DIMENSOES_ROLLUP.items():
+        dia = sql_dia_rollup(tipo, 'x')
+        comandos.append(f'''
+        INSERT INTO rollup_diario (tipo, dimensao, dia, chave, peso, valor, quantidade)
+        SELECT '{tipo}', 'cnpj', {dia} as dia,
+               COALESCE({config['cnpj'].format(ref='x').replace('FROM notas_entrada ', f'FROM notas_entrada{sufixo} ')}, '') as chave,
+               SUM(x.{config['peso']}), SUM(x.{config['valor']}), COUNT(*)
+        FROM {config['tabela']}{sufixo} x
+        GROUP BY dia, chave
+        ''')
+        comandos.append(f'''
+        INSERT INTO rollup_diario (tipo, dimensao, dia, chave, peso, valor, quantidade)
+        SELECT '{tipo}', 'produto', {dia} as dia, ni.produto,
+               SUM({config['peso_item'].format(ref='x')}), SUM({config['valor_item'].format(ref='x')}), COUNT(DISTINCT x.id)
+        FROM {config['tabela']}{sufixo} x
+        JOIN notas_entrada{sufixo} ne ON {config['nota'].format(ref='x')}
+        JOIN notas_itens{sufixo} ni ON ni.nota_id = ne.id
+        WHERE ne.peso > 0
+        GROUP BY dia, ni.produto
+        ''')
+    return comandos
+
+def criar_triggers_rollup(cursor):
+    for tipo, config in DIMENSOES_ROLLUP.items():
+        tabela = config['tabela']
+        for evento in ('insert', 'delete', 'update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS trg_rollup_{tipo}_{evento}')
+        # os itens da nota de entrada são gravados depois dela: o produto entra pelo gatilho de notas_itens
+        cursor.execute(f'''
+            CREATE TRIGGER trg_rollup_{tipo}_insert AFTER INSERT ON {tabela}
+            BEGIN{sql_rollup_trigger(tipo, 'NEW', '', itens=tipo != 'entrada')}
+            END
+        ''')
+        # BEFORE: a exclusão em cascata remove os itens antes de um gatilho AFTER conseguir ratear a nota.
+        # Exclusões feitas pelo arquivamento não descontam dos rollups
+        cursor.execute(f'''
+            CREATE TRIGGER trg_rollup_{tipo}_delete BEFORE DELETE ON {tabela}
+            {SEM_ARQUIVAMENTO}
+            BEGIN{sql_rollup_trigger(tipo, 'OLD', '-')}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER trg_rollup_{tipo}_update AFTER UPDATE OF {config['colunas']} ON {tabela}
+            BEGIN{sql_rollup_trigger(tipo, 'OLD', '-')}{sql_rollup_trigger(tipo, 'NEW', '')}
+            END
+        ''')
     
+    cursor.execute('DROP TRIGGER IF EXISTS trg_rollup_itens_insert')
+    primeiro_item_produto = (
+        'NOT EXISTS (SELECT 1 FROM notas_itens o WHERE o.nota_id = NEW.nota_id AND o.produto = NEW.produto AND o.id < NEW.id)'
+    )
+    cursor.execute(f'''
+        CREATE TRIGGER trg_rollup_itens_insert AFTER INSERT ON notas_itens
+        BEGIN{sql_rollup_itens('entrada', 'ne', '', ' AND ni.id = NEW.id', primeiro_item_produto)}
+        END
+    ''')
+
+def migracao_rollups(cursor):
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS containers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            numero_container TEXT NOT NULL UNIQUE,
+        CREATE TABLE IF NOT EXISTS rollup_diario (
             tipo TEXT NOT NULL,
-            armador TEXT NOT NULL,
-            status TEXT NOT NULL DEFAULT 'portaria',
-            local_atual TEXT NOT NULL DEFAULT 'portaria',
-            data_registro TEXT NOT NULL,
-            data_atualizacao TEXT NOT NULL
+            dimensao TEXT NOT NULL,
+            dia TEXT NOT NULL,
+            chave TEXT NOT NULL,
+            peso REAL NOT NULL DEFAULT 0,
+            valor REAL NOT NULL DEFAULT 0,
+            quantidade INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (tipo, dimensao, dia, chave)
+        ) WITHOUT ROWID
+    ''')
+    # gatilhos e carga inicial ficam em migracao_rollup_itens, que depende de notas_itens
+
+def migracao_indices_exportacao(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_saida_data_saida ON notas_saida (data_saida)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_movimentacao_data ON registro_movimentacao (data_movimento)')
+
+def migracao_deduplicacao(cursor):
+    cursor.execute('ALTER TABLE notas_entrada ADD COLUMN chave_acesso TEXT')
+    cursor.execute('ALTER TABLE notas_entrada ADD COLUMN hash_conteudo TEXT')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_notas_entrada_chave_acesso ON notas_entrada (chave_acesso)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_notas_entrada_hash_conteudo ON notas_entrada (hash_conteudo)')
+
+def migracao_itens(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notas_itens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nota_id INTEGER NOT NULL,
+            sequencia INTEGER NOT NULL,
+            produto TEXT NOT NULL,
+            quantidade REAL NOT NULL,
+            unidade TEXT NOT NULL,
+            peso_kg REAL NOT NULL,
+            FOREIGN KEY (nota_id) REFERENCES notas_entrada (id) ON DELETE CASCADE
         )
     ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_itens_nota ON notas_itens (nota_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_itens_produto ON notas_itens (produto, nota_id, peso_kg)')
     
+    # Notas antigas de um único item podem ser reconstruídas a partir do resumo; as demais ficam sem itens
+    cursor.execute('''
+        INSERT INTO notas_itens (nota_id, sequencia, produto, quantidade, unidade, peso_kg)
+        SELECT id, 1, produto, peso, 'KG', peso
+        FROM notas_entrada
+        WHERE produto NOT LIKE '% (+% itens)'
+    ''')
+
+def migracao_jobs(cursor):
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS registro_movimentacao (
+        CREATE TABLE IF NOT EXISTS jobs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            container_id INTEGER NOT NULL,
-            tipo_movimento TEXT NOT NULL,
-            data_movimento TEXT NOT NULL,
-            observacao TEXT,
-            FOREIGN KEY (container_id) REFERENCES containers (id)
+            arquivo TEXT NOT NULL,
+            nome_original TEXT,
+            hash_conteudo TEXT,
+            status TEXT NOT NULL DEFAULT 'pendente',
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            mensagem TEXT,
+            numero_nota TEXT,
+            resultado TEXT,
+            criado_em TEXT NOT NULL,
+            iniciado_em TEXT,
+            concluido_em TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)')
+
+def migracao_arquivos_processados(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS arquivos_processados (
+            caminho TEXT PRIMARY KEY,
+            tamanho INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            hash_conteudo TEXT,
+            status TEXT NOT NULL,
+            mensagem TEXT,
+            processado_em TEXT NOT NULL
+        )
+    ''')
+
+INDICES_BUSCA = {
+    'nota': {'fts': 'busca_notas', 'tabela': 'notas_entrada', 'colunas': ('numero_nota', 'chave_acesso', 'produto', 'cnpj_emitente', 'cnpj_destinatario')},
+    'cte': {'fts': 'busca_ctes', 'tabela': 'notas_saida', 'colunas': ('numero_cte', 'numero_nota')},
+    'container': {'fts': 'busca_containers', 'tabela': 'containers', 'colunas': ('numero_container', 'armador', 'tipo')},
+    'movimentacao': {'fts': 'busca_movimentacoes', 'tabela': 'registro_movimentacao', 'colunas': ('observacao',)},
+}
+
+def sql_busca_trigger(config, ref, remover):
+    colunas = ', '.join(config['colunas'])
+    valores = ', '.join(f'{ref}.{coluna}' for coluna in config['colunas'])
+    if remover:
+        return f"INSERT INTO {config['fts']} ({config['fts']}, rowid, {colunas}) VALUES ('delete', {ref}.id, {valores});"
+    return f"INSERT INTO {config['fts']} (rowid, {colunas}) VALUES ({ref}.id, {valores});"
+
+def migracao_busca(cursor):
+    for config in INDICES_BUSCA.values():
+        fts = config['fts']
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {', '.join(config['colunas'])},
+                content='{config['tabela']}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {config['tabela']}
+            BEGIN
+                {sql_busca_trigger(config, 'NEW', False)}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {config['tabela']}
+            BEGIN
+                {sql_busca_trigger(config, 'OLD', True)}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_update AFTER UPDATE OF {', '.join(config['colunas'])} ON {config['tabela']}
+            BEGIN
+                {sql_busca_trigger(config, 'OLD', True)}
+                {sql_busca_trigger(config, 'NEW', False)}
+            END
+        ''')
+        cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+SEM_ARQUIVAMENTO = 'WHEN NOT EXISTS (SELECT 1 FROM arquivamento_em_andamento)'
+
+def migracao_arquivo(cursor):
+    cursor.execute('CREATE TABLE IF NOT EXISTS arquivamento_em_andamento (ativo INTEGER NOT NULL)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notas_arquivadas (
+            numero_nota TEXT PRIMARY KEY,
+            chave_acesso TEXT,
+            hash_conteudo TEXT,
+            periodo TEXT NOT NULL
         )
     ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_arquivadas_chave ON notas_arquivadas (chave_acesso) WHERE chave_acesso IS NOT NULL')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_arquivadas_hash ON notas_arquivadas (hash_conteudo) WHERE hash_conteudo IS NOT NULL')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS totais_arquivados (
+            chave TEXT PRIMARY KEY,
+            valor REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    
+    # O número de uma nota arquivada continua reservado, como o UNIQUE de notas_entrada
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_notas_entrada_arquivada BEFORE INSERT ON notas_entrada
+        WHEN EXISTS (SELECT 1 FROM notas_arquivadas WHERE numero_nota = NEW.numero_nota)
+        BEGIN
+            SELECT RAISE(ABORT, 'UNIQUE constraint failed: notas_entrada.numero_nota (nota arquivada)');
+        END
+    ''')
     
-    conn.commit()
-    conn.close()
+    # Exclusões feitas pelo arquivamento não devolvem saldo (os rollups seguem a mesma regra em criar_triggers_rollup)
+    cursor.execute('DROP TRIGGER IF EXISTS trg_notas_saida_delete')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_notas_saida_delete AFTER DELETE ON notas_saida
+        {SEM_ARQUIVAMENTO}
+        BEGIN{sql_recalcular_saldo('OLD')}
+        END
+    ''')
 
-def inserir_nota_entrada(numero_nota, data_emissao, produto, peso, valor, cnpj_emitente, cnpj_destinatario):
-    conn = get_db()
-    cursor = conn.cursor()
+def migracao_rollup_itens(cursor):
+    criar_triggers_rollup(cursor)
+    # migrar_db anexa os arquivos antes da transação: o histórico arquivado também é reagregado
+    sufixo = SUFIXO_ARQUIVO if anexar_arquivos(cursor.connection) else ''
+    for comando in sql_reconstruir_rollups(sufixo):
+        cursor.execute(comando)
+
+def migracao_saldo_inicial(cursor):
+    # o saldo nasce do próprio peso: a coluna tem DEFAULT 0 e um INSERT que não o informasse criaria
+    # uma nota aparentemente carregada (e elegível ao arquivamento)
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_notas_entrada_saldo_insert AFTER INSERT ON notas_entrada
+        BEGIN
+            UPDATE notas_entrada SET saldo = NEW.peso - NEW.peso_carregado WHERE id = NEW.id;
+        END
+    ''')
+
+MIGRACOES = [
+    (1, migracao_indices),
+    (2, migracao_saldos),
+    (3, migracao_filtros_notas),
+    (4, migracao_ultima_movimentacao),
+    (5, migracao_rollups),
+    (6, migracao_indices_exportacao),
+    (7, migracao_deduplicacao),
+    (8, migracao_itens),
+    (9, migracao_jobs),
+    (10, migracao_arquivos_processados),
+    (11, migracao_busca),
+    (12, migracao_arquivo),
+    (13, migracao_rollup_itens),
+    (14, migracao_saldo_inicial),
+]
+
+def obter_versao_schema():
+    return get_db().execute('PRAGMA user_version').fetchone()[0]
+
+def migrar_db():
+    versao_atual = obter_versao_schema()
+    if versao_atual < MIGRACOES[-1][0]:
+        # ATTACH não é permitido dentro da transação da migração
+        anexar_arquivos()
+    
+    for versao, migracao in MIGRACOES:
+        if versao <= versao_atual:
+            continue
+        
+        with transacao() as cursor:
+            if obter_versao_schema() >= versao:
+                continue
+            migracao(cursor)
+            cursor.execute(f'PRAGMA user_version = {versao}')
+        
+        versao_atual = versao
+    
+    return versao_atual
+
+SQL_INSERIR_ITEM = '''
+    INSERT INTO notas_itens (nota_id, sequencia, produto, quantidade, unidade, peso_kg)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+def linhas_itens(nota_id, produtos):
+    return [
+        (nota_id, sequencia, p['nome'], p['quantidade'], p['unidade'], p['peso_kg'])
+        for sequencia, p in enumerate(produtos or [], 1)
+    ]
+
+def inserir_nota_entrada(numero_nota, data_emissao, produto, peso, valor, cnpj_emitente, cnpj_destinatario, chave_acesso=None, hash_conteudo=None, produtos=None):
     data_carregamento = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    cursor.execute('''
-        INSERT INTO notas_entrada (numero_nota, data_emissao, produto, peso, valor, cnpj_emitente, cnpj_destinatario, data_carregamento)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (numero_nota, data_emissao, produto, peso, valor, cnpj_emitente, cnpj_destinatario, data_carregamento))
+    with transacao() as cursor:
+        cursor.execute('''
+            INSERT INTO notas_entrada (numero_nota, data_emissao, produto, peso, valor, cnpj_emitente, cnpj_destinatario, data_carregamento, chave_acesso, hash_conteudo)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (numero_nota, data_emissao, produto, peso, valor, cnpj_emitente, cnpj_destinatario, data_carregamento, chave_acesso, hash_conteudo))
+        cursor.executemany(SQL_INSERIR_ITEM, linhas_itens(cursor.lastrowid, produtos))
     
-    conn.commit()
-    conn.close()
+    invalidar_cache_estatisticas()
+    eventos.publicar('notas', {'quantidade': 1, 'peso': peso, 'valor': valor, 'notas': [numero_nota]})
 
-def listar_notas_entrada():
-    conn = get_db()
-    cursor = conn.cursor()
+def buscar_existentes(cursor, coluna, valores, retorno=None, incluir_arquivadas=False):
+    retorno = retorno or coluna
+    tabelas = ('notas_entrada', 'notas_arquivadas') if incluir_arquivadas else ('notas_entrada',)
+    valores = list({v for v in valores if v})
+    existentes = {}
+    for inicio in range(0, len(valores), 500):
+        bloco = valores[inicio:inicio + 500]
+        cursor.execute(
+            ' UNION ALL '.join(f'SELECT {coluna}, {retorno} FROM {tabela} WHERE {coluna} IN ({",".join("?" * len(bloco))})' for tabela in tabelas),
+            bloco * len(tabelas)
+        )
+        existentes.update((row[0], row[1]) for row in cursor.fetchall())
+    return existentes
+
+def obter_notas_por_hash(hashes):
+    return buscar_existentes(get_db().cursor(), 'hash_conteudo', hashes, 'numero_nota', incluir_arquivadas=True)
+
+def inserir_notas_entrada_lote(notas):
+    if not notas:
+        return []
+    
+    data_carregamento = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    chaves_unicas = ('numero_nota', 'chave_acesso', 'hash_conteudo')
+    
+    with transacao() as cursor:
+        existentes = {
+            coluna: set(buscar_existentes(cursor, coluna, [n.get(coluna) for n in notas], incluir_arquivadas=True))
+            for coluna in chaves_unicas
+        }
+        
+        duplicadas = []
+        novas = []
+        for posicao, n in enumerate(notas):
+            if any(n.get(coluna) and n[coluna] in existentes[coluna] for coluna in chaves_unicas):
+                duplicadas.append(posicao)
+                continue
+            for coluna in chaves_unicas:
+                existentes[coluna].add(n.get(coluna))
+            novas.append(n)
+        
+        cursor.executemany('''
+            INSERT INTO notas_entrada (numero_nota, data_emissao, produto, peso, valor, cnpj_emitente, cnpj_destinatario, data_carregamento, chave_acesso, hash_conteudo)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (n['numero_nota'], n['data_emissao'], n['produto'], n['peso'], n['valor'],
+             n['cnpj_emitente'], n['cnpj_destinatario'], data_carregamento,
+             n.get('chave_acesso'), n.get('hash_conteudo'))
+            for n in novas
+        ])
+        
+        ids = buscar_existentes(cursor, 'numero_nota', [n['numero_nota'] for n in novas if n.get('produtos')], 'id')
+        cursor.executemany(SQL_INSERIR_ITEM, [
+            item
+            for n in novas if n['numero_nota'] in ids
+            for item in linhas_itens(ids[n['numero_nota']], n['produtos'])
+        ])
+    
+    invalidar_cache_estatisticas()
+    if novas:
+        eventos.publicar('notas', {
+            'quantidade': len(novas),
+            'peso': sum(n['peso'] for n in novas),
+            'valor': sum(n['valor'] for n in novas),
+            'notas': [n['numero_nota'] for n in novas[:LIMITE_NOTAS_EVENTO]]
+        })
+    return duplicadas
+
+def listar_notas_entrada(data_inicio=None, data_fim=None, produto=None, cnpj=None, com_saldo=False, apos=None, limite=None, incluir_arquivo=False):
+    condicoes = []
+    parametros = []
+    
+    if data_inicio:
+        condicoes.append('ne.data_emissao >= ?')
+        parametros.append(data_inicio)
+    if data_fim:
+        condicoes.append('ne.data_emissao <= ?')
+        parametros.append(data_fim)
+    if produto:
+        condicoes.append("ne.produto LIKE ? ESCAPE '\\'")
+        parametros.append('%' + produto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    if cnpj:
+        condicoes.append('(ne.cnpj_emitente = ? OR ne.cnpj_destinatario = ?)')
+        parametros.extend([cnpj, cnpj])
+    if com_saldo:
+        condicoes.append('ne.saldo > 0')
+    if apos:
+        condicoes.append('(ne.data_emissao, ne.id) < (?, ?)')
+        parametros.extend(apos)
+    
+    sql = f'SELECT ne.*, ne.ctes as numero_cte FROM {tabela_consulta("notas_entrada", incluir_arquivo)} ne'
+    if condicoes:
+        sql += ' WHERE ' + ' AND '.join(condicoes)
+    sql += ' ORDER BY ne.data_emissao DESC, ne.id DESC'
+    if limite:
+        sql += ' LIMIT ?'
+        parametros.append(limite)
+    
+    cursor = get_db().cursor()
+    cursor.execute(sql, parametros)
+    
+    return cursor.fetchall()
+
+def paginar_notas_entrada(limite, cursor=None, **filtros):
+    apos = decodificar_cursor(cursor, TIPOS_CURSOR_DATA_ID) if cursor else None
+    notas = listar_notas_entrada(apos=apos, limite=limite + 1, **filtros)
+    
+    proximo_cursor = None
+    if len(notas) > limite:
+        notas = notas[:limite]
+        proximo_cursor = codificar_cursor(notas[-1]['data_emissao'], notas[-1]['id'])
+    
+    return notas, proximo_cursor
+
+def obter_saldo_nota(numero_nota):
+    cursor = get_db().cursor()
+    
+    cursor.execute('SELECT saldo FROM notas_entrada WHERE numero_nota = ?', (numero_nota,))
+    
+    resultado = cursor.fetchone()
+    
+    if resultado:
+        return resultado['saldo']
+    return 0
+
+def verificar_saldos():
+    cursor = get_db().cursor()
     
     cursor.execute('''
         SELECT 
-            ne.*,
-            COALESCE(SUM(ns.peso_saida), 0) as peso_carregado,
-            GROUP_CONCAT(DISTINCT ns.numero_cte) as numero_cte
+            ne.numero_nota,
+            ne.peso_carregado,
+            ne.saldo,
+            COALESCE(s.total, 0) as peso_carregado_real,
+            ne.peso - COALESCE(s.total, 0) as saldo_real
         FROM notas_entrada ne
-        LEFT JOIN notas_saida ns ON ne.numero_nota = ns.numero_nota
-        GROUP BY ne.id
-        ORDER BY ne.data_emissao DESC
+        LEFT JOIN (
+            SELECT numero_nota, SUM(peso_saida) as total
+            FROM notas_saida
+            GROUP BY numero_nota
+        ) s ON s.numero_nota = ne.numero_nota
+        WHERE abs(ne.peso_carregado - COALESCE(s.total, 0)) > 0.000001
+           OR abs(ne.saldo - (ne.peso - COALESCE(s.total, 0))) > 0.000001
     ''')
     
-    notas = cursor.fetchall()
-    conn.close()
-    return notas
+    return cursor.fetchall()
 
-def obter_saldo_nota(numero_nota):
+def reconstruir_saldos():
+    with transacao() as cursor:
+        cursor.execute(SQL_RECONSTRUIR_SALDOS)
+        return cursor.rowcount
+
+BUCKETS_ANALYTICS = {
+    'dia': '{coluna}',
+    'semana': "date({coluna}, 'weekday 0', '-6 days')",
+    'mes': "strftime('%Y-%m-01', {coluna})",
+}
+
+def obter_analytics(tipo, periodo='mes', agrupar='produto', data_inicio=None, data_fim=None):
+    if tipo not in DIMENSOES_ROLLUP:
+        raise ValueError(f"Tipo de movimento inválido: {tipo}")
+    if periodo not in BUCKETS_ANALYTICS:
+        raise ValueError(f"Período inválido: {periodo}")
+    if agrupar not in ('produto', 'cnpj'):
+        raise ValueError(f"Agrupamento inválido: {agrupar}")
+    
+    condicoes = ['tipo = ?', 'dimensao = ?']
+    parametros = [tipo, agrupar]
+    if data_inicio:
+        condicoes.append('dia >= ?')
+        parametros.append(data_inicio)
+    if data_fim:
+        condicoes.append('dia <= ?')
+        parametros.append(data_fim)
+    
+    cursor = get_db().cursor()
+    cursor.execute(f'''
+        SELECT {BUCKETS_ANALYTICS[periodo].format(coluna='dia')} as periodo, chave, SUM(peso) as peso, SUM(valor) as valor, SUM(quantidade) as quantidade
+        FROM rollup_diario
+        WHERE {' AND '.join(condicoes)}
+        GROUP BY periodo, chave
+        ORDER BY periodo, chave
+    ''', parametros)
+    
+    return cursor.fetchall()
+
+def obter_resumo_produtos(produto=None, data_inicio=None, data_fim=None, periodo=None, incluir_arquivo=False):
+    if periodo is not None and periodo not in BUCKETS_ANALYTICS:
+        raise ValueError(f"Período inválido: {periodo}")
+    
+    condicoes = []
+    parametros = []
+    if produto:
+        condicoes.append('ni.produto = ?')
+        parametros.append(produto)
+    if data_inicio:
+        condicoes.append('ne.data_emissao >= ?')
+        parametros.append(data_inicio)
+    if data_fim:
+        condicoes.append('ne.data_emissao <= ?')
+        parametros.append(data_fim)
+    
+    agrupamento = ['ni.produto']
+    if periodo:
+        agrupamento.insert(0, BUCKETS_ANALYTICS[periodo].format(coluna='ne.data_emissao'))
+    
+    cursor = get_db().cursor()
+    cursor.execute(f'''
+        SELECT
+            {agrupamento[0] + ' as periodo,' if periodo else ''}
+            ni.produto,
+            COUNT(DISTINCT ni.nota_id) as notas,
+            SUM(ni.peso_kg) as peso,
+            SUM(CASE WHEN ne.peso > 0 THEN ni.peso_kg * ne.saldo / ne.peso ELSE 0 END) as saldo
+        FROM {tabela_consulta('notas_itens', incluir_arquivo)} ni
+        JOIN {tabela_consulta('notas_entrada', incluir_arquivo)} ne ON ne.id = ni.nota_id
+        {'WHERE ' + ' AND '.join(condicoes) if condicoes else ''}
+        GROUP BY {', '.join(agrupamento)}
+        ORDER BY {', '.join(agrupamento)}
+    ''', parametros)
+    
+    return cursor.fetchall()
+
+SQL_BUSCA = {
+    'nota': '''
+        SELECT ne.id, ne.numero_nota as titulo, ne.produto as descricao, ne.data_emissao as data, b.rank
+        FROM (SELECT rowid, rank FROM busca_notas WHERE busca_notas MATCH ? ORDER BY rowid DESC LIMIT ?) b
+        JOIN notas_entrada ne ON ne.id = b.rowid
+        ORDER BY b.rank LIMIT ?
+    ''',
+    'cte': '''
+        SELECT MIN(ns.id) as id, ns.numero_cte as titulo,
+               COUNT(*) || ' nota(s), ' || printf('%.2f', SUM(ns.peso_saida)) || ' kg' as descricao,
+               MAX(ns.data_saida) as data, MIN(b.rank) as rank
+        FROM (SELECT rowid, rank FROM busca_ctes WHERE busca_ctes MATCH ? ORDER BY rowid DESC LIMIT ?) b
+        JOIN notas_saida ns ON ns.id = b.rowid
+        GROUP BY ns.numero_cte
+        ORDER BY rank LIMIT ?
+    ''',
+    'container': '''
+        SELECT c.id, c.numero_container as titulo, c.armador || ' · ' || c.tipo || ' · ' || c.status as descricao,
+               c.data_registro as data, b.rank
+        FROM (SELECT rowid, rank FROM busca_containers WHERE busca_containers MATCH ? ORDER BY rowid DESC LIMIT ?) b
+        JOIN containers c ON c.id = b.rowid
+        ORDER BY b.rank LIMIT ?
+    ''',
+    'movimentacao': '''
+        SELECT rm.container_id as id, c.numero_container as titulo, rm.observacao as descricao,
+               rm.data_movimento as data, b.rank
+        FROM (SELECT rowid, rank FROM busca_movimentacoes WHERE busca_movimentacoes MATCH ? ORDER BY rowid DESC LIMIT ?) b
+        JOIN registro_movimentacao rm ON rm.id = b.rowid
+        JOIN containers c ON c.id = rm.container_id
+        ORDER BY b.rank LIMIT ?
+    ''',
+}
+
+CANDIDATOS_BUSCA = int(os.environ.get('CANDIDATOS_BUSCA', 1000))
+REGEX_NAO_ALFANUMERICO = re.compile(r'\W')
+REGEX_SEPARADOR_BUSCA = re.compile(r'[\W_]+')
+
+def montar_consulta_busca(texto, prefixo=True):
+    # O unicode61 quebra o valor indexado na pontuação (CTE-0001 vira "cte" "0001"), então um termo pontuado
+    # vira uma frase com as mesmas partes; a forma colada cobre valores gravados sem pontuação, como o CNPJ
+    sufixo = '*' if prefixo else ''
+    clausulas = []
+    for termo in (texto or '').split():
+        partes = [parte for parte in REGEX_SEPARADOR_BUSCA.split(termo) if parte]
+        if not partes:
+            continue
+        frase = f'"{" ".join(partes)}"{sufixo}'
+        if len(partes) > 1:
+            frase = f'({frase} OR "{"".join(partes)}"{sufixo})'
+        clausulas.append(frase)
+    return ' AND '.join(clausulas)
+
+def chave_resultado_busca(resultado):
+    if resultado['tipo'] == 'cte':
+        return ('cte', resultado['titulo'])
+    return (resultado['tipo'], resultado['id'], resultado['data'], resultado['descricao'])
+
+def buscar(texto, limite=20, tipos=None):
+    tipos = tipos or list(INDICES_BUSCA)
+    invalidos = [tipo for tipo in tipos if tipo not in INDICES_BUSCA]
+    if invalidos:
+        raise ValueError(f"Tipo de busca inválido: {', '.join(invalidos)}")
+    
+    consulta = montar_consulta_busca(texto)
+    if not consulta:
+        return []
+    
+    # Os índices FTS existem só no banco principal: registros já movidos para arquivo_YYYY.db não
+    # aparecem na busca (as listagens e /api/produtos com arquivo=1 cobrem o histórico).
+    # Termos muito frequentes casariam com milhões de linhas: o ranking por prefixo considera só os
+    # candidatos mais recentes. O token exato (número da nota, CNPJ, CTe, container) é consultado
+    # antes e não disputa o corte, para que um registro antigo buscado pela chave não fique de fora.
+    cursor = get_db().cursor()
+    resultados = {}
+    for exato, consulta_tipo in ((True, montar_consulta_busca(texto, prefixo=False)), (False, consulta)):
+        for tipo in tipos:
+            cursor.execute(SQL_BUSCA[tipo], (consulta_tipo, CANDIDATOS_BUSCA, limite))
+            for row in cursor.fetchall():
+                resultado = dict(row, tipo=tipo)
+                resultados.setdefault(chave_resultado_busca(resultado), (exato, resultado))
+    
+    texto_exato = REGEX_NAO_ALFANUMERICO.sub('', texto).lower()
+    ordenados = sorted(resultados.values(), key=lambda item: (
+        REGEX_NAO_ALFANUMERICO.sub('', item[1]['titulo'] or '').lower() != texto_exato, not item[0], item[1]['rank']
+    ))
+    return [resultado for _, resultado in ordenados[:limite]]
+
+def reconstruir_busca():
+    with transacao() as cursor:
+        for config in INDICES_BUSCA.values():
+            cursor.execute(f"INSERT INTO {config['fts']} ({config['fts']}) VALUES ('rebuild')")
+
+def reconstruir_rollups():
+    # os rollups cobrem também o histórico arquivado
+    sufixo = SUFIXO_ARQUIVO if anexar_arquivos() else ''
+    with transacao() as cursor:
+        for comando in sql_reconstruir_rollups(sufixo):
+            cursor.execute(comando)
+
+EXPORTACOES = {
+    'notas_entrada': {
+        'sql': '''
+            SELECT numero_nota, chave_acesso, data_emissao, produto, peso, peso_carregado, saldo, valor,
+                   cnpj_emitente, cnpj_destinatario, data_carregamento, ctes
+            FROM {notas_entrada}
+        ''',
+        'data': 'data_emissao',
+        'ordem': 'data_emissao, id',
+    },
+    'notas_saida': {
+        'sql': '''
+            SELECT numero_cte, numero_nota, peso_saida, valor_frete, data_saida
+            FROM {notas_saida}
+        ''',
+        'data': 'data_saida',
+        'ordem': 'data_saida, numero_cte, id',
+    },
+    'movimentacoes': {
+        'sql': '''
+            SELECT rm.id, c.numero_container, c.tipo, c.armador, rm.tipo_movimento, rm.data_movimento, rm.observacao
+            FROM {registro_movimentacao} rm
+            JOIN {containers} c ON c.id = rm.container_id
+        ''',
+        'data': 'rm.data_movimento',
+        'ordem': 'rm.data_movimento, rm.id',
+    },
+}
+
+def exportar_tabela(nome, data_inicio=None, data_fim=None, tamanho_lote=1000, incluir_arquivo=False):
+    exportacao = EXPORTACOES[nome]
+    condicoes = []
+    parametros = []
+    
+    if data_inicio:
+        condicoes.append(f"{exportacao['data']} >= ?")
+        parametros.append(data_inicio)
+    if data_fim:
+        condicoes.append(f"{exportacao['data']} < date(?, '+1 day')")
+        parametros.append(data_fim)
+    
+    conn = conectar()
+    try:
+        sufixo = SUFIXO_ARQUIVO if incluir_arquivo and anexar_arquivos(conn) else ''
+        sql = exportacao['sql'].format(**{tabela: tabela + sufixo for tabela in TABELAS_ARQUIVO})
+        if condicoes:
+            sql += ' WHERE ' + ' AND '.join(condicoes)
+        sql += f" ORDER BY {exportacao['ordem']}"
+        
+        conn.row_factory = None
+        cursor = conn.execute(sql, parametros)
+        yield tuple(coluna[0] for coluna in cursor.description)
+        
+        while True:
+            linhas = cursor.fetchmany(tamanho_lote)
+            if not linhas:
+                break
+            yield from linhas
+    finally:
+        conn.close()
+
+TABELAS_ARQUIVO = ('notas_entrada', 'notas_itens', 'notas_saida', 'containers', 'registro_movimentacao')
+INDICES_ARQUIVO = {
+    'notas_entrada': ('id', 'data_emissao, id', 'numero_nota'),
+    'notas_itens': ('id', 'nota_id'),
+    'notas_saida': ('id', 'numero_nota', 'data_saida'),
+    'containers': ('id', 'data_registro, id', 'numero_container'),
+    'registro_movimentacao': ('id', 'container_id', 'data_movimento'),
+}
+SUFIXO_ARQUIVO = '_com_arquivo'
+REGEX_ARQUIVO = re.compile(r'^arquivo_(\d{4})\.db$')
+
+def caminho_arquivo(periodo):
+    return os.path.abspath(os.path.join(ARQUIVO_DIRETORIO, f'arquivo_{periodo}.db'))
+
+def listar_arquivos():
+    if not os.path.isdir(ARQUIVO_DIRETORIO):
+        return []
+    periodos = sorted(m.group(1) for m in map(REGEX_ARQUIVO.match, os.listdir(ARQUIVO_DIRETORIO)) if m)
+    return [(periodo, caminho_arquivo(periodo)) for periodo in periodos]
+
+def colunas_tabela(conn, esquema, tabela):
+    return [row[1] for row in conn.execute(f'PRAGMA {esquema}.table_info({tabela})')]
+
+def criar_arquivo(conn, periodo):
+    caminho = caminho_arquivo(periodo)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = caminho + '.tmp'
+    if os.path.exists(temporario):
+        os.remove(temporario)
+    
+    # o esquema é criado sob nome temporário para que leitores nunca anexem um arquivo vazio
+    conn.execute('ATTACH DATABASE ? AS arquivo_novo', (temporario,))
+    try:
+        for tabela in TABELAS_ARQUIVO:
+            conn.execute(f'CREATE TABLE arquivo_novo.{tabela} AS SELECT * FROM main.{tabela} WHERE 0')
+            for posicao, colunas in enumerate(INDICES_ARQUIVO[tabela]):
+                unico = 'UNIQUE ' if colunas == 'id' else ''
+                conn.execute(f'CREATE {unico}INDEX arquivo_novo.idx_{tabela}_{posicao} ON {tabela} ({colunas})')
+    finally:
+        conn.execute('DETACH DATABASE arquivo_novo')
+    os.replace(temporario, caminho)
+
+def anexar_arquivos(conn=None):
+    conn = conn or get_db()
+    anexados = {row[1] for row in conn.execute('PRAGMA database_list')} - {'main', 'temp'}
+    arquivos = listar_arquivos()
+    
+    novos = [(periodo, caminho) for periodo, caminho in arquivos if f'arquivo_{periodo}' not in anexados]
+    if len(anexados) + len(novos) > conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):
+        raise ValueError('Arquivos demais para anexar; aumente o período do arquivamento ou consolide os arquivos')
+    for periodo, caminho in novos:
+        conn.execute(f'ATTACH DATABASE ? AS arquivo_{periodo}', (caminho,))
+    
+    esquemas = [f'arquivo_{periodo}' for periodo, _ in arquivos]
+    if novos or (esquemas and not conn.execute(
+        "SELECT 1 FROM sqlite_temp_master WHERE type = 'view' AND name = ?", (f'notas_entrada{SUFIXO_ARQUIVO}',)
+    ).fetchone()):
+        for tabela in TABELAS_ARQUIVO:
+            colunas = colunas_tabela(conn, 'main', tabela)
+            partes = [f"SELECT {', '.join(colunas)} FROM main.{tabela}"]
+            for esquema in esquemas:
+                existentes = set(colunas_tabela(conn, esquema, tabela))
+                selecao = ', '.join(coluna if coluna in existentes else f'NULL AS {coluna}' for coluna in colunas)
+                partes.append(f'SELECT {selecao} FROM {esquema}.{tabela}')
+            conn.execute(f'DROP VIEW IF EXISTS temp.{tabela}{SUFIXO_ARQUIVO}')
+            conn.execute(f"CREATE TEMP VIEW {tabela}{SUFIXO_ARQUIVO} AS {' UNION ALL '.join(partes)}")
+    return esquemas
+
+def tabela_consulta(tabela, incluir_arquivo=False, conn=None):
+    if incluir_arquivo and anexar_arquivos(conn):
+        return tabela + SUFIXO_ARQUIVO
+    return tabela
+
+def preparar_arquivo(periodo):
     conn = get_db()
-    cursor = conn.cursor()
+    if not os.path.exists(caminho_arquivo(periodo)):
+        criar_arquivo(conn, periodo)
+    anexar_arquivos(conn)
+    
+    esquema = f'arquivo_{periodo}'
+    for tabela in TABELAS_ARQUIVO:
+        existentes = set(colunas_tabela(conn, esquema, tabela))
+        for coluna in colunas_tabela(conn, 'main', tabela):
+            if coluna not in existentes:
+                conn.execute(f'ALTER TABLE {esquema}.{tabela} ADD COLUMN {coluna}')
+    return esquema
+
+def filtro_in(coluna, valores):
+    return f'{coluna} IN ({",".join("?" * len(valores))})'
+
+def copiar_para_arquivo(cursor, esquema, tabela, coluna, valores):
+    colunas = ', '.join(colunas_tabela(cursor.connection, 'main', tabela))
+    cursor.execute(f'''
+        INSERT OR IGNORE INTO {esquema}.{tabela} ({colunas})
+        SELECT {colunas} FROM main.{tabela} WHERE {filtro_in(coluna, valores)}
+    ''', valores)
+
+def conferir_copia(cursor, esquema, tabela, valores):
+    cursor.execute(f'SELECT COUNT(*) FROM {esquema}.{tabela} WHERE {filtro_in("id", valores)}', valores)
+    if cursor.fetchone()[0] != len(valores):
+        raise RuntimeError(f'Cópia de {tabela} para {esquema} incompleta; nada foi excluído')
+
+def somar_totais_arquivados(cursor, totais):
+    cursor.executemany('''
+        INSERT INTO totais_arquivados (chave, valor) VALUES (?, ?)
+        ON CONFLICT (chave) DO UPDATE SET valor = valor + excluded.valor
+    ''', [(chave, valor or 0) for chave, valor in totais.items()])
+
+def listar_notas_arquivaveis(corte, apos_id=0, limite=500):
+    cursor = get_db().cursor()
     
     cursor.execute('''
-        SELECT 
-            ne.peso,
-            COALESCE(SUM(ns.peso_saida), 0) as peso_saida_total
+        SELECT id, numero_nota, substr(data_emissao, 1, 4) as periodo
         FROM notas_entrada ne
-        LEFT JOIN notas_saida ns ON ne.numero_nota = ns.numero_nota
-        WHERE ne.numero_nota = ?
-        GROUP BY ne.numero_nota
-    ''', (numero_nota,))
+        WHERE id > ? AND saldo <= 0 AND data_emissao < ?
+          AND data_emissao GLOB '[0-9][0-9][0-9][0-9]-*'
+          AND NOT EXISTS (SELECT 1 FROM notas_saida ns WHERE ns.numero_nota = ne.numero_nota AND ns.data_saida >= ?)
+        ORDER BY id
+        LIMIT ?
+    ''', (apos_id, corte, corte, limite))
+    return cursor.fetchall()
+
+def listar_containers_arquivaveis(corte, apos_id=0, limite=500):
+    cursor = get_db().cursor()
     
-    resultado = cursor.fetchone()
-    conn.close()
+    cursor.execute('''
+        SELECT id, substr(data_registro, 1, 4) as periodo
+        FROM containers
+        WHERE id > ? AND status = 'liberado_saida' AND data_atualizacao < ?
+          AND data_registro GLOB '[0-9][0-9][0-9][0-9]-*'
+        ORDER BY id
+        LIMIT ?
+    ''', (apos_id, corte, limite))
+    return cursor.fetchall()
+
+def arquivar_notas(periodo, notas):
+    ids = [nota['id'] for nota in notas]
+    numeros = [nota['numero_nota'] for nota in notas]
+    esquema = preparar_arquivo(periodo)
     
-    if resultado:
-        saldo = resultado['peso'] - resultado['peso_saida_total']
-        return saldo
-    return 0
+    # Com o banco principal em WAL a transação não é atômica entre arquivos:
+    # primeiro a cópia é confirmada no arquivo, depois as linhas saem do banco principal
+    with transacao() as cursor:
+        copiar_para_arquivo(cursor, esquema, 'notas_entrada', 'id', ids)
+        copiar_para_arquivo(cursor, esquema, 'notas_itens', 'nota_id', ids)
+        copiar_para_arquivo(cursor, esquema, 'notas_saida', 'numero_nota', numeros)
+    
+    with transacao() as cursor:
+        conferir_copia(cursor, esquema, 'notas_entrada', ids)
+        cursor.execute('INSERT INTO arquivamento_em_andamento (ativo) VALUES (1)')
+        
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO notas_arquivadas (numero_nota, chave_acesso, hash_conteudo, periodo)
+            SELECT numero_nota, chave_acesso, hash_conteudo, ? FROM notas_entrada WHERE {filtro_in('id', ids)}
+        ''', [periodo] + ids)
+        
+        cursor.execute(f"SELECT SUM(peso), SUM(valor) FROM notas_entrada WHERE {filtro_in('id', ids)}", ids)
+        entrada_peso, entrada_valor = cursor.fetchone()
+        cursor.execute(f"SELECT SUM(peso_saida), SUM(valor_frete) FROM notas_saida WHERE {filtro_in('numero_nota', numeros)}", numeros)
+        saida_peso, saida_frete = cursor.fetchone()
+        somar_totais_arquivados(cursor, {
+            'notas': len(ids),
+            'entrada_peso': entrada_peso,
+            'entrada_valor': entrada_valor,
+            'saida_peso': saida_peso,
+            'saida_frete': saida_frete,
+        })
+        
+        cursor.execute(f"DELETE FROM notas_saida WHERE {filtro_in('numero_nota', numeros)}", numeros)
+        cursor.execute(f"DELETE FROM notas_entrada WHERE {filtro_in('id', ids)}", ids)
+        cursor.execute('DELETE FROM arquivamento_em_andamento')
+    
+    invalidar_cache_estatisticas()
+    return len(ids)
 
-def inserir_nota_saida(numero_cte, numero_nota, peso_saida, valor_frete, data_saida):
-    saldo_disponivel = obter_saldo_nota(numero_nota)
+def arquivar_containers(periodo, containers):
+    ids = [container['id'] for container in containers]
+    esquema = preparar_arquivo(periodo)
     
-    if peso_saida > saldo_disponivel:
-        raise ValueError(f"Peso de saída ({peso_saida} kg) excede o saldo disponível ({saldo_disponivel:.2f} kg) para a nota {numero_nota}")
+    with transacao() as cursor:
+        copiar_para_arquivo(cursor, esquema, 'containers', 'id', ids)
+        copiar_para_arquivo(cursor, esquema, 'registro_movimentacao', 'container_id', ids)
     
+    with transacao() as cursor:
+        conferir_copia(cursor, esquema, 'containers', ids)
+        cursor.execute(f"DELETE FROM registro_movimentacao WHERE {filtro_in('container_id', ids)}", ids)
+        cursor.execute(f"DELETE FROM containers WHERE {filtro_in('id', ids)}", ids)
+        somar_totais_arquivados(cursor, {'containers': len(ids)})
+    
+    invalidar_cache_estatisticas()
+    patio.arquivar(ids)
+    return len(ids)
+
+def compactar_banco():
     conn = get_db()
-    cursor = conn.cursor()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.execute('VACUUM')
+    conn.execute('PRAGMA optimize')
+
+def enfileirar_job(arquivo, nome_original, hash_conteudo):
+    criado_em = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    cursor.execute('''
-        INSERT INTO notas_saida (numero_cte, numero_nota, peso_saida, valor_frete, data_saida)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (numero_cte, numero_nota, peso_saida, valor_frete, data_saida))
+    with transacao() as cursor:
+        cursor.execute('''
+            INSERT INTO jobs (arquivo, nome_original, hash_conteudo, status, criado_em)
+            VALUES (?, ?, ?, 'pendente', ?)
+        ''', (arquivo, nome_original, hash_conteudo, criado_em))
+        return cursor.lastrowid
+
+def reservar_jobs(worker, limite):
+    iniciado_em = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    with transacao() as cursor:
+        cursor.execute('''
+            UPDATE jobs
+            SET status = 'processando', worker = ?, iniciado_em = ?, tentativas = tentativas + 1
+            WHERE id IN (SELECT id FROM jobs WHERE status = 'pendente' ORDER BY id LIMIT ?)
+            RETURNING id, arquivo, nome_original, hash_conteudo, tentativas
+        ''', (worker, iniciado_em, limite))
+        return sorted(cursor.fetchall(), key=lambda job: job['id'])
+
+def concluir_jobs(resultados):
+    concluido_em = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    conn.commit()
-    conn.close()
+    with transacao() as cursor:
+        cursor.executemany('''
+            UPDATE jobs
+            SET status = ?, mensagem = ?, numero_nota = ?, resultado = ?, concluido_em = ?,
+                worker = CASE WHEN ? = 'pendente' THEN NULL ELSE worker END
+            WHERE id = ?
+        ''', [
+            (status, mensagem, numero_nota, resultado, None if status == 'pendente' else concluido_em, status, job_id)
+            for job_id, (status, mensagem, numero_nota, resultado) in resultados.items()
+        ])
+
+def recuperar_jobs_travados(timeout_segundos, max_tentativas):
+    limite = (datetime.now() - timedelta(seconds=timeout_segundos)).strftime('%Y-%m-%d %H:%M:%S')
+    
+    with transacao() as cursor:
+        cursor.execute('''
+            UPDATE jobs
+            SET status = CASE WHEN tentativas >= ? THEN 'erro' ELSE 'pendente' END,
+                mensagem = CASE WHEN tentativas >= ? THEN 'Processamento interrompido repetidamente' ELSE mensagem END,
+                worker = NULL
+            WHERE status = 'processando' AND iniciado_em < ?
+        ''', (max_tentativas, max_tentativas, limite))
+        return cursor.rowcount
+
+def obter_job(job_id):
+    cursor = get_db().cursor()
+    cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+    return cursor.fetchone()
+
+def contar_jobs_pendentes_antes(job_id):
+    cursor = get_db().cursor()
+    cursor.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pendente' AND id < ?", (job_id,))
+    return cursor.fetchone()[0]
+
+def obter_arquivos_processados():
+    cursor = get_db().cursor()
+    cursor.execute('SELECT caminho, tamanho, mtime FROM arquivos_processados')
+    return {row['caminho']: (row['tamanho'], row['mtime']) for row in cursor.fetchall()}
+
+def registrar_arquivos_processados(registros):
+    processado_em = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    with transacao() as cursor:
+        cursor.executemany('''
+            INSERT INTO arquivos_processados (caminho, tamanho, mtime, hash_conteudo, status, mensagem, processado_em)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (caminho) DO UPDATE SET
+                tamanho = excluded.tamanho, mtime = excluded.mtime, hash_conteudo = excluded.hash_conteudo,
+                status = excluded.status, mensagem = excluded.mensagem, processado_em = excluded.processado_em
+        ''', [registro + (processado_em,) for registro in registros])
+
+def inserir_nota_saida(numero_cte, numero_nota, peso_saida, valor_frete, data_saida):
+    registrar_saida_cte(numero_cte, [{
+        'numero_nota': numero_nota,
+        'peso_saida': peso_saida,
+        'valor_frete': valor_frete
+    }], data_saida)
+
+def registrar_saida_cte(numero_cte, notas, data_saida):
+    if not notas:
+        raise ValueError("Nenhuma nota informada para o CTe")
+    
+    pesos = {}
+    for nota in notas:
+        if nota['peso_saida'] <= 0:
+            raise ValueError(f"Peso de saída inválido para a nota {nota['numero_nota']}")
+        pesos[nota['numero_nota']] = pesos.get(nota['numero_nota'], 0) + nota['peso_saida']
+    
+    with transacao() as cursor:
+        numeros = list(pesos)
+        saldos = {}
+        for inicio in range(0, len(numeros), 500):
+            bloco = numeros[inicio:inicio + 500]
+            cursor.execute(
+                f'SELECT numero_nota, saldo FROM notas_entrada WHERE numero_nota IN ({",".join("?" * len(bloco))})',
+                bloco
+            )
+            saldos.update((row['numero_nota'], row['saldo']) for row in cursor.fetchall())
+        
+        for numero_nota, peso_saida in pesos.items():
+            if numero_nota not in saldos:
+                raise ValueError(f"Nota {numero_nota} não encontrada")
+            if peso_saida > saldos[numero_nota]:
+                raise ValueError(f"Peso de saída ({peso_saida} kg) excede o saldo disponível ({saldos[numero_nota]:.2f} kg) para a nota {numero_nota}")
+        
+        cursor.executemany('''
+            INSERT INTO notas_saida (numero_cte, numero_nota, peso_saida, valor_frete, data_saida)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [
+            (numero_cte, nota['numero_nota'], nota['peso_saida'], nota['valor_frete'], data_saida)
+            for nota in notas
+        ])
+    
+    invalidar_cache_estatisticas()
+    eventos.publicar('cte', {
+        'numero_cte': numero_cte,
+        'quantidade': len(notas),
+        'peso': sum(pesos.values()),
+        'frete': sum(nota['valor_frete'] for nota in notas),
+        'notas': numeros[:LIMITE_NOTAS_EVENTO]
+    })
+    return len(notas)
 
 def obter_estatisticas():
-    conn = get_db()
-    cursor = conn.cursor()
+    return obter_em_cache('notas', calcular_estatisticas)
+
+def calcular_estatisticas():
+    cursor = get_db().cursor()
     
     cursor.execute('SELECT COALESCE(SUM(peso), 0) as total_peso, COALESCE(SUM(valor), 0) as total_valor FROM notas_entrada')
     entrada = cursor.fetchone()
@@ -147,158 +1389,328 @@ def obter_estatisticas():
     cursor.execute('SELECT COALESCE(SUM(peso_saida), 0) as total_peso, COALESCE(SUM(valor_frete), 0) as total_frete FROM notas_saida')
     saida = cursor.fetchone()
     
-    conn.close()
-    
+    arquivados = obter_totais_arquivados()
+    entrada_peso = entrada['total_peso'] + arquivados.get('entrada_peso', 0)
+    saida_peso = saida['total_peso'] + arquivados.get('saida_peso', 0)
     return {
-        'entrada_peso': entrada['total_peso'],
-        'entrada_valor': entrada['total_valor'],
-        'saida_peso': saida['total_peso'],
-        'saida_frete': saida['total_frete'],
-        'saldo_peso': entrada['total_peso'] - saida['total_peso']
+        'entrada_peso': entrada_peso,
+        'entrada_valor': entrada['total_valor'] + arquivados.get('entrada_valor', 0),
+        'saida_peso': saida_peso,
+        'saida_frete': saida['total_frete'] + arquivados.get('saida_frete', 0),
+        'saldo_peso': entrada_peso - saida_peso
     }
 
+def obter_totais_arquivados():
+    cursor = get_db().cursor()
+    
+    cursor.execute('SELECT chave, valor FROM totais_arquivados')
+    return {row['chave']: row['valor'] for row in cursor.fetchall()}
+
 def inserir_container(numero_container, tipo, armador, observacao=''):
-    conn = get_db()
-    cursor = conn.cursor()
     agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    cursor.execute('''
-        INSERT INTO containers (numero_container, tipo, armador, status, local_atual, data_registro, data_atualizacao)
-        VALUES (?, ?, ?, 'portaria', 'portaria', ?, ?)
-    ''', (numero_container, tipo, armador, agora, agora))
+    with transacao() as cursor:
+        cursor.execute('''
+            INSERT INTO containers (numero_container, tipo, armador, status, local_atual, data_registro, data_atualizacao)
+            VALUES (?, ?, ?, 'portaria', 'portaria', ?, ?)
+        ''', (numero_container, tipo, armador, agora, agora))
+        
+        container_id = cursor.lastrowid
+        
+        observacao = observacao or f'Container {numero_container} deu entrada na portaria'
+        cursor.execute('''
+            INSERT INTO registro_movimentacao (container_id, tipo_movimento, data_movimento, observacao)
+            VALUES (?, 'entrada_portaria', ?, ?)
+        ''', (container_id, agora, observacao))
+        movimento_id = cursor.lastrowid
     
-    container_id = cursor.lastrowid
+    invalidar_cache_estatisticas()
+    patio.registrar(container_id, numero_container, 'portaria')
+    eventos.publicar('container', dict(
+        evento_container(container_id, numero_container, tipo, armador, 'portaria', 'portaria', agora, agora, 'entrada_portaria', observacao),
+        status_anterior=None
+    ), movimento_id)
+    return container_id
+
+def listar_containers(status=None, armador=None, tipo=None, data_inicio=None, data_fim=None, apos=None, limite=None, incluir_arquivo=False):
+    condicoes = []
+    parametros = []
     
-    cursor.execute('''
-        INSERT INTO registro_movimentacao (container_id, tipo_movimento, data_movimento, observacao)
-        VALUES (?, 'entrada_portaria', ?, ?)
-    ''', (container_id, agora, observacao or f'Container {numero_container} deu entrada na portaria'))
+    if status:
+        condicoes.append('c.status = ?')
+        parametros.append(status)
+    if armador:
+        condicoes.append('c.armador = ?')
+        parametros.append(armador)
+    if tipo:
+        condicoes.append('c.tipo = ?')
+        parametros.append(tipo)
+    if data_inicio:
+        condicoes.append('c.data_registro >= ?')
+        parametros.append(data_inicio)
+    if data_fim:
+        condicoes.append("c.data_registro < date(?, '+1 day')")
+        parametros.append(data_fim)
+    if apos:
+        condicoes.append('(c.data_registro, c.id) < (?, ?)')
+        parametros.extend(apos)
     
-    conn.commit()
-    conn.close()
-    return container_id
+    sql = f'SELECT c.* FROM {tabela_consulta("containers", incluir_arquivo)} c'
+    if condicoes:
+        sql += ' WHERE ' + ' AND '.join(condicoes)
+    sql += ' ORDER BY c.data_registro DESC, c.id DESC'
+    if limite:
+        sql += ' LIMIT ?'
+        parametros.append(limite)
+    
+    cursor = get_db().cursor()
+    cursor.execute(sql, parametros)
+    
+    return cursor.fetchall()
 
-def listar_containers():
-    conn = get_db()
-    cursor = conn.cursor()
+def paginar_containers(limite, cursor=None, **filtros):
+    apos = decodificar_cursor(cursor, TIPOS_CURSOR_DATA_ID) if cursor else None
+    containers = listar_containers(apos=apos, limite=limite + 1, **filtros)
     
-    cursor.execute('''
-        SELECT 
-            c.*,
-            (SELECT MAX(rm.data_movimento) 
-             FROM registro_movimentacao rm 
-             WHERE rm.container_id = c.id) as ultima_movimentacao
-        FROM containers c
-        ORDER BY c.data_registro DESC
-    ''')
+    proximo_cursor = None
+    if len(containers) > limite:
+        containers = containers[:limite]
+        proximo_cursor = codificar_cursor(containers[-1]['data_registro'], containers[-1]['id'])
     
-    containers = cursor.fetchall()
-    conn.close()
-    return containers
+    return containers, proximo_cursor
 
-def obter_container(container_id):
-    conn = get_db()
-    cursor = conn.cursor()
+def listar_armadores():
+    cursor = get_db().cursor()
     
-    cursor.execute('SELECT * FROM containers WHERE id = ?', (container_id,))
-    container = cursor.fetchone()
-    conn.close()
-    return container
+    cursor.execute('SELECT DISTINCT armador FROM containers ORDER BY armador')
+    return [row['armador'] for row in cursor.fetchall()]
+
+def obter_container(container_id, incluir_arquivo=False):
+    cursor = get_db().cursor()
+    
+    cursor.execute(f'SELECT * FROM {tabela_consulta("containers", incluir_arquivo)} WHERE id = ?', (container_id,))
+    return cursor.fetchone()
 
 def obter_container_por_numero(numero_container):
-    conn = get_db()
-    cursor = conn.cursor()
+    cursor = get_db().cursor()
     
     cursor.execute('SELECT * FROM containers WHERE numero_container = ?', (numero_container,))
-    container = cursor.fetchone()
-    conn.close()
-    return container
+    return cursor.fetchone()
+
+def carregar_patio():
+    patio.iniciar_carga()
+    cursor = get_db().cursor()
+    
+    arquivados = obter_totais_arquivados().get('containers', 0)
+    cursor.execute('SELECT id, numero_container, status FROM containers')
+    return patio.substituir(cursor, int(arquivados))
+
+def obter_registro_container(container_id):
+    registro = patio.obter(container_id)
+    if registro is not None:
+        return registro
+    
+    # fora do índice (criado por outro processo desde a última reconciliação): consulta o banco
+    container = obter_container(container_id)
+    if container is None:
+        return None
+    patio.registrar(container['id'], container['numero_container'], container['status'])
+    return patio.RegistroContainer(container['id'], container['numero_container'], container['status'])
+
+def container_cadastrado(numero_container):
+    if patio.carregado():
+        return patio.obter_por_numero(numero_container) is not None
+    return obter_container_por_numero(numero_container) is not None
 
 def registrar_desova(container_id, observacao=''):
-    conn = get_db()
-    cursor = conn.cursor()
     agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    cursor.execute('''
-        UPDATE containers 
-        SET status = 'patio_vazio', local_atual = 'patio_vazio', data_atualizacao = ?
-        WHERE id = ?
-    ''', (agora, container_id))
+    with transacao() as cursor:
+        cursor.execute('SELECT * FROM containers WHERE id = ?', (container_id,))
+        container = cursor.fetchone()
+        if container is None:
+            raise ValueError('Container não encontrado')
+        
+        # a validação no índice pode estar defasada; a transação confere o status gravado
+        erro = patio.validar_transicao(container['status'], 'desova')
+        if erro:
+            patio.registrar(container_id, container['numero_container'], container['status'])
+            raise ValueError(erro)
+        
+        cursor.execute('''
+            UPDATE containers 
+            SET status = 'patio_vazio', local_atual = 'patio_vazio', data_atualizacao = ?
+            WHERE id = ?
+        ''', (agora, container_id))
+        
+        observacao = observacao or 'Container desovado e movido para pátio vazio'
+        cursor.execute('''
+            INSERT INTO registro_movimentacao (container_id, tipo_movimento, data_movimento, observacao)
+            VALUES (?, 'desova', ?, ?)
+        ''', (container_id, agora, observacao))
+        movimento_id = cursor.lastrowid
     
-    cursor.execute('''
-        INSERT INTO registro_movimentacao (container_id, tipo_movimento, data_movimento, observacao)
-        VALUES (?, 'desova', ?, ?)
-    ''', (container_id, agora, observacao or 'Container desovado e movido para pátio vazio'))
-    
-    conn.commit()
-    conn.close()
+    invalidar_cache_estatisticas()
+    patio.registrar(container_id, container['numero_container'], 'patio_vazio')
+    eventos.publicar('container', dict(
+        evento_container(
+            container_id, container['numero_container'], container['tipo'], container['armador'], 'patio_vazio',
+            'patio_vazio', container['data_registro'], agora, 'desova', observacao
+        ),
+        status_anterior=container['status']
+    ), movimento_id)
 
 def registrar_saida(container_id, observacao=''):
-    conn = get_db()
-    cursor = conn.cursor()
     agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    cursor.execute('''
-        UPDATE containers 
-        SET status = 'liberado_saida', data_atualizacao = ?
-        WHERE id = ?
-    ''', (agora, container_id))
+    with transacao() as cursor:
+        cursor.execute('SELECT * FROM containers WHERE id = ?', (container_id,))
+        container = cursor.fetchone()
+        if container is None:
+            raise ValueError('Container não encontrado')
+        
+        # a validação no índice pode estar defasada; a transação confere o status gravado
+        erro = patio.validar_transicao(container['status'], 'saida')
+        if erro:
+            patio.registrar(container_id, container['numero_container'], container['status'])
+            raise ValueError(erro)
+        
+        cursor.execute('''
+            UPDATE containers 
+            SET status = 'liberado_saida', data_atualizacao = ?
+            WHERE id = ?
+        ''', (agora, container_id))
+        
+        observacao = observacao or 'Container liberado para saída'
+        cursor.execute('''
+            INSERT INTO registro_movimentacao (container_id, tipo_movimento, data_movimento, observacao)
+            VALUES (?, 'saida', ?, ?)
+        ''', (container_id, agora, observacao))
+        movimento_id = cursor.lastrowid
     
-    cursor.execute('''
-        INSERT INTO registro_movimentacao (container_id, tipo_movimento, data_movimento, observacao)
-        VALUES (?, 'saida', ?, ?)
-    ''', (container_id, agora, observacao or 'Container liberado para saída'))
+    invalidar_cache_estatisticas()
+    patio.registrar(container_id, container['numero_container'], 'liberado_saida')
+    eventos.publicar('container', dict(
+        evento_container(
+            container_id, container['numero_container'], container['tipo'], container['armador'], 'liberado_saida',
+            container['local_atual'], container['data_registro'], agora, 'saida', observacao
+        ),
+        status_anterior=container['status']
+    ), movimento_id)
+
+def evento_container(container_id, numero_container, tipo, armador, status, local_atual, data_registro, data_movimento, tipo_movimento, observacao):
+    return {
+        'id': container_id,
+        'numero_container': numero_container,
+        'tipo': tipo,
+        'armador': armador,
+        'status': status,
+        'local_atual': local_atual,
+        'data_registro': data_registro,
+        'ultima_movimentacao': data_movimento,
+        'movimento': {'tipo_movimento': tipo_movimento, 'data_movimento': data_movimento, 'observacao': observacao}
+    }
+
+def obter_ultimo_movimento_id():
+    cursor = get_db().cursor()
     
-    conn.commit()
-    conn.close()
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM registro_movimentacao')
+    return cursor.fetchone()[0]
 
-def obter_historico_container(container_id):
-    conn = get_db()
-    cursor = conn.cursor()
+def listar_movimentacoes_desde(ultimo_id, limite):
+    cursor = get_db().cursor()
     
     cursor.execute('''
-        SELECT * FROM registro_movimentacao 
+        SELECT m.id AS movimento_id, m.tipo_movimento, m.data_movimento, m.observacao,
+               c.id, c.numero_container, c.tipo, c.armador, c.status, c.local_atual, c.data_registro
+        FROM registro_movimentacao m
+        JOIN containers c ON c.id = m.container_id
+        WHERE m.id > ?
+        ORDER BY m.id
+        LIMIT ?
+    ''', (ultimo_id, limite))
+    
+    return [
+        (row['movimento_id'], evento_container(
+            row['id'], row['numero_container'], row['tipo'], row['armador'], row['status'], row['local_atual'],
+            row['data_registro'], row['data_movimento'], row['tipo_movimento'], row['observacao']
+        ))
+        for row in cursor.fetchall()
+    ]
+
+def obter_historico_container(container_id, incluir_arquivo=False):
+    cursor = get_db().cursor()
+    
+    cursor.execute(f'''
+        SELECT * FROM {tabela_consulta('registro_movimentacao', incluir_arquivo)}
         WHERE container_id = ?
         ORDER BY data_movimento DESC
     ''', (container_id,))
     
-    movimentacoes = cursor.fetchall()
-    conn.close()
-    return movimentacoes
+    return cursor.fetchall()
 
 def obter_estatisticas_containers():
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT COUNT(*) as total FROM containers')
-    total = cursor.fetchone()['total']
-    
-    cursor.execute("SELECT COUNT(*) as count FROM containers WHERE status = 'portaria'")
-    portaria = cursor.fetchone()['count']
+    if patio.carregado():
+        return patio.contar()
+    return obter_em_cache('containers', calcular_estatisticas_containers)
+
+def calcular_estatisticas_containers():
+    cursor = get_db().cursor()
     
-    cursor.execute("SELECT COUNT(*) as count FROM containers WHERE status = 'patio_cheio'")
-    patio_cheio = cursor.fetchone()['count']
+    cursor.execute('SELECT status, COUNT(*) as count FROM containers GROUP BY status')
+    por_status = {row['status']: row['count'] for row in cursor.fetchall()}
     
-    cursor.execute("SELECT COUNT(*) as count FROM containers WHERE status = 'desova'")
-    desova = cursor.fetchone()['count']
+    # containers arquivados saíram todos como liberado_saida
+    arquivados = int(obter_totais_arquivados().get('containers', 0))
+    por_status['liberado_saida'] = por_status.get('liberado_saida', 0) + arquivados
     
-    cursor.execute("SELECT COUNT(*) as count FROM containers WHERE status = 'patio_vazio'")
-    patio_vazio = cursor.fetchone()['count']
+    estatisticas = {'total': sum(por_status.values())}
+    for status in STATUS_CONTAINERS:
+        estatisticas[status] = por_status.get(status, 0)
+    return estatisticas
+
+if __name__ == '__main__':
+    import argparse
     
-    cursor.execute("SELECT COUNT(*) as count FROM containers WHERE status = 'liberado_saida'")
-    liberado = cursor.fetchone()['count']
+    parser = argparse.ArgumentParser(description='Manutenção do banco de dados')
+    parser.add_argument('comando', nargs='?', default='init', choices=['init', 'verificar-saldos', 'reconstruir-saldos', 'reconstruir-rollups', 'reconstruir-busca', 'notas-duplicadas'])
+    resolucao = parser.add_mutually_exclusive_group()
+    resolucao.add_argument('--mesclar', action='store_true', help='notas-duplicadas: mantém a primeira importação de cada número e remove as cópias')
+    resolucao.add_argument('--renomear', action='store_true', help='notas-duplicadas: mantém a primeira importação e renomeia as cópias para numero-id')
+    args = parser.parse_args()
     
-    conn.close()
+    # as duplicidades impedem a migração do índice único, então este comando roda sem init_db
+    if args.comando != 'notas-duplicadas':
+        init_db()
     
-    return {
-        'total': total,
-        'portaria': portaria,
-        'patio_cheio': patio_cheio,
-        'desova': desova,
-        'patio_vazio': patio_vazio,
-        'liberado_saida': liberado
-    }
-
-if __name__ == '__main__':
-    init_db()
-    print("Banco de dados inicializado com sucesso!")
+    if args.comando == 'init':
+        print("Banco de dados inicializado com sucesso!")
+    elif args.comando == 'verificar-saldos':
+        divergentes = verificar_saldos()
+        for nota in divergentes:
+            print(f"Nota {nota['numero_nota']}: carregado {nota['peso_carregado']:.2f} kg (real {nota['peso_carregado_real']:.2f} kg), "
+                  f"saldo {nota['saldo']:.2f} kg (real {nota['saldo_real']:.2f} kg)")
+        print(f"{len(divergentes)} nota(s) com saldo divergente")
+        raise SystemExit(1 if divergentes else 0)
+    elif args.comando == 'reconstruir-saldos':
+        print(f"{reconstruir_saldos()} nota(s) com saldo recalculado")
+    elif args.comando == 'reconstruir-rollups':
+        reconstruir_rollups()
+        print("Tabelas de analytics recalculadas com sucesso!")
+    elif args.comando == 'reconstruir-busca':
+        reconstruir_busca()
+        print("Índices de busca reconstruídos com sucesso!")
+    elif args.comando == 'notas-duplicadas':
+        duplicadas = listar_notas_duplicadas()
+        primeira = {}
+        for nota in duplicadas:
+            original = primeira.setdefault(nota['numero_nota'], nota)
+            marcador = '' if nota is original else (' (cópia idêntica)' if tuple(nota)[2:] == tuple(original)[2:] else ' (cópia divergente)')
+            print(f"Nota {nota['numero_nota']} id {nota['id']}: {nota['data_emissao']} {nota['produto']} "
+                  f"{nota['peso']:.2f} kg R$ {nota['valor']:.2f} emitente {nota['cnpj_emitente']}{marcador}")
+        if args.mesclar or args.renomear:
+            acao = 'renomeada(s)' if args.renomear else 'removida(s)'
+            print(f"{resolver_notas_duplicadas(args.renomear)} cópia(s) {acao}; execute 'python database.py' para concluir a migração")
+        else:
+            print(f"{len(primeira)} número(s) de nota duplicado(s)")
+            raise SystemExit(1 if primeira else 0)
@@ -0,0 +1,78 @@
+import json
+import os
+import queue
+import threading
+
+MAX_ASSINANTES = int(os.environ.get('EVENTOS_MAX_ASSINANTES', 100))
+TAMANHO_FILA = int(os.environ.get('EVENTOS_TAMANHO_FILA', 256))
+INTERVALO_HEARTBEAT = float(os.environ.get('EVENTOS_HEARTBEAT', 15))
+TIPOS = ('container', 'notas', 'cte', 'estatisticas')
+
+lock = threading.Lock()
+assinantes = {}
+
+def formatar_evento(tipo, dados, id_evento=None):
+    linhas = [f'id: {id_evento}'] if id_evento is not None else []
+    linhas.append(f'event: {tipo}')
+    linhas.append(f"data: {json.dumps(dados, ensure_ascii=False, separators=(',', ':'))}")
+    return '\n'.join(linhas) + '\n\n'
+
+def assinar(tipos=None):
+    fila = queue.Queue(TAMANHO_FILA)
+    with lock:
+        if len(assinantes) >= MAX_ASSINANTES:
+            return None
+        assinantes[fila] = frozenset(tipos or TIPOS)
+    return fila
+
+def cancelar(fila):
+    with lock:
+        assinantes.pop(fila, None)
+
+def descartar(fila):
+    # assinante lento: esvazia a fila e encerra o stream; o navegador reconecta com Last-Event-ID
+    assinantes.pop(fila, None)
+    try:
+        while True:
+            fila.get_nowait()
+    except queue.Empty:
+        pass
+    fila.put_nowait(None)
+
+def publicar(tipo, dados, id_evento=None):
+    with lock:
+        if not assinantes:
+            return
+        item = (id_evento, formatar_evento(tipo, dados, id_evento))
+        for fila, tipos in list(assinantes.items()):
+            if tipo not in tipos:
+                continue
+            try:
+                fila.put_nowait(item)
+            except queue.Full:
+                descartar(fila)
+
+def contar_assinantes():
+    with lock:
+        return len(assinantes)
+
+def transmitir(fila, iniciais=(), ultimo_id=None):
+    try:
+        yield 'retry: 3000\n\n'
+        for item in iniciais:
+            yield item
+        
+        while True:
+            try:
+                item = fila.get(timeout=INTERVALO_HEARTBEAT)
+            except queue.Empty:
+                yield ': ping\n\n'
+                continue
+            if item is None:
+                return
+            id_evento, texto = item
+            if id_evento is not None and ultimo_id is not None and id_evento <= ultimo_id:
+                continue
+            yield texto
+    finally:
+        cancelar(fila)
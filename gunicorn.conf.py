@@ -0,0 +1,31 @@
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# O índice do pátio e os assinantes de eventos vivem na memória do processo e o SQLite
+# aceita um escritor por vez: um worker com threads atende as leituras em paralelo sem
+# dividir o estado. Mais workers exigem reconciliação do pátio e perdem eventos entre processos.
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+accesslog = os.environ.get('GUNICORN_ACCESSLOG') or None
+errorlog = '-'
+
+# cada stream de eventos prende uma thread até o navegador desconectar
+os.environ.setdefault('EVENTOS_MAX_ASSINANTES', str(max(1, threads // 2)))
+os.environ.setdefault('INICIAR_SERVICOS', '0')
+
+def pre_fork(server, worker):
+    # a conexão aberta pelo preload não pode ser herdada pelo worker
+    from database import fechar_db
+    fechar_db()
+
+def post_worker_init(worker):
+    from app import aquecer, iniciar_servicos
+    iniciar_servicos()
+    duracao = aquecer()
+    worker.log.info('Worker %s aquecido em %.0fms', worker.pid, duracao * 1000)
@@ -0,0 +1,182 @@
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+from database import (
+    init_db, inserir_notas_entrada_lote, obter_notas_por_hash, obter_arquivos_processados, registrar_arquivos_processados
+)
+from xml_parser import calcular_hash_xml, extrair_dados_nfe_lote, listar_xmls_zip
+
+EXTENSOES = ('.xml', '.zip')
+LOTE_MINIMO_PARALELO = 32
+
+def listar_arquivos_novos(diretorio, processados, idade_minima=0):
+    agora = time.time()
+    novos = []
+    for raiz, _, nomes in os.walk(diretorio):
+        for nome in nomes:
+            if not nome.lower().endswith(EXTENSOES):
+                continue
+            
+            caminho = os.path.abspath(os.path.join(raiz, nome))
+            try:
+                info = os.stat(caminho)
+            except OSError:
+                continue
+            
+            if processados.get(caminho) == (info.st_size, info.st_mtime):
+                continue
+            if agora - info.st_mtime < idade_minima:
+                continue
+            novos.append((caminho, info.st_size, info.st_mtime))
+    return sorted(novos)
+
+def ler_xmls(arquivos, estatisticas):
+    itens = []
+    hashes = {}
+    erros = {}
+    for indice, (caminho, _, _) in enumerate(arquivos):
+        try:
+            with open(caminho, 'rb') as arquivo:
+                conteudo = arquivo.read()
+        except OSError as e:
+            erros[indice] = str(e)
+            continue
+        
+        estatisticas['bytes'] += len(conteudo)
+        hashes[indice] = calcular_hash_xml(conteudo)
+        
+        if caminho.lower().endswith('.zip'):
+            try:
+                membros = listar_xmls_zip(conteudo)
+            except ValueError as e:
+                erros[indice] = str(e)
+                continue
+            for nome_membro, xml_bytes, erro in membros:
+                itens.append((indice, f'{caminho}/{nome_membro}', xml_bytes, erro))
+        else:
+            itens.append((indice, caminho, conteudo, None))
+    
+    return itens, hashes, erros
+
+def importar_lote(arquivos, workers, estatisticas):
+    itens, hashes_arquivos, erros_arquivos = ler_xmls(arquivos, estatisticas)
+    
+    hashes = [calcular_hash_xml(xml_bytes) if not erro else None for _, _, xml_bytes, erro in itens]
+    ja_importadas = obter_notas_por_hash(hashes)
+    
+    resultados = [None] * len(itens)
+    vistos = set()
+    validos = []
+    for posicao, (_, nome, xml_bytes, erro) in enumerate(itens):
+        if erro:
+            resultados[posicao] = ('erro', erro)
+        elif hashes[posicao] in ja_importadas or hashes[posicao] in vistos:
+            resultados[posicao] = ('ignorado', None)
+        else:
+            vistos.add(hashes[posicao])
+            validos.append(posicao)
+    
+    workers = workers if len(validos) >= LOTE_MINIMO_PARALELO else 1
+    notas = []
+    posicoes_notas = []
+    for posicao, (dados, erro) in zip(validos, extrair_dados_nfe_lote([itens[p][2] for p in validos], workers)):
+        if erro:
+            resultados[posicao] = ('erro', erro)
+            continue
+        dados['hash_conteudo'] = hashes[posicao]
+        notas.append(dados)
+        posicoes_notas.append(posicao)
+    
+    duplicadas = set(inserir_notas_entrada_lote(notas))
+    for indice_nota, posicao in enumerate(posicoes_notas):
+        resultados[posicao] = ('ignorado', None) if indice_nota in duplicadas else ('importado', None)
+    
+    resumo_arquivos = {indice: Counter() for indice in range(len(arquivos))}
+    primeiro_erro = dict(erros_arquivos)
+    for (indice, nome, _, _), (status, mensagem) in zip(itens, resultados):
+        resumo_arquivos[indice][status] += 1
+        estatisticas[status] += 1
+        if status == 'erro':
+            print(f'ERRO {nome}: {mensagem}', file=sys.stderr)
+            primeiro_erro.setdefault(indice, mensagem)
+    
+    registros = []
+    for indice, (caminho, tamanho, mtime) in enumerate(arquivos):
+        if indice in erros_arquivos:
+            print(f'ERRO {caminho}: {erros_arquivos[indice]}', file=sys.stderr)
+            estatisticas['erro'] += 1
+        resumo = resumo_arquivos[indice]
+        mensagem = primeiro_erro.get(indice) or f"{resumo['importado']} importada(s), {resumo['ignorado']} ignorada(s)"
+        status = 'erro' if indice in primeiro_erro else 'ok'
+        registros.append((caminho, tamanho, mtime, hashes_arquivos.get(indice), status, mensagem))
+    
+    registrar_arquivos_processados(registros)
+    estatisticas['arquivos'] += len(arquivos)
+    estatisticas['xmls'] += len(itens)
+
+def imprimir_estatisticas(estatisticas, duracao):
+    processamento = estatisticas['segundos_processando']
+    print(f"Arquivos lidos:     {estatisticas['arquivos']} ({estatisticas['xmls']} XML, {estatisticas['bytes'] / 1024 / 1024:.1f} MB)")
+    print(f"Notas importadas:   {estatisticas['importado']}")
+    print(f"Já importadas:      {estatisticas['ignorado']}")
+    print(f"Erros:              {estatisticas['erro']}")
+    if estatisticas['lotes_com_falha']:
+        print(f"Lotes com falha:    {estatisticas['lotes_com_falha']}")
+    print(f"Tempo total:        {duracao:.2f}s (processando {processamento:.2f}s)")
+    if processamento > 0:
+        print(f"Vazão:              {estatisticas['xmls'] / processamento * 60:.0f} XML/min, {estatisticas['importado'] / processamento * 60:.0f} notas/min")
+
+def main():
+    parser = argparse.ArgumentParser(description='Importa NF-e (XML ou ZIP) de um diretório')
+    parser.add_argument('diretorio', help='Diretório monitorado (percorrido recursivamente)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processos para leitura dos XML')
+    parser.add_argument('--lote', type=int, default=500, help='Arquivos por transação')
+    parser.add_argument('--observar', action='store_true', help='Continua verificando o diretório por novos arquivos')
+    parser.add_argument('--intervalo', type=float, default=5.0, help='Segundos entre verificações no modo --observar')
+    parser.add_argument('--idade-minima', type=float, default=None, help='Ignora arquivos modificados há menos de N segundos')
+    args = parser.parse_args()
+    
+    if not os.path.isdir(args.diretorio):
+        parser.error(f'Diretório não encontrado: {args.diretorio}')
+    idade_minima = args.idade_minima if args.idade_minima is not None else (2.0 if args.observar else 0)
+    
+    init_db()
+    processados = obter_arquivos_processados()
+    estatisticas = Counter()
+    inicio = time.perf_counter()
+    
+    try:
+        while True:
+            novos = listar_arquivos_novos(args.diretorio, processados, idade_minima)
+            for posicao in range(0, len(novos), args.lote):
+                lote = novos[posicao:posicao + args.lote]
+                inicio_lote = time.perf_counter()
+                parcial = Counter()
+                try:
+                    importar_lote(lote, args.workers, parcial)
+                except Exception as e:
+                    # no modo --observar um lote com falha (banco travado, arquivo inesperado) não derruba o
+                    # monitoramento: fica fora de processados e é tentado de novo na próxima verificação
+                    if not args.observar:
+                        raise
+                    estatisticas['lotes_com_falha'] += 1
+                    print(f'ERRO lote {lote[0][0]} .. {lote[-1][0]}: {type(e).__name__}: {e}', file=sys.stderr)
+                    continue
+                estatisticas.update(parcial)
+                estatisticas['segundos_processando'] += time.perf_counter() - inicio_lote
+                processados.update((caminho, (tamanho, mtime)) for caminho, tamanho, mtime in lote)
+                print(f"{estatisticas['arquivos']} arquivo(s) processado(s), {estatisticas['importado']} nota(s) importada(s)")
+            
+            if not args.observar:
+                break
+            time.sleep(args.intervalo)
+    except KeyboardInterrupt:
+        pass
+    
+    imprimir_estatisticas(estatisticas, time.perf_counter() - inicio)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from database import (
+    init_db, reservar_jobs, concluir_jobs, recuperar_jobs_travados, inserir_notas_entrada_lote, obter_notas_por_hash
+)
+import metricas
+from xml_parser import extrair_dados_nfe_seguro
+
+LOTE_JOBS = int(os.environ.get('INGESTAO_LOTE', 50))
+INTERVALO_OCIOSO = float(os.environ.get('INGESTAO_INTERVALO', 0.5))
+TIMEOUT_JOB = int(os.environ.get('INGESTAO_TIMEOUT', 300))
+MAX_TENTATIVAS = int(os.environ.get('INGESTAO_TENTATIVAS', 3))
+ESPERA_ERRO = float(os.environ.get('INGESTAO_ESPERA_ERRO', 1.0))
+ESPERA_ERRO_MAXIMA = float(os.environ.get('INGESTAO_ESPERA_ERRO_MAXIMA', 60.0))
+
+logger = logging.getLogger('controle_notas.ingestao')
+threads_workers = []
+
+def resumo_dados(dados):
+    return json.dumps({chave: valor for chave, valor in dados.items() if chave != 'hash_conteudo'}, ensure_ascii=False)
+
+def processar_lote(worker, limite=LOTE_JOBS):
+    jobs = reservar_jobs(worker, limite)
+    if not jobs:
+        return 0
+    
+    resultados = {}
+    ja_importadas = obter_notas_por_hash(job['hash_conteudo'] for job in jobs)
+    
+    notas = []
+    jobs_notas = []
+    for job in jobs:
+        if job['hash_conteudo'] in ja_importadas:
+            numero_nota = ja_importadas[job['hash_conteudo']]
+            resultados[job['id']] = ('ignorado', f'Arquivo já importado (nota fiscal {numero_nota})', numero_nota, None)
+            continue
+        
+        try:
+            with open(job['arquivo'], 'rb') as arquivo:
+                xml_bytes = arquivo.read()
+        except OSError as e:
+            resultados[job['id']] = ('erro', f'Arquivo indisponível: {e}', None, None)
+            continue
+        
+        dados, erro = extrair_dados_nfe_seguro(xml_bytes)
+        if erro:
+            resultados[job['id']] = ('erro', erro, None, None)
+            continue
+        
+        dados['hash_conteudo'] = job['hash_conteudo']
+        notas.append(dados)
+        jobs_notas.append(job)
+    
+    try:
+        duplicadas = set(inserir_notas_entrada_lote(notas))
+    except Exception as e:
+        for job in jobs_notas:
+            status = 'pendente' if job['tentativas'] < MAX_TENTATIVAS else 'erro'
+            resultados[job['id']] = (status, f'Erro ao gravar lote: {str(e)}', None, None)
+    else:
+        for posicao, (job, dados) in enumerate(zip(jobs_notas, notas)):
+            if posicao in duplicadas:
+                resultados[job['id']] = ('ignorado', f'Nota fiscal {dados["numero_nota"]} já está cadastrada', dados['numero_nota'], None)
+            else:
+                resultados[job['id']] = ('concluido', f'Nota fiscal {dados["numero_nota"]} carregada com sucesso!', dados['numero_nota'], resumo_dados(dados))
+    
+    concluir_jobs(resultados)
+    return len(jobs)
+
+def executar_worker(worker, parar=None, ate_esvaziar=False):
+    parar = parar or threading.Event()
+    processados = 0
+    falhas = 0
+    recuperar = True
+    while not parar.is_set():
+        # "database is locked" (importador, arquivamento ou VACUUM segurando a escrita além do busy_timeout)
+        # não pode encerrar o worker: jobs já reservados voltam à fila por recuperar_jobs_travados
+        try:
+            if recuperar:
+                recuperar_jobs_travados(TIMEOUT_JOB, MAX_TENTATIVAS)
+                recuperar = False
+            quantidade = processar_lote(worker)
+        except Exception:
+            falhas += 1
+            metricas.incrementar('app_ingestao_falhas_total')
+            logger.exception('Falha no worker de ingestão %s (%d seguida(s))', worker, falhas)
+            parar.wait(min(ESPERA_ERRO * 2 ** (falhas - 1), ESPERA_ERRO_MAXIMA))
+            continue
+        
+        falhas = 0
+        processados += quantidade
+        if quantidade:
+            continue
+        if ate_esvaziar:
+            break
+        recuperar = True
+        parar.wait(INTERVALO_OCIOSO)
+    return processados
+
+def identificar_worker(indice):
+    return f'{socket.gethostname()}:{os.getpid()}:{indice}'
+
+def iniciar_workers_thread(quantidade):
+    parar = threading.Event()
+    for indice in range(quantidade):
+        thread = threading.Thread(
+            target=executar_worker, args=(identificar_worker(indice), parar),
+            name=f'ingestao-{indice}', daemon=True
+        )
+        thread.start()
+        threads_workers.append(thread)
+    return parar
+
+def workers_thread_ativos():
+    return all(thread.is_alive() for thread in threads_workers)
+
+def executar_processo(indice, ate_esvaziar):
+    try:
+        executar_worker(identificar_worker(indice), ate_esvaziar=ate_esvaziar)
+    except KeyboardInterrupt:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description='Processa a fila de importação de NF-e')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Quantidade de processos de ingestão')
+    parser.add_argument('--ate-esvaziar', action='store_true', help='Encerra quando a fila estiver vazia')
+    args = parser.parse_args()
+    
+    init_db()
+    
+    inicio = time.perf_counter()
+    processos = [
+        multiprocessing.Process(target=executar_processo, args=(indice, args.ate_esvaziar))
+        for indice in range(args.workers)
+    ]
+    for processo in processos:
+        processo.start()
+    try:
+        for processo in processos:
+            processo.join()
+    except KeyboardInterrupt:
+        for processo in processos:
+            processo.join()
+    
+    print(f'Fila processada em {time.perf_counter() - inicio:.2f}s com {args.workers} worker(s)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+SQL_LENTO_MS = float(os.environ.get('SQL_LENTO_MS', 100))
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONTAGEM = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+DESCRICOES = {
+    'app_requisicao_duracao_segundos': ('histogram', 'Duração das requisições HTTP por rota'),
+    'app_requisicao_conexoes': ('histogram', 'Conexões SQLite abertas durante cada requisição'),
+    'app_requisicao_consultas_sql': ('histogram', 'Comandos SQL executados durante cada requisição'),
+    'app_sql_duracao_segundos': ('histogram', 'Duração dos comandos SQL por operação e tabela'),
+    'app_sqlite_conexoes_abertas_total': ('counter', 'Conexões SQLite abertas pelo processo'),
+    'app_sql_consultas_lentas_total': ('counter', 'Comandos SQL acima do limite de consulta lenta'),
+    'app_sql_esperas_lock_total': ('counter', 'BEGIN/COMMIT/ROLLBACK acima do limite de consulta lenta (espera pelo lock de escrita)'),
+    'app_patio_divergencias_total': ('counter', 'Containers corrigidos no índice do pátio pela reconciliação'),
+    'app_xml_decodificacao_total': ('counter', 'XML decodificados por caminho de detecção de encoding'),
+    'app_ingestao_falhas_total': ('counter', 'Iterações do worker de ingestão interrompidas por erro'),
+}
+
+REGEX_OPERACAO = re.compile(r'^\s*(\w+)')
+CONTROLE_TRANSACAO = ('BEGIN', 'COMMIT', 'END', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+REGEX_TABELA = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(\w+)', re.IGNORECASE)
+
+logger = logging.getLogger('controle_notas.sql')
+lock = threading.Lock()
+histogramas = {}
+contadores = Counter()
+contexto = threading.local()
+
+def observar(nome, rotulos, valor, buckets=BUCKETS):
+    with lock:
+        histograma = histogramas.get((nome, rotulos))
+        if histograma is None:
+            histograma = histogramas[(nome, rotulos)] = {'buckets': buckets, 'contagens': [0] * len(buckets), 'soma': 0.0, 'total': 0}
+        for indice, limite in enumerate(buckets):
+            if valor <= limite:
+                histograma['contagens'][indice] += 1
+        histograma['soma'] += valor
+        histograma['total'] += 1
+
+def incrementar(nome, rotulos=(), valor=1):
+    with lock:
+        contadores[(nome, rotulos)] += valor
+
+def obter_contadores(nome):
+    with lock:
+        return {rotulos: valor for (chave, rotulos), valor in contadores.items() if chave == nome}
+
+def rotulo_sql(sql):
+    operacao = REGEX_OPERACAO.match(sql)
+    operacao = operacao.group(1).upper() if operacao else '?'
+    if operacao == 'PRAGMA':
+        return f"PRAGMA {sql.split()[1].split('=')[0]}"
+    tabela = REGEX_TABELA.search(sql)
+    return f'{operacao} {tabela.group(1)}' if tabela else operacao
+
+def explicar(conexao, sql, parametros):
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    try:
+        cursor = sqlite3.Cursor(conexao)
+        linhas = cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parametros).fetchall()
+        return ' | '.join(linha[3] for linha in linhas)
+    except sqlite3.Error:
+        return None
+
+def registrar_sql(conexao, sql, parametros, duracao):
+    observar('app_sql_duracao_segundos', (('consulta', rotulo_sql(sql)),), duracao)
+    
+    if getattr(contexto, 'ativo', False):
+        contexto.consultas += 1
+        contexto.tempo_sql += duracao
+    
+    if duracao * 1000 < SQL_LENTO_MS:
+        return
+    
+    # BEGIN IMMEDIATE lento é espera pelo busy_timeout, não um problema da consulta
+    if sql.lstrip().upper().startswith(CONTROLE_TRANSACAO):
+        incrementar('app_sql_esperas_lock_total')
+        return
+    
+    incrementar('app_sql_consultas_lentas_total')
+    # executemany (parametros None) mede o lote inteiro: conta e registra, mas sem plano
+    plano = explicar(conexao, sql, parametros) if parametros is not None else 'lote executemany'
+    logger.warning('Consulta lenta (%.1f ms): %s | plano: %s', duracao * 1000, ' '.join(sql.split()), plano)
+
+class CursorInstrumentado(sqlite3.Cursor):
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            registrar_sql(self.connection, sql, parametros, time.perf_counter() - inicio)
+    
+    def executemany(self, sql, parametros):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            registrar_sql(self.connection, sql, None, time.perf_counter() - inicio)
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+    
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+def registrar_conexao():
+    incrementar('app_sqlite_conexoes_abertas_total')
+    if getattr(contexto, 'ativo', False):
+        contexto.conexoes += 1
+
+def iniciar_requisicao():
+    contexto.ativo = True
+    contexto.inicio = time.perf_counter()
+    contexto.conexoes = 0
+    contexto.consultas = 0
+    contexto.tempo_sql = 0.0
+
+def finalizar_requisicao(rota, metodo, status):
+    if not getattr(contexto, 'ativo', False):
+        return None
+    contexto.ativo = False
+    
+    duracao = time.perf_counter() - contexto.inicio
+    observar('app_requisicao_duracao_segundos', (('rota', rota), ('metodo', metodo), ('status', str(status))), duracao)
+    observar('app_requisicao_conexoes', (('rota', rota),), contexto.conexoes, BUCKETS_CONTAGEM)
+    observar('app_requisicao_consultas_sql', (('rota', rota),), contexto.consultas, BUCKETS_CONTAGEM)
+    return duracao, contexto.tempo_sql, contexto.consultas
+
+def escapar_rotulo(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def formatar_rotulos(rotulos):
+    if not rotulos:
+        return ''
+    return '{' + ','.join(f'{chave}="{escapar_rotulo(valor)}"' for chave, valor in rotulos) + '}'
+
+def exportar_prometheus():
+    with lock:
+        copia_histogramas = {chave: dict(h, contagens=list(h['contagens'])) for chave, h in histogramas.items()}
+        copia_contadores = dict(contadores)
+    
+    linhas = []
+    for nome, (tipo, descricao) in DESCRICOES.items():
+        linhas.append(f'# HELP {nome} {descricao}')
+        linhas.append(f'# TYPE {nome} {tipo}')
+        
+        if tipo == 'counter':
+            series = {rotulos: valor for (chave, rotulos), valor in copia_contadores.items() if chave == nome} or {(): 0}
+            for rotulos, valor in sorted(series.items()):
+                linhas.append(f'{nome}{formatar_rotulos(rotulos)} {valor}')
+            continue
+        
+        for (chave, rotulos), histograma in sorted(copia_histogramas.items()):
+            if chave != nome:
+                continue
+            for limite, contagem in zip(histograma['buckets'], histograma['contagens']):
+                linhas.append(f'{nome}_bucket{formatar_rotulos(rotulos + (("le", limite),))} {contagem}')
+            linhas.append(f'{nome}_bucket{formatar_rotulos(rotulos + (("le", "+Inf"),))} {histograma["total"]}')
+            linhas.append(f'{nome}_sum{formatar_rotulos(rotulos)} {histograma["soma"]:.6f}')
+            linhas.append(f'{nome}_count{formatar_rotulos(rotulos)} {histograma["total"]}')
+    
+    return '\n'.join(linhas) + '\n'
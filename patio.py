@@ -0,0 +1,137 @@
+import logging
+import threading
+from collections import Counter
+
+import metricas
+
+STATUS_CONTAINERS = ('portaria', 'patio_cheio', 'desova', 'patio_vazio', 'liberado_saida')
+STATUS_INTERNOS = {status: status for status in STATUS_CONTAINERS}
+BLOQUEIOS = {
+    'desova': {'patio_vazio': 'Container já foi desovado', 'liberado_saida': 'Container já saiu'},
+    'saida': {'liberado_saida': 'Container já foi liberado para saída'},
+}
+
+logger = logging.getLogger('controle_notas.patio')
+lock = threading.Lock()
+por_id = {}
+por_numero = {}
+contagens = Counter()
+estado = {'carregado': False, 'alteracoes': None, 'arquivados': 0}
+
+class RegistroContainer:
+    __slots__ = ('id', 'numero_container', 'status')
+    
+    def __init__(self, container_id, numero_container, status):
+        self.id = container_id
+        self.numero_container = numero_container
+        self.status = status
+
+def validar_transicao(status, movimento):
+    return BLOQUEIOS[movimento].get(status)
+
+def carregado():
+    return estado['carregado']
+
+def aplicar(indice_id, indice_numero, contador, container_id, numero_container, status):
+    # o SQLite devolve uma string nova por linha; reaproveita a constante do status
+    status = STATUS_INTERNOS.get(status, status)
+    registro = indice_id.get(container_id)
+    if registro is None:
+        registro = indice_id[container_id] = RegistroContainer(container_id, numero_container, status)
+        indice_numero[numero_container] = registro
+    else:
+        contador[registro.status] -= 1
+        registro.status = status
+    contador[status] += 1
+
+def registrar(container_id, numero_container, status):
+    with lock:
+        if estado['alteracoes'] is not None:
+            estado['alteracoes'][container_id] = (numero_container, status)
+        if estado['carregado']:
+            aplicar(por_id, por_numero, contagens, container_id, numero_container, status)
+
+def arquivar(container_ids):
+    with lock:
+        for container_id in container_ids:
+            if estado['alteracoes'] is not None:
+                estado['alteracoes'][container_id] = None
+            registro = por_id.pop(container_id, None)
+            if registro is not None:
+                por_numero.pop(registro.numero_container, None)
+                contagens[registro.status] -= 1
+                estado['arquivados'] += 1
+
+def iniciar_carga():
+    with lock:
+        estado['alteracoes'] = {}
+
+def substituir(linhas, arquivados=0):
+    novo_id = {}
+    novo_numero = {}
+    novas_contagens = Counter()
+    for container_id, numero_container, status in linhas:
+        aplicar(novo_id, novo_numero, novas_contagens, container_id, numero_container, status)
+    
+    with lock:
+        # gravações concluídas durante a leitura são mais novas que o snapshot
+        for container_id, alteracao in (estado['alteracoes'] or {}).items():
+            if alteracao is None:
+                registro = novo_id.pop(container_id, None)
+                if registro is not None:
+                    novo_numero.pop(registro.numero_container, None)
+                    novas_contagens[registro.status] -= 1
+            else:
+                aplicar(novo_id, novo_numero, novas_contagens, container_id, *alteracao)
+        
+        divergencias = 0
+        if estado['carregado']:
+            divergencias = len(novo_id.keys() ^ por_id.keys())
+            divergencias += sum(
+                1 for container_id, registro in novo_id.items()
+                if container_id in por_id and por_id[container_id].status != registro.status
+            )
+        
+        por_id.clear()
+        por_id.update(novo_id)
+        por_numero.clear()
+        por_numero.update(novo_numero)
+        contagens.clear()
+        contagens.update(novas_contagens)
+        estado['carregado'] = True
+        estado['alteracoes'] = None
+        estado['arquivados'] = arquivados
+    return divergencias
+
+def obter(container_id):
+    with lock:
+        return por_id.get(container_id)
+
+def obter_por_numero(numero_container):
+    with lock:
+        return por_numero.get(numero_container)
+
+def contar():
+    with lock:
+        por_status = {status: contagens[status] for status in STATUS_CONTAINERS}
+        por_status['liberado_saida'] += estado['arquivados']
+    return dict(total=sum(por_status.values()), **por_status)
+
+def reconciliar_periodicamente(carregar, intervalo, parar):
+    while not parar.wait(intervalo):
+        try:
+            divergencias = carregar()
+        except Exception:
+            logger.exception('Falha ao reconciliar o índice do pátio')
+            continue
+        if divergencias:
+            metricas.incrementar('app_patio_divergencias_total', valor=divergencias)
+            logger.warning('Índice do pátio reconciliado com %d divergência(s)', divergencias)
+
+def iniciar_reconciliacao(carregar, intervalo):
+    parar = threading.Event()
+    threading.Thread(
+        target=reconciliar_periodicamente, args=(carregar, intervalo, parar),
+        name='patio-reconciliacao', daemon=True
+    ).start()
+    return parar
@@ -0,0 +1,19 @@
+import pytest
+
+import database
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'controle_notas.db'))
+    monkeypatch.setattr(database, 'ARQUIVO_DIRETORIO', str(tmp_path / 'arquivo'))
+    database.init_db()
+    yield database
+    database.fechar_db()
+
+@pytest.fixture
+def cliente(banco, tmp_path, monkeypatch):
+    # o app inicializa o banco ao ser importado: só o primeiro import lê o ambiente
+    monkeypatch.setenv('INICIAR_SERVICOS', '0')
+    monkeypatch.setenv('UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    from app import app
+    return app.test_client()
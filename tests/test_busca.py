@@ -0,0 +1,35 @@
+import pytest
+
+import database
+
+@pytest.fixture
+def banco_busca(banco):
+    banco.inserir_nota_entrada('4512', '2025-03-01', 'Soja em grão', 1000.0, 1.0, '12345678000190', '98765432000110')
+    banco.registrar_saida_cte('CTE-0001', [{'numero_nota': '4512', 'peso_saida': 10.0, 'valor_frete': 1.0}], '2025-03-02')
+    banco.registrar_saida_cte('CTE-0002', [{'numero_nota': '4512', 'peso_saida': 10.0, 'valor_frete': 1.0}], '2025-03-02')
+    banco.inserir_container('MSCU-123456-7', '40HC', 'MSC')
+    return banco
+
+@pytest.mark.parametrize('texto, tipo, titulo', [
+    ('CTE-0001', 'cte', 'CTE-0001'),
+    ('cte-0002', 'cte', 'CTE-0002'),
+    ('MSCU-123456-7', 'container', 'MSCU-123456-7'),
+    ('MSCU-1234', 'container', 'MSCU-123456-7'),
+    ('12.345.678/0001-90', 'nota', '4512'),
+    ('4512', 'nota', '4512'),
+])
+def test_busca_por_chave_pontuada(banco_busca, texto, tipo, titulo):
+    resultados = banco_busca.buscar(texto)
+    assert resultados and (resultados[0]['tipo'], resultados[0]['titulo']) == (tipo, titulo)
+
+def test_busca_pontuada_nao_mistura_registros(banco_busca):
+    assert [r['titulo'] for r in banco_busca.buscar('CTE-0001', tipos=['cte'])] == ['CTE-0001']
+    assert banco_busca.buscar('MSCU-999999-9') == []
+
+@pytest.mark.parametrize('texto, consulta', [
+    ('CTE-0001', '("CTE 0001"* OR "CTE0001"*)'),
+    ('soja  milho', '"soja"* AND "milho"*'),
+    ('--', ''),
+])
+def test_montar_consulta_busca(texto, consulta):
+    assert database.montar_consulta_busca(texto) == consulta
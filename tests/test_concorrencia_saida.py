@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+THREADS = 8
+TENTATIVAS = 25
+PESO_NOTA = 100.0
+PESO_SAIDA = 3.0
+
+def test_saidas_concorrentes_nao_estouram_saldo(banco):
+    banco.inserir_nota_entrada('1', '2025-03-01', 'Soja', PESO_NOTA, 1.0, '1', '2')
+    banco.inserir_nota_entrada('2', '2025-03-01', 'Milho', PESO_NOTA, 1.0, '1', '2')
+    
+    aceitas = []
+    recusadas = []
+    erros = []
+    lock = threading.Lock()
+    
+    def trabalhador(indice):
+        for tentativa in range(TENTATIVAS):
+            numero_cte = f'CTE{indice}-{tentativa}'
+            try:
+                banco.registrar_saida_cte(numero_cte, [
+                    {'numero_nota': '1', 'peso_saida': PESO_SAIDA, 'valor_frete': 1.0},
+                    {'numero_nota': '2', 'peso_saida': PESO_SAIDA, 'valor_frete': 1.0},
+                ], '2025-03-02')
+                resultado = aceitas
+            except ValueError:
+                resultado = recusadas
+            except Exception as e:
+                resultado = erros
+                numero_cte = f'{numero_cte}: {e}'
+            with lock:
+                resultado.append(numero_cte)
+        banco.fechar_db()
+    
+    workers = [threading.Thread(target=trabalhador, args=(i,)) for i in range(THREADS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    
+    assert not erros
+    assert len(aceitas) == PESO_NOTA // PESO_SAIDA
+    assert len(recusadas) == THREADS * TENTATIVAS - len(aceitas)
+    
+    conn = banco.get_db()
+    carregado = dict(conn.execute('SELECT numero_nota, SUM(peso_saida) FROM notas_saida GROUP BY numero_nota').fetchall())
+    assert carregado == {'1': pytest.approx(len(aceitas) * PESO_SAIDA), '2': pytest.approx(len(aceitas) * PESO_SAIDA)}
+    assert conn.execute('SELECT MIN(saldo) FROM notas_entrada').fetchone()[0] >= 0
+    assert not conn.execute('SELECT numero_cte FROM notas_saida GROUP BY numero_cte HAVING COUNT(*) != 2').fetchall()
+    assert not banco.verificar_saldos()
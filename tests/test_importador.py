@@ -0,0 +1,48 @@
+import sqlite3
+import sys
+
+import pytest
+
+import importador
+
+@pytest.fixture
+def diretorio(tmp_path):
+    entrada = tmp_path / 'entrada'
+    entrada.mkdir()
+    (entrada / 'nota.xml').write_bytes(b'<NFe/>')
+    return entrada
+
+def test_observar_sobrevive_a_lote_com_falha(banco, diretorio, monkeypatch, capsys):
+    lotes = []
+    
+    def importar_lote(lote, workers, estatisticas):
+        lotes.append([caminho for caminho, _, _ in lote])
+        if len(lotes) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        estatisticas['arquivos'] += len(lote)
+    
+    verificacoes = []
+    
+    def dormir(segundos):
+        verificacoes.append(segundos)
+        if len(verificacoes) == 2:
+            raise KeyboardInterrupt
+    
+    monkeypatch.setattr(importador, 'importar_lote', importar_lote)
+    monkeypatch.setattr(importador.time, 'sleep', dormir)
+    monkeypatch.setattr(sys, 'argv', ['importador.py', str(diretorio), '--observar', '--idade-minima', '0'])
+    importador.main()
+    
+    assert len(lotes) == 2 and lotes[0] == lotes[1]
+    saida = capsys.readouterr()
+    assert 'database is locked' in saida.err
+    assert 'Lotes com falha:    1' in saida.out
+
+def test_execucao_unica_propaga_falha(banco, diretorio, monkeypatch):
+    def importar_lote(lote, workers, estatisticas):
+        raise sqlite3.OperationalError('database is locked')
+    
+    monkeypatch.setattr(importador, 'importar_lote', importar_lote)
+    monkeypatch.setattr(sys, 'argv', ['importador.py', str(diretorio)])
+    with pytest.raises(sqlite3.OperationalError):
+        importador.main()
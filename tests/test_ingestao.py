@@ -0,0 +1,39 @@
+import sqlite3
+import threading
+
+import ingestao
+import metricas
+
+def test_worker_sobrevive_a_banco_travado(monkeypatch):
+    parar = threading.Event()
+    chamadas = []
+    
+    def processar_lote(worker):
+        chamadas.append(worker)
+        if len(chamadas) <= 2:
+            raise sqlite3.OperationalError('database is locked')
+        parar.set()
+        return 1
+    
+    monkeypatch.setattr(ingestao, 'processar_lote', processar_lote)
+    monkeypatch.setattr(ingestao, 'recuperar_jobs_travados', lambda *args: None)
+    monkeypatch.setattr(ingestao, 'ESPERA_ERRO', 0.001)
+    falhas_antes = metricas.obter_contadores('app_ingestao_falhas_total').get((), 0)
+    
+    assert ingestao.executar_worker('teste', parar) == 1
+    assert len(chamadas) == 3
+    assert metricas.obter_contadores('app_ingestao_falhas_total')[()] == falhas_antes + 2
+
+def test_readyz_sem_workers_de_ingestao(cliente, monkeypatch):
+    import app
+    
+    encerrada = threading.Thread(target=lambda: None)
+    encerrada.start()
+    encerrada.join()
+    monkeypatch.setitem(app.app.config, 'INGESTAO_WORKERS', 1)
+    monkeypatch.setitem(app.servidor, 'servicos', True)
+    monkeypatch.setattr(ingestao, 'threads_workers', [encerrada])
+    
+    resposta = cliente.get('/readyz')
+    assert resposta.status_code == 503
+    assert resposta.json['verificacoes']['ingestao'] is False
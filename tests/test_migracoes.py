@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+import database
+
+def criar_base_original(caminho, notas):
+    conn = sqlite3.connect(caminho)
+    conn.executescript('''
+        CREATE TABLE notas_entrada (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_nota TEXT NOT NULL,
+            data_emissao TEXT NOT NULL,
+            produto TEXT NOT NULL,
+            peso REAL NOT NULL,
+            valor REAL NOT NULL,
+            cnpj_emitente TEXT NOT NULL,
+            cnpj_destinatario TEXT NOT NULL,
+            data_carregamento TEXT NOT NULL
+        );
+        CREATE TABLE notas_saida (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_cte TEXT NOT NULL,
+            numero_nota TEXT NOT NULL,
+            peso_saida REAL NOT NULL,
+            valor_frete REAL NOT NULL,
+            data_saida TEXT NOT NULL,
+            FOREIGN KEY (numero_nota) REFERENCES notas_entrada (numero_nota)
+        );
+    ''')
+    conn.executemany('''
+        INSERT INTO notas_entrada (numero_nota, data_emissao, produto, peso, valor, cnpj_emitente, cnpj_destinatario, data_carregamento)
+        VALUES (?, '2024-01-01', 'Soja', ?, 1.0, '1', '2', '2024-01-02 08:00:00')
+    ''', notas)
+    conn.commit()
+    conn.close()
+
+@pytest.fixture
+def base_duplicada(tmp_path, monkeypatch):
+    caminho = str(tmp_path / 'controle_notas.db')
+    criar_base_original(caminho, [('10', 100.0), ('10', 100.0), ('11', 50.0), ('11', 60.0), ('12', 1.0)])
+    monkeypatch.setattr(database, 'DATABASE', caminho)
+    monkeypatch.setattr(database, 'ARQUIVO_DIRETORIO', str(tmp_path / 'arquivo'))
+    yield database
+    database.fechar_db()
+
+def test_duplicidade_bloqueia_migracao(base_duplicada):
+    with pytest.raises(RuntimeError, match='notas-duplicadas'):
+        database.init_db()
+    assert database.obter_versao_schema() == 0
+    assert [nota['id'] for nota in database.listar_notas_duplicadas()] == [1, 2, 3, 4]
+
+def test_mesclar_mantem_primeira_importacao(base_duplicada):
+    assert database.resolver_notas_duplicadas() == 2
+    database.init_db()
+    
+    assert database.obter_versao_schema() == database.MIGRACOES[-1][0]
+    notas = database.get_db().execute('SELECT numero_nota, peso, saldo FROM notas_entrada ORDER BY id').fetchall()
+    assert [tuple(nota) for nota in notas] == [('10', 100.0, 100.0), ('11', 50.0, 50.0), ('12', 1.0, 1.0)]
+
+def test_renomear_preserva_copias(base_duplicada):
+    assert database.resolver_notas_duplicadas(renomear=True) == 2
+    database.init_db()
+    
+    numeros = [row[0] for row in database.get_db().execute('SELECT numero_nota FROM notas_entrada ORDER BY id')]
+    assert numeros == ['10', '10-2', '11', '11-4', '12']
+    assert not database.listar_notas_duplicadas()
+
+def test_saldo_inicial_vem_do_peso(banco):
+    with banco.transacao() as cursor:
+        cursor.execute('''
+            INSERT INTO notas_entrada (numero_nota, data_emissao, produto, peso, valor, cnpj_emitente, cnpj_destinatario, data_carregamento)
+            VALUES ('900', '2024-01-01', 'Soja', 750.0, 1.0, '1', '2', '2024-01-02 08:00:00')
+        ''')
+    banco.inserir_nota_entrada('901', '2024-01-01', 'Milho', 300.0, 1.0, '1', '2')
+    banco.inserir_notas_entrada_lote([{
+        'numero_nota': '902', 'data_emissao': '2024-01-01', 'produto': 'Trigo', 'peso': 120.0, 'valor': 1.0,
+        'cnpj_emitente': '1', 'cnpj_destinatario': '2'
+    }])
+    
+    saldos = dict(banco.get_db().execute('SELECT numero_nota, saldo FROM notas_entrada').fetchall())
+    assert saldos == {'900': 750.0, '901': 300.0, '902': 120.0}
+    assert banco.listar_notas_arquivaveis('2099-01-01') == []
+    assert not banco.verificar_saldos()
@@ -0,0 +1,47 @@
+import base64
+import json
+
+import pytest
+
+import database
+
+def token(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip('=')
+
+def test_cursor_valido_volta_intacto():
+    cursor = database.codificar_cursor('2025-03-01', 42)
+    assert database.decodificar_cursor(cursor, database.TIPOS_CURSOR_DATA_ID) == ['2025-03-01', 42]
+    assert database.decodificar_cursor(token([None, 7]), database.TIPOS_CURSOR_DATA_ID) == [None, 7]
+
+@pytest.mark.parametrize('cursor', [
+    token([[1], 2]),
+    token(['2025-03-01', '42']),
+    token(['2025-03-01', 4.2]),
+    token(['2025-03-01', True]),
+    token({'data': '2025-03-01', 'id': 1}),
+    token(['2025-03-01']),
+    'nao-e-base64!',
+])
+def test_cursor_invalido(cursor):
+    with pytest.raises(ValueError, match='Cursor de paginação inválido'):
+        database.decodificar_cursor(cursor, database.TIPOS_CURSOR_DATA_ID)
+
+@pytest.mark.parametrize('caminho', ['/api/notas', '/api/containers'])
+@pytest.mark.parametrize('cursor', [token([[1], 2]), token(['2025-03-01', 'x']), 'lixo'])
+def test_api_recusa_cursor_invalido(cliente, caminho, cursor):
+    resposta = cliente.get(caminho, query_string={'cursor': cursor})
+    assert resposta.status_code == 400
+    assert resposta.json['message'] == 'Cursor de paginação inválido'
+
+@pytest.mark.parametrize('caminho', ['/acompanhamento', '/containers'])
+def test_pagina_redireciona_cursor_invalido(cliente, caminho):
+    resposta = cliente.get(caminho, query_string={'cursor': token([[1], 2])})
+    assert resposta.status_code == 302
+    assert resposta.headers['Location'] == caminho
+
+def test_api_pagina_com_cursor_emitido(cliente):
+    for numero in range(3):
+        database.inserir_container(f'ABCU{numero:07d}', '40HC', 'MSC')
+    primeira = cliente.get('/api/containers', query_string={'limite': 2})
+    segunda = cliente.get('/api/containers', query_string={'limite': 2, 'cursor': primeira.headers['X-Proximo-Cursor']})
+    assert len(primeira.json) == 2 and len(segunda.json) == 1
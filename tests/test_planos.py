@@ -0,0 +1,81 @@
+import pytest
+
+import database
+
+PLANOS_ESPERADOS = [
+    ('listar_notas_entrada', (), ['SCAN ne USING INDEX idx_notas_entrada_data_emissao']),
+    ('paginar_notas_entrada', (50,), ['SCAN ne USING INDEX idx_notas_entrada_data_emissao']),
+    ('listar_notas_entrada', (None, None, None, None, True, None, 50), ['SCAN ne USING INDEX idx_notas_entrada_abertas']),
+    ('listar_notas_entrada', (None, None, None, '00000000000007'), [
+        'INDEX idx_notas_entrada_cnpj_emitente',
+        'INDEX idx_notas_entrada_cnpj_destinatario',
+    ]),
+    ('obter_analytics', ('entrada', 'mes', 'produto', '2025-01-01', '2025-06-30'), ['SEARCH rollup_diario USING PRIMARY KEY (tipo=? AND dimensao=? AND dia>? AND dia<?)']),
+    ('obter_resumo_produtos', (), ['SCAN ni USING COVERING INDEX idx_notas_itens_produto', 'SEARCH ne USING INTEGER PRIMARY KEY (rowid=?)']),
+    ('obter_resumo_produtos', ('Milho',), ['SEARCH ni USING COVERING INDEX idx_notas_itens_produto (produto=?)']),
+    ('buscar', ('Soja',), ['SCAN busca_notas VIRTUAL TABLE INDEX', 'SEARCH ne USING INTEGER PRIMARY KEY (rowid=?)']),
+    ('obter_saldo_nota', ('1',), ['SEARCH notas_entrada USING INDEX idx_notas_entrada_numero_nota']),
+    ('paginar_containers', (50,), ['SCAN c USING INDEX idx_containers_data_registro']),
+    ('listar_containers', ('portaria', None, None, None, None, None, 50), ['SEARCH c USING INDEX idx_containers_status_data']),
+    ('listar_containers', (None, 'MSC', None, None, None, None, 50), ['SEARCH c USING INDEX idx_containers_armador_data']),
+    ('obter_historico_container', (1,), ['SEARCH registro_movimentacao USING INDEX idx_movimentacao_container_data']),
+    ('obter_container_por_numero', ('ABCU0000001',), ['SEARCH containers USING INDEX sqlite_autoindex_containers_1']),
+    ('calcular_estatisticas_containers', (), ['SCAN containers USING COVERING INDEX idx_containers_status_data']),
+]
+
+def popular_base(notas=2000, containers=500):
+    database.inserir_notas_entrada_lote([
+        {
+            'numero_nota': str(numero), 'data_emissao': f'2025-{numero % 12 + 1:02d}-{numero % 28 + 1:02d}',
+            'produto': 'Soja (+1 itens)', 'peso': 1000.0, 'valor': 1.0,
+            'produtos': [
+                {'nome': 'Soja', 'quantidade': 600.0, 'unidade': 'KG', 'peso_kg': 600.0},
+                {'nome': ('Milho', 'Trigo', 'Sorgo')[numero % 3], 'quantidade': 0.4, 'unidade': 'T', 'peso_kg': 400.0},
+            ],
+            'cnpj_emitente': f'{numero % 200:014d}', 'cnpj_destinatario': f'{numero % 50 + 900:014d}'
+        }
+        for numero in range(1, notas + 1)
+    ])
+    database.registrar_saida_cte('1', [
+        {'numero_nota': str(numero), 'peso_saida': 1000.0, 'valor_frete': 1.0}
+        for numero in range(1, notas + 1) if numero % 20
+    ], '2025-12-31')
+    for numero in range(containers):
+        database.inserir_container(f'ABCU{numero:07d}', '40HC', ('MSC', 'Maersk', 'CMA CGM', 'Hapag')[numero % 4])
+        if numero % 3:
+            database.registrar_desova(numero + 1)
+    database.get_db().execute('ANALYZE')
+
+def capturar_planos(nome_funcao, argumentos):
+    conn = database.get_db()
+    comandos = []
+    conn.set_trace_callback(comandos.append)
+    try:
+        getattr(database, nome_funcao)(*argumentos)
+    finally:
+        conn.set_trace_callback(None)
+    
+    planos = []
+    for comando in comandos:
+        if comando.lstrip().upper().startswith(('SELECT', 'WITH')):
+            linhas = conn.execute(f'EXPLAIN QUERY PLAN {comando}').fetchall()
+            planos.extend(linha['detail'] for linha in linhas)
+    return planos
+
+@pytest.fixture(scope='module')
+def base_planos(tmp_path_factory):
+    diretorio = tmp_path_factory.mktemp('planos')
+    original = database.DATABASE, database.ARQUIVO_DIRETORIO
+    database.DATABASE = str(diretorio / 'planos.db')
+    database.ARQUIVO_DIRETORIO = str(diretorio / 'arquivo')
+    database.init_db()
+    popular_base()
+    yield
+    database.fechar_db()
+    database.DATABASE, database.ARQUIVO_DIRETORIO = original
+
+@pytest.mark.parametrize('nome_funcao, argumentos, esperados', PLANOS_ESPERADOS)
+def test_consulta_usa_indice(base_planos, nome_funcao, argumentos, esperados):
+    planos = capturar_planos(nome_funcao, argumentos)
+    faltando = [e for e in esperados if not any(e in plano for plano in planos)]
+    assert not faltando, f'{nome_funcao}: planos {planos}'
@@ -0,0 +1,44 @@
+import pytest
+
+from benchmarks.gerador_nfe import PRODUTOS, gerar_corpus, gerar_nfe
+from xml_parser import TAMANHO_BLOCO_PARSE, extrair_dados_nfe, extrair_dados_nfe_dict
+
+@pytest.mark.parametrize('envelope', [True, False], ids=['nfeProc', 'NFe'])
+@pytest.mark.parametrize('encoding', ['utf-8', 'iso-8859-1'])
+@pytest.mark.parametrize('itens', [1, 5])
+def test_paridade_com_xmltodict(envelope, encoding, itens):
+    xml_bytes = gerar_nfe(123, itens=itens, envelope=envelope, encoding=encoding)
+    dados = extrair_dados_nfe(xml_bytes)
+    
+    assert dados == extrair_dados_nfe_dict(xml_bytes)
+    assert dados['numero_nota'] == '123'
+    assert dados['data_emissao'] == '2025-03-12'
+    assert len(dados['chave_acesso']) == 44
+    assert len(dados['produtos']) == itens
+    assert all(p['nome'] in PRODUTOS for p in dados['produtos'])
+    assert dados['peso'] == pytest.approx(sum(p['peso_kg'] for p in dados['produtos']))
+    assert dados['produto'].endswith(f' (+{itens - 1} itens)') if itens > 1 else dados['produto'] in PRODUTOS
+
+def test_paridade_corpus_e_notas_maiores_que_um_bloco():
+    corpus = gerar_corpus(200, itens_max=10)
+    corpus.append(gerar_nfe(900001, itens=500))
+    assert len(corpus[-1]) > 2 * TAMANHO_BLOCO_PARSE
+    
+    divergentes = [xml_bytes[:80] for xml_bytes in corpus if extrair_dados_nfe(xml_bytes) != extrair_dados_nfe_dict(xml_bytes)]
+    assert not divergentes
+
+@pytest.mark.parametrize('funcao', [extrair_dados_nfe, extrair_dados_nfe_dict])
+def test_documento_sem_nfe(funcao):
+    xml_bytes = b'<?xml version="1.0" encoding="utf-8"?><resEvento><chNFe>1</chNFe></resEvento>'
+    with pytest.raises(ValueError, match='Estrutura de NFe não encontrada'):
+        funcao(xml_bytes)
+
+@pytest.mark.parametrize('funcao', [extrair_dados_nfe, extrair_dados_nfe_dict])
+@pytest.mark.parametrize('xml_bytes', [
+    gerar_nfe(7, itens=3)[:600],
+    gerar_nfe(7).replace(b'</ide>', b'</emit>', 1),
+    b'',
+], ids=['truncado', 'tag-trocada', 'vazio'])
+def test_xml_malformado(funcao, xml_bytes):
+    with pytest.raises(ValueError, match='Erro ao processar XML'):
+        funcao(xml_bytes)
@@ -1,26 +1,239 @@
 import xmltodict
 from datetime import datetime
 import chardet
+import codecs
+import hashlib
+import io
+import re
+import threading
+from collections import Counter
+from xml.parsers import expat
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-def extrair_dados_nfe(xml_bytes):
+import metricas
+
+GRUPOS_INF_NFE = ('ide', 'emit', 'dest')
+CAMPOS_PROD = ('xProd', 'qCom', 'uCom')
+TAMANHO_BLOCO_PARSE = 64 * 1024
+TAMANHO_PROLOGO = 256
+TAMANHO_AMOSTRA_CHARDET = 32 * 1024
+ZIP_MAX_ARQUIVOS = int(os.environ.get('ZIP_MAX_ARQUIVOS', 5000))
+ZIP_MAX_DESCOMPACTADO = int(os.environ.get('ZIP_MAX_DESCOMPACTADO', 256 * 1024 * 1024))
+
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+REGEX_NAO_DIGITOS = re.compile(r'\D')
+REGEX_ENCODING_DECLARADO = re.compile(rb'\s*<\?xml[^>]*?\sencoding\s*=\s*["\']([A-Za-z][A-Za-z0-9._-]*)["\']')
+
+# fork copiaria locks presos por outras threads (ingestão, eventos, pátio) para dentro do filho
+CONTEXTO_POOL = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+pool_parse = {'executor': None, 'workers': 0}
+lock_pool = threading.Lock()
+
+def detectar_bom(xml_bytes):
+    for bom, encoding in BOMS:
+        if xml_bytes.startswith(bom):
+            return encoding
+    return None
+
+def detectar_encoding_declarado(xml_bytes):
+    match = REGEX_ENCODING_DECLARADO.match(xml_bytes[:TAMANHO_PROLOGO])
+    if not match:
+        return None
+    
     try:
-        if isinstance(xml_bytes, str):
-            xml_content = xml_bytes
-        else:
-            detected = chardet.detect(xml_bytes)
-            encoding = detected['encoding'] or 'utf-8'
-            
+        return codecs.lookup(match.group(1).decode('ascii')).name
+    except LookupError:
+        return None
+
+def registrar_decodificacao(caminho, quantidade=1):
+    metricas.incrementar('app_xml_decodificacao_total', (('caminho', caminho),), quantidade)
+
+def obter_estatisticas_decodificacao():
+    return {dict(rotulos)['caminho']: valor for rotulos, valor in metricas.obter_contadores('app_xml_decodificacao_total').items()}
+
+def detectar_decodificacao(xml_bytes):
+    if isinstance(xml_bytes, str):
+        return xml_bytes, 'texto'
+    
+    encoding = detectar_bom(xml_bytes)
+    if encoding:
+        return xml_bytes.decode(encoding), 'bom'
+    
+    declarado = detectar_encoding_declarado(xml_bytes)
+    if declarado and declarado.startswith(('utf-16', 'utf-32')):
+        try:
+            return xml_bytes.decode(declarado), 'declarado'
+        except UnicodeDecodeError:
+            pass
+    
+    try:
+        return xml_bytes.decode('utf-8'), 'declarado' if declarado == 'utf-8' else 'utf8'
+    except UnicodeDecodeError:
+        pass
+    
+    if declarado and declarado != 'utf-8':
+        try:
+            return xml_bytes.decode(declarado), 'declarado'
+        except UnicodeDecodeError:
+            pass
+    
+    detected = chardet.detect(xml_bytes[:TAMANHO_AMOSTRA_CHARDET])
+    encoding = detected['encoding'] or 'utf-8'
+    
+    try:
+        return xml_bytes.decode(encoding), 'chardet'
+    except (UnicodeDecodeError, LookupError):
+        for enc in ['utf-8', 'iso-8859-1', 'latin-1', 'cp1252']:
             try:
-                xml_content = xml_bytes.decode(encoding)
-            except (UnicodeDecodeError, AttributeError):
-                for enc in ['utf-8', 'iso-8859-1', 'latin-1', 'cp1252']:
-                    try:
-                        xml_content = xml_bytes.decode(enc)
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                else:
-                    raise ValueError("Não foi possível decodificar o arquivo XML")
+                return xml_bytes.decode(enc), 'fallback'
+            except UnicodeDecodeError:
+                continue
+        raise ValueError("Não foi possível decodificar o arquivo XML")
+
+def decodificar_xml(xml_bytes):
+    conteudo, caminho = detectar_decodificacao(xml_bytes)
+    registrar_decodificacao(caminho)
+    return conteudo
+
+def calcular_hash_xml(xml_bytes):
+    if isinstance(xml_bytes, str):
+        xml_bytes = xml_bytes.encode('utf-8')
+    return hashlib.sha256(xml_bytes).hexdigest()
+
+def normalizar_chave_acesso(id_inf_nfe):
+    chave = REGEX_NAO_DIGITOS.sub('', id_inf_nfe or '')
+    return chave if len(chave) == 44 else None
+
+def montar_dados_nfe(ide, emit, dest, det, total, id_inf_nfe=None):
+    numero_nota = ide.get('nNF', '')
+    
+    data_emissao_raw = ide.get('dhEmi', ide.get('dEmi', ''))
+    if 'T' in data_emissao_raw:
+        data_emissao = datetime.fromisoformat(data_emissao_raw.replace('Z', '+00:00')).strftime('%Y-%m-%d')
+    else:
+        data_emissao = data_emissao_raw[:10] if len(data_emissao_raw) >= 10 else data_emissao_raw
+    
+    cnpj_emitente = emit.get('CNPJ', emit.get('CPF', ''))
+    cnpj_destinatario = dest.get('CNPJ', dest.get('CPF', ''))
+    
+    valor_total = float(total.get('vNF', 0))
+    
+    produtos = []
+    for item in det:
+        prod = item.get('prod', {})
+        nome_produto = prod.get('xProd', 'Produto não especificado')
+        quantidade = float(prod.get('qCom', 0))
+        unidade = prod.get('uCom', 'UN')
+        
+        peso = quantidade
+        if unidade.upper() in ['KG', 'KILO', 'QUILOGRAMA']:
+            peso = quantidade
+        elif unidade.upper() in ['G', 'GRAMA', 'GRAMAS']:
+            peso = quantidade / 1000
+        elif unidade.upper() in ['T', 'TON', 'TONELADA']:
+            peso = quantidade * 1000
+        
+        produtos.append({
+            'nome': nome_produto,
+            'quantidade': quantidade,
+            'unidade': unidade,
+            'peso_kg': peso
+        })
+    
+    peso_total = sum(p['peso_kg'] for p in produtos)
+    
+    produto_principal = produtos[0]['nome'] if produtos else 'Produto não especificado'
+    if len(produtos) > 1:
+        produto_principal += f' (+{len(produtos)-1} itens)'
+    
+    return {
+        'numero_nota': str(numero_nota),
+        'chave_acesso': normalizar_chave_acesso(id_inf_nfe),
+        'data_emissao': data_emissao,
+        'produto': produto_principal,
+        'peso': peso_total,
+        'valor': valor_total,
+        'cnpj_emitente': cnpj_emitente,
+        'cnpj_destinatario': cnpj_destinatario,
+        'produtos': produtos
+    }
+
+def ler_nfe(xml_content):
+    caminho = []
+    texto = []
+    estado = {'base': None, 'concluido': False, 'id': None}
+    grupos = {nome: {} for nome in GRUPOS_INF_NFE}
+    total = {}
+    det = []
+    
+    def inicio_elemento(tag, atributos):
+        caminho.append(tag)
+        texto.clear()
+        base = estado['base']
+        
+        if base is None:
+            if tag == 'NFe' and caminho in (['NFe'], ['nfeProc', 'NFe']):
+                estado['base'] = len(caminho)
+        elif len(caminho) == base + 1 and tag == 'infNFe':
+            estado['id'] = atributos.get('Id')
+        elif len(caminho) == base + 2 and caminho[base:] == ['infNFe', 'det']:
+            det.append({})
+        elif len(caminho) == base + 3 and caminho[base:] == ['infNFe', 'det', 'prod']:
+            det[-1]['prod'] = {}
+    
+    def fim_elemento(tag):
+        base = estado['base']
+        
+        if base is not None:
+            profundidade = len(caminho) - base
+            if profundidade == 3 and caminho[base] == 'infNFe' and caminho[base + 1] in GRUPOS_INF_NFE:
+                grupos[caminho[base + 1]][tag] = ''.join(texto).strip() or None
+            elif profundidade == 4 and tag in CAMPOS_PROD and caminho[base:base + 3] == ['infNFe', 'det', 'prod']:
+                det[-1]['prod'][tag] = ''.join(texto).strip() or None
+            elif profundidade == 4 and tag == 'vNF' and caminho[base:] == ['infNFe', 'total', 'ICMSTot', 'vNF']:
+                total['vNF'] = ''.join(texto).strip() or None
+            elif profundidade == 1 and tag == 'infNFe':
+                estado['concluido'] = True
+        
+        caminho.pop()
+        texto.clear()
+    
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = inicio_elemento
+    parser.EndElementHandler = fim_elemento
+    parser.CharacterDataHandler = texto.append
+    
+    for inicio in range(0, len(xml_content), TAMANHO_BLOCO_PARSE):
+        parser.Parse(xml_content[inicio:inicio + TAMANHO_BLOCO_PARSE], False)
+        if estado['concluido']:
+            break
+    else:
+        parser.Parse('', True)
+    
+    if estado['base'] is None:
+        raise ValueError("Estrutura de NFe não encontrada no XML")
+    
+    return montar_dados_nfe(grupos['ide'], grupos['emit'], grupos['dest'], det, total, estado['id'])
+
+def extrair_dados_nfe(xml_bytes):
+    try:
+        return ler_nfe(decodificar_xml(xml_bytes))
+    except Exception as e:
+        raise ValueError(f"Erro ao processar XML: {str(e)}")
+
+def extrair_dados_nfe_dict(xml_bytes):
+    try:
+        xml_content = decodificar_xml(xml_bytes)
         
         doc = xmltodict.parse(xml_content)
         
@@ -40,57 +253,96 @@ def extrair_dados_nfe(xml_bytes):
         if not isinstance(det, list):
             det = [det]
         
-        numero_nota = ide.get('nNF', '')
-        
-        data_emissao_raw = ide.get('dhEmi', ide.get('dEmi', ''))
-        if 'T' in data_emissao_raw:
-            data_emissao = datetime.fromisoformat(data_emissao_raw.replace('Z', '+00:00')).strftime('%Y-%m-%d')
-        else:
-            data_emissao = data_emissao_raw[:10] if len(data_emissao_raw) >= 10 else data_emissao_raw
-        
-        cnpj_emitente = emit.get('CNPJ', emit.get('CPF', ''))
-        cnpj_destinatario = dest.get('CNPJ', dest.get('CPF', ''))
-        
-        valor_total = float(total.get('vNF', 0))
-        
-        produtos = []
-        for item in det:
-            prod = item.get('prod', {})
-            nome_produto = prod.get('xProd', 'Produto não especificado')
-            quantidade = float(prod.get('qCom', 0))
-            unidade = prod.get('uCom', 'UN')
-            
-            peso = quantidade
-            if unidade.upper() in ['KG', 'KILO', 'QUILOGRAMA']:
-                peso = quantidade
-            elif unidade.upper() in ['G', 'GRAMA', 'GRAMAS']:
-                peso = quantidade / 1000
-            elif unidade.upper() in ['T', 'TON', 'TONELADA']:
-                peso = quantidade * 1000
-            
-            produtos.append({
-                'nome': nome_produto,
-                'quantidade': quantidade,
-                'unidade': unidade,
-                'peso_kg': peso
-            })
-        
-        peso_total = sum(p['peso_kg'] for p in produtos)
-        
-        produto_principal = produtos[0]['nome'] if produtos else 'Produto não especificado'
-        if len(produtos) > 1:
-            produto_principal += f' (+{len(produtos)-1} itens)'
-        
-        return {
-            'numero_nota': str(numero_nota),
-            'data_emissao': data_emissao,
-            'produto': produto_principal,
-            'peso': peso_total,
-            'valor': valor_total,
-            'cnpj_emitente': cnpj_emitente,
-            'cnpj_destinatario': cnpj_destinatario,
-            'produtos': produtos
-        }
+        return montar_dados_nfe(ide, emit, dest, det, total, inf_nfe.get('@Id'))
     
     except Exception as e:
         raise ValueError(f"Erro ao processar XML: {str(e)}")
+
+def listar_xmls_zip(zip_bytes, tamanho_maximo=None, max_arquivos=ZIP_MAX_ARQUIVOS, max_descompactado=ZIP_MAX_DESCOMPACTADO):
+    arquivos = []
+    lidos = 0
+    descompactado = 0
+    
+    try:
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not info.filename.lower().endswith('.xml'):
+                    continue
+                
+                if tamanho_maximo and info.file_size > tamanho_maximo:
+                    arquivos.append((info.filename, None, f"Arquivo excede o tamanho máximo de {tamanho_maximo} bytes"))
+                    continue
+                
+                # file_size também limita a leitura do zipfile: um cabeçalho falso não faz ler além dele
+                if lidos >= max_arquivos:
+                    arquivos.append((info.filename, None, "Limite de XML por envio atingido; restante do ZIP ignorado"))
+                    break
+                if descompactado + info.file_size > max_descompactado:
+                    arquivos.append((info.filename, None, "Limite de tamanho descompactado por envio atingido; restante do ZIP ignorado"))
+                    break
+                
+                lidos += 1
+                descompactado += info.file_size
+                arquivos.append((info.filename, zf.read(info), None))
+    
+    except zipfile.BadZipFile:
+        raise ValueError("Arquivo ZIP inválido ou corrompido")
+    
+    return arquivos
+
+def extrair_dados_nfe_seguro(xml_bytes):
+    try:
+        return extrair_dados_nfe(xml_bytes), None
+    except Exception as e:
+        return None, str(e)
+
+def extrair_dados_nfe_processo(xml_bytes):
+    # executado no pool: o caminho da decodificação volta com o resultado e é contado no processo pai
+    caminho = None
+    try:
+        xml_content, caminho = detectar_decodificacao(xml_bytes)
+        return ler_nfe(xml_content), None, caminho
+    except Exception as e:
+        return None, f"Erro ao processar XML: {str(e)}", caminho
+
+def iniciar_pool(max_workers=None):
+    max_workers = max_workers or os.cpu_count() or 1
+    with lock_pool:
+        if pool_parse['executor'] is not None and pool_parse['workers'] == max_workers:
+            return pool_parse['executor']
+        if pool_parse['executor'] is not None:
+            pool_parse['executor'].shutdown()
+        pool_parse['executor'] = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context(CONTEXTO_POOL))
+        pool_parse['workers'] = max_workers
+        return pool_parse['executor']
+
+def encerrar_pool():
+    with lock_pool:
+        executor = pool_parse['executor']
+        pool_parse['executor'] = None
+        pool_parse['workers'] = 0
+    if executor is not None:
+        executor.shutdown()
+
+def extrair_dados_nfe_lote(lista_xml, max_workers=None, chunksize=16):
+    lista_xml = list(lista_xml)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    
+    if max_workers == 1 or len(lista_xml) <= 1:
+        return [extrair_dados_nfe_seguro(xml_bytes) for xml_bytes in lista_xml]
+    
+    executor = iniciar_pool(max_workers)
+    chunksize = max(1, min(chunksize, len(lista_xml) // max_workers or 1))
+    try:
+        resultados = list(executor.map(extrair_dados_nfe_processo, lista_xml, chunksize=chunksize))
+    except BrokenProcessPool:
+        # um processo do pool morreu: o próximo lote cria um pool novo
+        with lock_pool:
+            if pool_parse['executor'] is executor:
+                pool_parse['executor'] = None
+        raise
+    
+    for caminho, quantidade in Counter(caminho for _, _, caminho in resultados if caminho).items():
+        registrar_decodificacao(caminho, quantidade)
+    return [(dados, erro) for dados, erro, _ in resultados]